@@ -2,16 +2,85 @@
 #
 # SPDX-License-Identifier: MIT
 
+import bisect
+import heapq
 from copy import copy, deepcopy
+from itertools import groupby, takewhile
+from operator import itemgetter
 
 import numpy as np
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from shapely import geometry
 
 from cvat.apps.engine.models import ShapeType
 from cvat.apps.engine.serializers import LabeledDataSerializer
+from datumaro.util.iou_tools import bbox_iou_pairs
 
 
+class IntervalIndex:
+    """
+    A static centered interval tree over closed [start, stop] intervals.
+    Finds the intervals, which intersect a range, in O(log n + k).
+    """
+
+    def __init__(self, intervals):
+        # stop can be infinite
+        self._root = self._build(list(enumerate(intervals)))
+
+    @classmethod
+    def _build(cls, intervals):
+        if not intervals:
+            return None
+
+        starts = sorted(start for _, (start, _) in intervals)
+        center = starts[len(starts) // 2]
+        left = []
+        right = []
+        middle = []
+        for idx, (start, stop) in intervals:
+            if stop < center:
+                left.append((idx, (start, stop)))
+            elif center < start:
+                right.append((idx, (start, stop)))
+            else:
+                middle.append((start, stop, idx))
+
+        return (center,
+            sorted((start, idx) for start, _, idx in middle),
+            sorted(((stop, idx) for _, stop, idx in middle), reverse=True),
+            cls._build(left), cls._build(right))
+
+    def find(self, start, stop):
+        """
+        Returns sorted indices of intervals, which intersect [start, stop]
+        """
+
+        found = []
+        nodes = [self._root]
+        while nodes:
+            node = nodes.pop()
+            if node is None:
+                continue
+
+            center, by_start, by_stop, left, right = node
+            if stop < center:
+                # all the intervals here end after the range start
+                found.extend(idx for _, idx in takewhile(
+                    lambda item: item[0] <= stop, by_start))
+                nodes.append(left)
+            elif center < start:
+                found.extend(idx for _, idx in takewhile(
+                    lambda item: start <= item[0], by_stop))
+                nodes.append(right)
+            else:
+                found.extend(idx for _, idx in by_start)
+                nodes.append(left)
+                nodes.append(right)
+
+        return sorted(found)
+
 class AnnotationIR:
     def __init__(self, data=None):
         self.reset()
@@ -91,18 +160,23 @@ class AnnotationIR:
 
             return shapes[drop_count:]
 
-        track = deepcopy(track_)
+        # Keyframes are changed during interpolation, interpolated shapes
+        # are computed for the copy, because they are changed below
+        track = cls._copy_track(track_, copy_attributes=True)
+        track.pop('interpolated_shapes', None)
         segment_shapes = filter_track_shapes(track['shapes'])
 
         if len(segment_shapes) < len(track['shapes']):
+            # The last shape is interpolated up to the end frame exclusively
             interpolated_shapes = TrackManager.get_interpolated_shapes(
-                track, start, stop)
+                track, start, stop + 1)
             scoped_shapes = filter_track_shapes(interpolated_shapes)
 
             if scoped_shapes:
                 if not scoped_shapes[0]['keyframe']:
                     segment_shapes.insert(0, scoped_shapes[0])
-                if not scoped_shapes[-1]['keyframe']:
+                if len(scoped_shapes) > 1 and \
+                        not scoped_shapes[-1]['keyframe']:
                     segment_shapes.append(scoped_shapes[-1])
 
             # Should delete 'interpolation_shapes' and 'keyframe' keys because
@@ -115,29 +189,552 @@ class AnnotationIR:
         track['frame'] = track['shapes'][0]['frame']
         return track
 
+    def _get_frame_index(self):
+        # The index is kept while the frames of the objects are the same.
+        # Comparing the frames is much cheaper than sorting them, and it
+        # also finds objects, which are replaced or changed in place.
+        frames = {
+            'tags': list(map(itemgetter('frame'), self.tags)),
+            'shapes': list(map(itemgetter('frame'), self.shapes)),
+            'tracks': list(map(self._get_track_frame_range, self.tracks)),
+        }
+        if self._frame_index is not None:
+            indexed_frames, index = self._frame_index
+            if frames == indexed_frames:
+                return index
+
+        index = {}
+        for field in ['tags', 'shapes']:
+            field_frames = [int(frame) for frame in frames[field]]
+            order = sorted(range(len(field_frames)),
+                key=field_frames.__getitem__)
+            index[field] = ([field_frames[idx] for idx in order], order)
+        index['tracks'] = IntervalIndex(frames['tracks'])
+
+        self._frame_index = (frames, index)
+        return index
+
+    @staticmethod
+    def _get_track_frame_range(track):
+        shapes = track['shapes']
+        stop = shapes[-1]['frame'] if shapes[-1]['outside'] else float('inf')
+        return shapes[0]['frame'], stop
+
+    @staticmethod
+    def _copy_track(track, copy_attributes=False):
+        track = copy(track)
+        track['shapes'] = [copy(s) for s in track['shapes']]
+        if copy_attributes:
+            for shape in track['shapes']:
+                shape['attributes'] = list(shape['attributes'])
+        track['frame'] = track['shapes'][0]['frame']
+        return track
+
+    def _get_track_part(self, track, start, stop):
+        shapes = track['shapes']
+        if start <= shapes[0]['frame'] and shapes[-1]['frame'] <= stop and \
+                not shapes[0]['outside']:
+            return self._copy_track(track) # nothing to cut or interpolate
+        return self._slice_track(track, start, stop)
+
     def slice(self, start, stop):
-        #makes a data copy from specified frame interval
+        """
+        Returns objects from the specified frame interval. Objects are
+        found with a frame index and copied shallowly, so their nested
+        values are shared with this data and must not be changed in place.
+        """
+
+        index = self._get_frame_index()
         splitted_data = AnnotationIR()
-        splitted_data.tags = [deepcopy(t)
-            for t in self.tags if self._is_shape_inside(t, start, stop)]
-        splitted_data.shapes = [deepcopy(s)
-            for s in self.shapes if self._is_shape_inside(s, start, stop)]
-        splitted_data.tracks = [self._slice_track(t, start, stop)
-            for t in self.tracks if self._is_track_inside(t, start, stop)]
+        for field in ['tags', 'shapes']:
+            frames, order = index[field]
+            selected = sorted(order[bisect.bisect_left(frames, start):
+                bisect.bisect_right(frames, stop)])
+            splitted_data[field].extend(copy(self[field][idx])
+                for idx in selected)
+
+        for idx in index['tracks'].find(start, stop):
+            track = self.tracks[idx]
+            if self._is_track_inside(track, start, stop):
+                splitted_data.tracks.append(
+                    self._get_track_part(track, start, stop))
 
         return splitted_data
 
+    def split(self, segments):
+        """
+        Splits the data by segments in one pass over the objects. Segments
+        are (start, stop) frame intervals, both their starts and stops are
+        expected to be ascending (they can overlap, like segments of jobs).
+        Returns an AnnotationIR per segment. Objects are copied shallowly,
+        so that saving them doesn't affect this data and other segments.
+        """
+
+        order = sorted(range(len(segments)), key=lambda i: segments[i])
+        starts = [segments[i][0] for i in order]
+        stops = [segments[i][1] for i in order]
+        parts = [AnnotationIR() for _ in segments]
+
+        def find_segments(start, stop):
+            # Finds sorted segments, which have intersection with [start, stop]
+            idx = bisect.bisect_right(starts, stop) - 1
+            while 0 <= idx and start <= stops[idx]:
+                yield idx
+                idx -= 1
+
+        for field in ['tags', 'shapes']:
+            for obj in self[field]:
+                frame = int(obj['frame'])
+                for idx in find_segments(frame, frame):
+                    parts[order[idx]][field].append(copy(obj))
+
+        for track in self.tracks:
+            track_start, track_stop = self._get_track_frame_range(track)
+            for idx in find_segments(track_start, track_stop):
+                start, stop = starts[idx], stops[idx]
+                if self._is_track_inside(track, start, stop):
+                    parts[order[idx]].tracks.append(
+                        self._get_track_part(track, start, stop))
+
+        return parts
+
     def reset(self):
         self.version = 0
         self.tags = []
         self.shapes = []
         self.tracks = []
+        self._frame_index = None
+
+class ShapeColumns:
+    """
+    Keeps shapes column-wise: a NumPy array per scalar field and a flat
+    float32 buffer of points with offsets. It takes several times less memory
+    than a list of dicts. Shapes are converted to dicts only on access.
+    """
+
+    TYPES = [t.value for t in ShapeType]
+    _TYPE_CODES = { t: code for code, t in enumerate(TYPES) }
+    _NONE = -1 # the value of None for id and group
+
+    def __init__(self, size=0, tracked=False):
+        self.tracked = tracked
+        self.frame = np.zeros(size, dtype=np.int32)
+        self.type = np.zeros(size, dtype=np.uint8)
+        self.z_order = np.zeros(size, dtype=np.int32)
+        self.occluded = np.zeros(size, dtype=bool)
+        self.id = np.full(size, self._NONE, dtype=np.int64)
+        if tracked:
+            self.outside = np.zeros(size, dtype=bool)
+        else:
+            self.label_id = np.zeros(size, dtype=np.int32)
+            self.group = np.full(size, self._NONE, dtype=np.int64)
+        self.attributes = np.empty(size, dtype=object)
+        self.points = np.empty(0, dtype=np.float32)
+        self.point_offsets = np.zeros(size + 1, dtype=np.int64)
+
+    def _columns(self):
+        columns = ['frame', 'type', 'z_order', 'occluded', 'id', 'attributes']
+        if self.tracked:
+            columns.append('outside')
+        else:
+            columns.extend(['label_id', 'group'])
+        return columns
+
+    @classmethod
+    def from_dicts(cls, shapes, tracked=False):
+        shapes = list(shapes)
+        columns = cls(len(shapes), tracked=tracked)
+        points = []
+        for idx, shape in enumerate(shapes):
+            columns.frame[idx] = shape['frame']
+            columns.type[idx] = cls._TYPE_CODES[
+                getattr(shape['type'], 'value', shape['type'])]
+            columns.z_order[idx] = shape.get('z_order', 0)
+            columns.occluded[idx] = shape.get('occluded', False)
+            if shape.get('id') is not None:
+                columns.id[idx] = shape['id']
+            if tracked:
+                columns.outside[idx] = shape['outside']
+            else:
+                columns.label_id[idx] = shape['label_id']
+                if shape.get('group') is not None:
+                    columns.group[idx] = shape['group']
+            columns.attributes[idx] = shape.get('attributes', [])
+            points.append(shape['points'])
+            columns.point_offsets[idx + 1] = \
+                columns.point_offsets[idx] + len(shape['points'])
+        if points:
+            columns.points = np.fromiter(
+                (p for shape_points in points for p in shape_points),
+                dtype=np.float32, count=columns.point_offsets[-1])
+        return columns
+
+    @classmethod
+    def concat(cls, parts, tracked=False):
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls(tracked=tracked)
+        if len(parts) == 1:
+            return parts[0]
+
+        columns = cls(tracked=tracked)
+        for name in columns._columns():
+            setattr(columns, name,
+                np.concatenate([getattr(p, name) for p in parts]))
+        columns.points = np.concatenate([p.points for p in parts])
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for p in parts:
+            offsets.append(p.point_offsets[1:] + base)
+            base += p.point_offsets[-1]
+        columns.point_offsets = np.concatenate(offsets)
+        return columns
+
+    def take(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = ShapeColumns(tracked=self.tracked)
+        for name in self._columns():
+            setattr(columns, name, getattr(self, name)[indices])
+
+        starts = self.point_offsets[indices]
+        lengths = self.point_offsets[indices + 1] - starts
+        columns.point_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=columns.point_offsets[1:])
+        # Position of each point in the source buffer
+        positions = np.repeat(starts - columns.point_offsets[:-1], lengths) + \
+            np.arange(columns.point_offsets[-1], dtype=np.int64)
+        columns.points = self.points[positions]
+        return columns
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __getitem__(self, idx):
+        shape = {
+            'type': self.TYPES[self.type[idx]],
+            'occluded': bool(self.occluded[idx]),
+            'z_order': int(self.z_order[idx]),
+            'points': self.points[
+                self.point_offsets[idx] : self.point_offsets[idx + 1]].tolist(),
+            'id': int(self.id[idx]) if self.id[idx] != self._NONE else None,
+            'frame': int(self.frame[idx]),
+            'attributes': deepcopy(self.attributes[idx]),
+        }
+        if self.tracked:
+            shape['outside'] = bool(self.outside[idx])
+        else:
+            shape['label_id'] = int(self.label_id[idx])
+            shape['group'] = int(self.group[idx]) \
+                if self.group[idx] != self._NONE else None
+        return shape
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+class TrackColumns:
+    """
+    Keeps tracks as a list of track headers and ShapeColumns with shapes
+    of all tracks. Shapes of each track are stored contiguously.
+    """
+
+    def __init__(self):
+        self.headers = []
+        self.shapes = ShapeColumns(tracked=True)
+        self.shape_offsets = np.zeros(1, dtype=np.int64)
+
+    @classmethod
+    def from_dicts(cls, tracks):
+        columns = cls()
+        shapes = []
+        offsets = [0]
+        for track in tracks:
+            columns.headers.append({k: v for k, v in track.items()
+                if k not in {'shapes', 'interpolated_shapes'}})
+            shapes.extend(track['shapes'])
+            offsets.append(len(shapes))
+        columns.shapes = ShapeColumns.from_dicts(shapes, tracked=True)
+        columns.shape_offsets = np.array(offsets, dtype=np.int64)
+        return columns
+
+    @classmethod
+    def concat(cls, parts):
+        columns = cls()
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for p in parts:
+            columns.headers.extend(p.headers)
+            offsets.append(p.shape_offsets[1:] + base)
+            base += p.shape_offsets[-1]
+        columns.shapes = ShapeColumns.concat([p.shapes for p in parts],
+            tracked=True)
+        columns.shape_offsets = np.concatenate(offsets)
+        return columns
+
+    def take(self, indices):
+        columns = TrackColumns()
+        columns.headers = [self.headers[idx] for idx in indices]
+        shape_indices = [np.arange(self.shape_offsets[idx],
+            self.shape_offsets[idx + 1]) for idx in indices]
+        columns.shapes = self.shapes.take(np.concatenate(shape_indices)
+            if shape_indices else [])
+        lengths = [len(idx) for idx in shape_indices]
+        columns.shape_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=columns.shape_offsets[1:])
+        return columns
+
+    def replace(self, items):
+        """
+        Builds new columns from a list of items, where an item is either
+        an index of an existing track or a track dict
+        """
+
+        parts = []
+        kept = []
+        for item in items:
+            if isinstance(item, dict):
+                if kept:
+                    parts.append(self.take(kept))
+                    kept = []
+                parts.append(TrackColumns.from_dicts([item]))
+            else:
+                kept.append(item)
+        if kept:
+            parts.append(self.take(kept))
+        return TrackColumns.concat(parts)
+
+    def get_shape_frames(self, idx):
+        begin, end = self.shape_offsets[idx], self.shape_offsets[idx + 1]
+        return self.shapes.frame[begin:end], self.shapes.outside[begin:end]
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __getitem__(self, idx):
+        track = deepcopy(self.headers[idx])
+        track['shapes'] = [self.shapes[i] for i in
+            range(self.shape_offsets[idx], self.shape_offsets[idx + 1])]
+        return track
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+class ColumnarAnnotationIR:
+    """
+    An alternative to AnnotationIR for big tasks. Shapes and tracked shapes
+    are stored in NumPy columns, see ShapeColumns. Tags are stored as is.
+    The shapes and tracks fields can be iterated as lists of dicts,
+    but points are stored with float32 precision.
+    """
+
+    def __init__(self, data=None):
+        self.reset()
+        if data:
+            if isinstance(data, ColumnarAnnotationIR):
+                self.version = data.version
+                self.tags = list(data.tags)
+                self.shapes = data.shapes
+                self.tracks = data.tracks
+            else:
+                self.version = data['version']
+                self.tags = list(data['tags'])
+                self.shapes = ShapeColumns.from_dicts(data['shapes'])
+                self.tracks = TrackColumns.from_dicts(data['tracks'])
+
+    def reset(self):
+        self.version = 0
+        self.tags = []
+        self.shapes = ShapeColumns()
+        self.tracks = TrackColumns()
+
+    # Merges only add parts of shapes and tracks, existing columns are not
+    # copied. Parts are concatenated when the columns are accessed.
+    # A part of shapes is a (columns, max frame) tuple. A part of tracks is
+    # a (columns, max last frame, has open tracks) tuple or a list of dicts
+    # with tracks which can be changed by the next merge.
+
+    @property
+    def shapes(self):
+        if len(self._shape_parts) != 1:
+            self.shapes = ShapeColumns.concat(
+                [columns for columns, _ in self._shape_parts])
+        return self._shape_parts[0][0]
+
+    @shapes.setter
+    def shapes(self, columns):
+        self._shape_parts = []
+        self._add_shapes(columns, force=True)
+
+    def _add_shapes(self, columns, force=False):
+        if len(columns) or force:
+            self._shape_parts.append((columns,
+                int(columns.frame.max()) if len(columns) else -1))
+
+    @property
+    def tracks(self):
+        if len(self._track_parts) != 1 or \
+                isinstance(self._track_parts[0], list):
+            self.tracks = TrackColumns.concat([
+                TrackColumns.from_dicts(part) if isinstance(part, list)
+                else part[0] for part in self._track_parts])
+        return self._track_parts[0][0]
+
+    @tracks.setter
+    def tracks(self, columns):
+        self._track_parts = []
+        self._add_tracks(self._track_parts, columns, force=True)
+
+    @staticmethod
+    def _add_tracks(parts, columns, force=False):
+        if len(columns):
+            last_shapes = columns.shape_offsets[1:] - 1
+            parts.append((columns,
+                int(columns.shapes.frame[last_shapes].max()),
+                not columns.shapes.outside[last_shapes].all()))
+        elif force:
+            parts.append((columns, -1, False))
+
+    @property
+    def data(self):
+        return {
+            'version': self.version,
+            'tags': self.tags,
+            'shapes': list(self.shapes),
+            'tracks': list(self.tracks),
+        }
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def to_ir(self):
+        return AnnotationIR(self.data)
+
+    def _is_track_inside(self, idx, start, stop):
+        frames, outside = self.tracks.get_shape_frames(idx)
+        return AnnotationIR._is_track_inside({ 'shapes': [
+                { 'frame': f, 'outside': o } for f, o in zip(frames, outside)
+            ] }, start, stop)
+
+    def slice(self, start, stop):
+        # makes a data copy from the specified frame interval
+        splitted_data = ColumnarAnnotationIR()
+        splitted_data.tags = [deepcopy(t)
+            for t in self.tags if AnnotationIR._is_shape_inside(t, start, stop)]
+        splitted_data.shapes = self.shapes.take(np.nonzero(
+            (start <= self.shapes.frame) & (self.shapes.frame <= stop))[0])
+
+        tracks = []
+        for idx in range(len(self.tracks)):
+            if not self._is_track_inside(idx, start, stop):
+                continue
+            frames, outside = self.tracks.get_shape_frames(idx)
+            if start <= frames[0] and frames[-1] <= stop and not outside[0]:
+                tracks.append(idx) # nothing to cut or interpolate
+            else:
+                tracks.append(AnnotationIR._slice_track(self.tracks[idx],
+                    start, stop))
+        splitted_data.tracks = self.tracks.replace(tracks)
+
+        return splitted_data
+
+    def _merge_shapes(self, shapes, start_frame, overlap):
+        new_shapes = [s for s in shapes if s['frame'] >= start_frame + overlap]
+        int_shapes = [s for s in shapes if s['frame'] < start_frame + overlap]
+
+        # Only intersected shapes of existing objects are compared with
+        # new ones, so only they are converted to dicts
+        old_shapes = []
+        if int_shapes:
+            int_frames = np.array(sorted(set(s['frame'] for s in int_shapes)),
+                dtype=np.int32)
+            for columns, max_frame in self._shape_parts:
+                if int_frames[0] <= max_frame:
+                    old_shapes.extend(columns[idx] for idx in np.nonzero(
+                        np.isin(columns.frame, int_frames))[0])
+        old_count = len(old_shapes)
+        manager = ShapeManager(old_shapes)
+        manager.merge(int_shapes, start_frame, overlap)
+
+        # Old shapes are not changed by ShapeManager, only unmatched
+        # intersected shapes are added
+        self._add_shapes(ShapeColumns.from_dicts(new_shapes))
+        self._add_shapes(ShapeColumns.from_dicts(manager.objects[old_count:]))
+
+    def _merge_tracks(self, tracks, start_frame, overlap):
+        # Only tracks which can be changed by the merge, the same as in
+        # TrackManager._get_objects_by_frame, are converted to dicts.
+        # Tracks are kept in the same order.
+        parts = []
+        old_tracks = []
+        for part in self._track_parts:
+            if isinstance(part, list):
+                is_changeable = [track['shapes'][-1]['frame'] >= start_frame or \
+                    not track['shapes'][-1]['outside'] for track in part]
+            else:
+                columns, max_last_frame, has_open_tracks = part
+                if max_last_frame < start_frame and not has_open_tracks:
+                    parts.append(part)
+                    continue
+                last_shapes = columns.shape_offsets[1:] - 1
+                is_changeable = \
+                    (columns.shapes.frame[last_shapes] >= start_frame) | \
+                    ~columns.shapes.outside[last_shapes]
+                if not is_changeable.any():
+                    parts.append(part)
+                    continue
+
+            for changeable, indices in groupby(range(len(is_changeable)),
+                    key=is_changeable.__getitem__):
+                indices = list(indices)
+                if isinstance(part, list):
+                    part_tracks = [part[idx] for idx in indices]
+                    if not changeable:
+                        self._add_tracks(parts,
+                            TrackColumns.from_dicts(part_tracks))
+                        continue
+                elif changeable:
+                    part_tracks = [columns[idx] for idx in indices]
+                else:
+                    self._add_tracks(parts, columns.take(indices))
+                    continue
+                old_tracks.extend(part_tracks)
+                parts.append(part_tracks)
+
+        manager = TrackManager(list(old_tracks))
+        manager.merge(tracks, start_frame, overlap)
+
+        # Old tracks are modified in place, new tracks are added
+        new_tracks = manager.objects[len(old_tracks):]
+        if new_tracks:
+            parts.append(new_tracks)
+        self._track_parts = parts
+
+    def merge(self, data, start_frame, overlap):
+        if isinstance(data, ColumnarAnnotationIR):
+            data = data.data
+
+        tags = TagManager(self.tags)
+        tags.merge(data['tags'], start_frame, overlap)
+        self._merge_shapes(list(data['shapes']), start_frame, overlap)
+        self._merge_tracks(list(data['tracks']), start_frame, overlap)
+
+    def to_shapes(self, end_frame):
+        for shape in self.shapes:
+            yield shape
+
+        for idx, track in enumerate(self.tracks):
+            yield from TrackManager.iter_track_shapes(track, idx, end_frame)
 
 class AnnotationManager:
     def __init__(self, data):
         self.data = data
 
     def merge(self, data, start_frame, overlap):
+        if isinstance(self.data, ColumnarAnnotationIR):
+            self.data.merge(data, start_frame, overlap)
+            return
+
         tags = TagManager(self.data.tags)
         tags.merge(data.tags, start_frame, overlap)
 
@@ -148,11 +745,83 @@ class AnnotationManager:
         tracks.merge(data.tracks, start_frame, overlap)
 
     def to_shapes(self, end_frame):
+        if isinstance(self.data, ColumnarAnnotationIR):
+            return list(self.data.to_shapes(end_frame))
+
         shapes = self.data.shapes
         tracks = TrackManager(self.data.tracks)
 
         return shapes + tracks.to_shapes(end_frame)
 
+    def _iter_shapes_in_frame_order(self):
+        shapes = self.data.shapes
+        if isinstance(self.data, ColumnarAnnotationIR):
+            for idx in np.argsort(shapes.frame, kind='mergesort'):
+                yield shapes[idx]
+        else:
+            yield from sorted(shapes, key=lambda shape: shape["frame"])
+
+    def _get_track_start_frames(self):
+        tracks = self.data.tracks
+        if isinstance(self.data, ColumnarAnnotationIR):
+            start_frames = tracks.shapes.frame[tracks.shape_offsets[:-1]]
+        else:
+            start_frames = [track["shapes"][0]["frame"] for track in tracks]
+        return sorted((int(frame), idx)
+            for idx, frame in enumerate(start_frames))
+
+    def iter_shapes_by_frame(self, end_frame):
+        """
+        Yields (frame, shapes) pairs in frame order. Shapes of a frame are
+        the same as in to_shapes() and are sorted by z_order.
+        Track shapes are interpolated lazily, a track is started only when
+        its first frame is reached, so only shapes of the current frame
+        and tracks which are active on it are kept in memory.
+        """
+
+        shapes = self._iter_shapes_in_frame_order()
+        next_shape = next(shapes, None)
+        track_starts = self._get_track_start_frames()
+        next_track = 0
+        active_tracks = [] # a heap of (frame, track_id, shape, shapes)
+
+        while next_shape is not None or next_track < len(track_starts) or active_tracks:
+            frame = min(
+                next_shape["frame"] if next_shape is not None else float('inf'),
+                track_starts[next_track][0] \
+                    if next_track < len(track_starts) else float('inf'),
+                active_tracks[0][0] if active_tracks else float('inf'),
+            )
+
+            while next_track < len(track_starts) and \
+                    track_starts[next_track][0] <= frame:
+                track_id = track_starts[next_track][1]
+                track_shapes = TrackManager.iter_track_shapes(
+                    self.data.tracks[track_id], track_id, end_frame)
+                track_shape = next(track_shapes, None)
+                if track_shape is not None:
+                    heapq.heappush(active_tracks, (track_shape["frame"],
+                        track_id, track_shape, track_shapes))
+                next_track += 1
+
+            frame_shapes = []
+            while next_shape is not None and next_shape["frame"] == frame:
+                frame_shapes.append(next_shape)
+                next_shape = next(shapes, None)
+
+            # Tracks with the same frame are popped in the order of ids
+            while active_tracks and active_tracks[0][0] == frame:
+                _, track_id, track_shape, track_shapes = \
+                    heapq.heappop(active_tracks)
+                frame_shapes.append(track_shape)
+                track_shape = next(track_shapes, None)
+                if track_shape is not None:
+                    heapq.heappush(active_tracks, (track_shape["frame"],
+                        track_id, track_shape, track_shapes))
+
+            frame_shapes.sort(key=lambda shape: shape.get("z_order", 0))
+            yield frame, frame_shapes
+
     def to_tracks(self):
         tracks = self.data.tracks
         shapes = ShapeManager(self.data.shapes)
@@ -191,6 +860,23 @@ class ObjectManager:
     def _modify_unmached_object(obj, end_frame):
         raise NotImplementedError()
 
+    def _match_objects(self, int_objects, old_objects, start_frame, overlap):
+        # 5. Build cost matrix for the frame and find correspondence using
+        # Hungarian algorithm.
+        min_cost_thresh = self._get_cost_threshold()
+        cost_matrix = np.empty(shape=(len(int_objects), len(old_objects)),
+            dtype=float)
+        for i, int_obj in enumerate(int_objects):
+            for j, old_obj in enumerate(old_objects):
+                cost_matrix[i][j] = 1 - self._calc_objects_similarity(
+                    int_obj, old_obj, start_frame, overlap)
+
+        # 6. Find optimal solution using Hungarian algorithm.
+        row_ind, col_ind = linear_sum_assignment(cost_matrix)
+        # Reject the solution if the cost is too high.
+        return [(i, j) for i, j in zip(row_ind, col_ind)
+            if cost_matrix[i][j] <= min_cost_thresh]
+
     def merge(self, objects, start_frame, overlap):
         # 1. Split objects on two parts: new and which can be intersected
         # with existing objects.
@@ -216,33 +902,22 @@ class ObjectManager:
             self.objects.extend(int_objects)
             return
 
-        # 4. Build cost matrix for each frame and find correspondence using
-        # Hungarian algorithm. In this case min_cost_thresh is stronger
+        # 4. Find correspondence between objects for each frame
+        # (see _match_objects). In this case min_cost_thresh is stronger
         # because we compare only on one frame.
-        min_cost_thresh = self._get_cost_threshold()
         for frame in int_objects_by_frame:
             if frame in old_objects_by_frame:
                 int_objects = int_objects_by_frame[frame]
                 old_objects = old_objects_by_frame[frame]
-                cost_matrix = np.empty(shape=(len(int_objects), len(old_objects)),
-                    dtype=float)
-                # 5.1 Construct cost matrix for the frame.
-                for i, int_obj in enumerate(int_objects):
-                    for j, old_obj in enumerate(old_objects):
-                        cost_matrix[i][j] = 1 - self._calc_objects_similarity(
-                            int_obj, old_obj, start_frame, overlap)
-
-                # 6. Find optimal solution using Hungarian algorithm.
-                row_ind, col_ind = linear_sum_assignment(cost_matrix)
                 old_objects_indexes = list(range(0, len(old_objects)))
                 int_objects_indexes = list(range(0, len(int_objects)))
-                for i, j in zip(row_ind, col_ind):
-                    # Reject the solution if the cost is too high. Remember
-                    # inside int_objects_indexes objects which were handled.
-                    if cost_matrix[i][j] <= min_cost_thresh:
-                        old_objects[j] = self._unite_objects(int_objects[i], old_objects[j])
-                        int_objects_indexes[i] = -1
-                        old_objects_indexes[j] = -1
+                for i, j in self._match_objects(int_objects, old_objects,
+                        start_frame, overlap):
+                    # Remember inside int_objects_indexes objects
+                    # which were handled.
+                    old_objects[j] = self._unite_objects(int_objects[i], old_objects[j])
+                    int_objects_indexes[i] = -1
+                    old_objects_indexes[j] = -1
 
                 # 7. Add all new objects which were not processed.
                 for i in int_objects_indexes:
@@ -282,6 +957,89 @@ def pairwise(iterable):
     a = iter(iterable)
     return zip(a, a)
 
+def _get_bboxes(objects):
+    bboxes = np.empty((len(objects), 4), dtype=float)
+    for idx, obj in enumerate(objects):
+        points = np.asarray(obj["points"], dtype=float)
+        bboxes[idx] = [points[0::2].min(), points[1::2].min(),
+            points[0::2].max(), points[1::2].max()]
+    return bboxes
+
+def _find_intersecting_bboxes(bboxes0, bboxes1):
+    """
+    Returns indices of bbox pairs which intersect with a positive area.
+    Bboxes of the second set are put into a uniform grid, so only bboxes
+    from nearby cells are compared.
+    """
+
+    if not len(bboxes0) or not len(bboxes1):
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    sizes = np.concatenate([bboxes0[:, 2:] - bboxes0[:, :2],
+        bboxes1[:, 2:] - bboxes1[:, :2]]).max(axis=1)
+    cell_size = max(float(np.median(sizes)), 1.0)
+
+    grid = {}
+    for idx, (x0, y0, x1, y1) in enumerate(
+            np.floor(bboxes1 / cell_size).astype(int).tolist()):
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                grid.setdefault((x, y), []).append(idx)
+
+    rows = []
+    cols = []
+    for idx, (x0, y0, x1, y1) in enumerate(
+            np.floor(bboxes0 / cell_size).astype(int).tolist()):
+        candidates = set()
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                candidates.update(grid.get((x, y), []))
+        rows.extend([idx] * len(candidates))
+        cols.extend(candidates)
+    rows = np.array(rows, dtype=int)
+    cols = np.array(cols, dtype=int)
+
+    b0 = bboxes0[rows]
+    b1 = bboxes1[cols]
+    intersects = \
+        (np.minimum(b0[:, 2], b1[:, 2]) > np.maximum(b0[:, 0], b1[:, 0])) & \
+        (np.minimum(b0[:, 3], b1[:, 3]) > np.maximum(b0[:, 1], b1[:, 1]))
+    return rows[intersects], cols[intersects]
+
+def _match_sparse(rows, cols, similarity, max_cost):
+    """
+    Finds the optimal assignment, when only the specified pairs
+    have non-zero similarity. The optimal assignment is found separately
+    for each connected component of the bipartite graph of the pairs,
+    which gives the same result as for the full cost matrix.
+    """
+
+    if not len(rows):
+        return []
+
+    # Nodes of the graph are rows and then columns
+    row_count = rows.max() + 1
+    node_count = row_count + cols.max() + 1
+    graph = coo_matrix((np.ones(len(rows)), (rows, cols + row_count)),
+        shape=(node_count, node_count))
+    _, components = connected_components(graph, directed=False)
+
+    matches = []
+    pair_components = components[rows]
+    order = np.argsort(pair_components, kind='mergesort')
+    bounds = np.flatnonzero(np.diff(pair_components[order])) + 1
+    for pairs in np.split(order, bounds):
+        component_rows, local_rows = np.unique(rows[pairs], return_inverse=True)
+        component_cols, local_cols = np.unique(cols[pairs], return_inverse=True)
+        cost_matrix = np.ones((len(component_rows), len(component_cols)))
+        cost_matrix[local_rows, local_cols] = 1 - similarity[pairs]
+
+        row_ind, col_ind = linear_sum_assignment(cost_matrix)
+        matches.extend((int(component_rows[i]), int(component_cols[j]))
+            for i, j in zip(row_ind, col_ind)
+            if cost_matrix[i][j] <= max_cost)
+    return matches
+
 class ShapeManager(ObjectManager):
     def to_tracks(self):
         tracks = []
@@ -327,13 +1085,45 @@ class ShapeManager(ObjectManager):
                 return _calc_polygons_similarity(p0, p1)
             elif obj0["type"] == ShapeType.POLYGON:
                 p0 = geometry.Polygon(pairwise(obj0["points"]))
-                p1 = geometry.Polygon(pairwise(obj0["points"]))
+                p1 = geometry.Polygon(pairwise(obj1["points"]))
 
                 return _calc_polygons_similarity(p0, p1)
             else:
                 return 0 # FIXME: need some similarity for points and polylines
         return 0
 
+    def _match_objects(self, int_objects, old_objects, start_frame, overlap):
+        # Only rectangles and polygons can be similar, and only if their
+        # bounding boxes intersect. Such pairs are found with a spatial grid,
+        # so dense frames don't require a full cost matrix.
+        rows, cols = _find_intersecting_bboxes(
+            _get_bboxes(int_objects), _get_bboxes(old_objects))
+
+        pairs = [(i, j) for i, j in zip(rows.tolist(), cols.tolist())
+            if int_objects[i]["type"] == old_objects[j]["type"] and \
+                int_objects[i].get("label_id") == old_objects[j].get("label_id") and \
+                int_objects[i]["type"] in (ShapeType.RECTANGLE, ShapeType.POLYGON)]
+        rows = np.array([i for i, _ in pairs], dtype=int)
+        cols = np.array([j for _, j in pairs], dtype=int)
+
+        similarity = np.zeros(len(pairs))
+        is_rectangle = np.array([int_objects[i]["type"] == ShapeType.RECTANGLE
+            for i, _ in pairs], dtype=bool)
+        if is_rectangle.any():
+            b0 = _get_bboxes([int_objects[i] for i in rows[is_rectangle]])
+            b1 = _get_bboxes([old_objects[j] for j in cols[is_rectangle]])
+            # [x0, y0, x1, y1] -> [x, y, w, h]
+            b0[:, 2:] -= b0[:, :2]
+            b1[:, 2:] -= b1[:, :2]
+            similarity[is_rectangle] = bbox_iou_pairs(b0, b1)
+        for idx in np.flatnonzero(~is_rectangle):
+            similarity[idx] = self._calc_objects_similarity(
+                int_objects[rows[idx]], old_objects[cols[idx]],
+                start_frame, overlap)
+
+        return _match_sparse(rows, cols, similarity,
+            self._get_cost_threshold())
+
     @staticmethod
     def _unite_objects(obj0, obj1):
         # TODO: improve the trivial implementation
@@ -347,14 +1137,31 @@ class TrackManager(ObjectManager):
     def to_shapes(self, end_frame):
         shapes = []
         for idx, track in enumerate(self.objects):
-            for shape in TrackManager.get_interpolated_shapes(track, 0, end_frame):
-                shape["label_id"] = track["label_id"]
-                shape["group"] = track["group"]
-                shape["track_id"] = idx
-                shape["attributes"] += track["attributes"]
-                shapes.append(shape)
+            shapes.extend(TrackManager.get_track_shapes(track, idx, end_frame))
         return shapes
 
+    @staticmethod
+    def get_track_shapes(track, track_id, end_frame):
+        shapes = TrackManager.get_interpolated_shapes(track, 0, end_frame)
+        return list(TrackManager._set_track_fields(shapes, track, track_id))
+
+    @staticmethod
+    def iter_track_shapes(track, track_id, end_frame):
+        shapes = TrackManager.iter_interpolated_shapes(track, end_frame)
+        return TrackManager._set_track_fields(shapes, track, track_id)
+
+    @staticmethod
+    def _set_track_fields(shapes, track, track_id):
+        # Keyframes are copied, because they are used to compute
+        # the next interpolated shapes
+        for shape in shapes:
+            shape = copy(shape)
+            shape["label_id"] = track["label_id"]
+            shape["group"] = track["group"]
+            shape["track_id"] = track_id
+            shape["attributes"] = shape["attributes"] + track["attributes"]
+            yield shape
+
     @staticmethod
     def _get_objects_by_frame(objects, start_frame):
         # Just for unification. All tracks are assigned on the same frame
@@ -424,26 +1231,51 @@ class TrackManager(ObjectManager):
 
     @staticmethod
     def normalize_shape(shape):
-        points = list(shape["points"])
-        if len(points) == 2:
-            points.extend(points) # duplicate points for single point case
-        points = np.asarray(points).reshape(-1, 2)
-        broken_line = geometry.LineString(points)
-        points = []
-        for off in range(0, 100, 1):
-            p = broken_line.interpolate(off / 100, True)
-            points.append(p.x)
-            points.append(p.y)
+        points = np.asarray(shape["points"], dtype=float).reshape(-1, 2)
+        if len(points) == 1:
+            points = np.tile(points, (2, 1)) # single point case
+
+        # Resample the broken line with 100 equidistant points
+        lengths = np.hypot(*np.diff(points, axis=0).T)
+        distances = np.concatenate(([0], np.cumsum(lengths)))
+        if distances[-1] == 0:
+            points = np.tile(points[0], (100, 1))
+        else:
+            offsets = np.arange(100) / 100 * distances[-1]
+            points = np.column_stack([
+                np.interp(offsets, distances, points[:, 0]),
+                np.interp(offsets, distances, points[:, 1]),
+            ])
 
         shape = copy(shape)
-        shape["points"] = points
+        shape["points"] = points.ravel().tolist()
 
         return shape
 
     @staticmethod
     def get_interpolated_shapes(track, start_frame, end_frame):
+        if track.get("interpolated_shapes"):
+            return track["interpolated_shapes"]
+
+        shapes = list(TrackManager.iter_interpolated_shapes(track, end_frame))
+        track["interpolated_shapes"] = shapes
+
+        return shapes
+
+    @staticmethod
+    def iter_interpolated_shapes(track, end_frame):
+        """
+        Yields keyframes and interpolated shapes of the track in frame order.
+        Interpolated shapes are computed lazily for each pair of keyframes
+        and are not cached in the track.
+        """
+
         def interpolate(shape0, shape1):
             shapes = []
+            distance = shape1["frame"] - shape0["frame"]
+            if distance <= 1:
+                return shapes
+
             is_same_type = shape0["type"] == shape1["type"]
             is_polygon = shape0["type"] == ShapeType.POLYGON
             is_polyline = shape0["type"] == ShapeType.POLYLINE
@@ -452,31 +1284,39 @@ class TrackManager(ObjectManager):
                 shape0 = TrackManager.normalize_shape(shape0)
                 shape1 = TrackManager.normalize_shape(shape1)
 
-            distance = shape1["frame"] - shape0["frame"]
-            step = np.subtract(shape1["points"], shape0["points"]) / distance
-            for frame in range(shape0["frame"] + 1, shape1["frame"]):
-                off = frame - shape0["frame"]
-                if shape1["outside"]:
-                    points = np.asarray(shape0["points"]).reshape(-1, 2)
-                else:
-                    points = (shape0["points"] + step * off).reshape(-1, 2)
-                shape = deepcopy(shape0)
-                if len(points) == 1:
+            # Points of all frames between the keyframes are computed at once
+            offsets = np.arange(1, distance).reshape(-1, 1)
+            points0 = np.asarray(shape0["points"], dtype=float)
+            if shape1["outside"]:
+                frame_points = np.tile(points0, (len(offsets), 1))
+            else:
+                step = np.subtract(shape1["points"], points0) / distance
+                frame_points = points0 + step * offsets
+
+            point_count = len(points0) // 2
+            for off, points in zip(offsets.ravel(), frame_points):
+                shape = copy(shape0)
+                shape["attributes"] = [copy(attr)
+                    for attr in shape0["attributes"]]
+                if point_count == 1:
                     shape["points"] = points.flatten()
+                elif point_count == 2:
+                    # Simplification can't remove end points of a line
+                    shape["points"] = points.tolist()
                 else:
-                    broken_line = geometry.LineString(points).simplify(0.05, False)
+                    broken_line = geometry.LineString(points.reshape(-1, 2)) \
+                        .simplify(0.05, False)
                     shape["points"] = [x for p in broken_line.coords for x in p]
 
                 shape["keyframe"] = False
-                shape["frame"] = frame
+                shape["frame"] = shape0["frame"] + int(off)
                 shapes.append(shape)
             return shapes
 
         if track.get("interpolated_shapes"):
-            return track["interpolated_shapes"]
+            yield from track["interpolated_shapes"]
+            return
 
-        # TODO: should be return an iterator?
-        shapes = []
         curr_frame = track["shapes"][0]["frame"]
         prev_shape = {}
         for shape in track["shapes"]:
@@ -486,10 +1326,10 @@ class TrackManager(ObjectManager):
                     if attr["spec_id"] not in map(lambda el: el["spec_id"], shape["attributes"]):
                         shape["attributes"].append(deepcopy(attr))
                 if not prev_shape["outside"]:
-                    shapes.extend(interpolate(prev_shape, shape))
+                    yield from interpolate(prev_shape, shape)
 
             shape["keyframe"] = True
-            shapes.append(shape)
+            yield shape
             curr_frame = shape["frame"]
             prev_shape = shape
 
@@ -498,11 +1338,7 @@ class TrackManager(ObjectManager):
                or prev_shape["type"] == ShapeType.POINTS or prev_shape["type"] == ShapeType.CUBOID):
             shape = copy(prev_shape)
             shape["frame"] = end_frame
-            shapes.extend(interpolate(prev_shape, shape))
-
-        track["interpolated_shapes"] = shapes
-
-        return shapes
+            yield from interpolate(prev_shape, shape)
 
     @staticmethod
     def _unite_objects(obj0, obj1):
@@ -3,8 +3,12 @@
 #
 # SPDX-License-Identifier: MIT
 
+import heapq
+import os
 import os.path as osp
 from collections import OrderedDict, namedtuple
+from itertools import dropwhile, groupby, islice, takewhile
+from tempfile import NamedTemporaryFile
 
 from django.utils import timezone
 
@@ -29,13 +33,28 @@ class TaskData:
     Tag.__new__.__defaults__ = (0, )
     Frame = namedtuple(
         'Frame', 'idx, frame, name, width, height, labeled_shapes, tags')
-
-    def __init__(self, annotation_ir, db_task, host='', create_callback=None):
+    # A cached fragment of annotations of the frames from start to stop.
+    # If annotation_ir is set, the fragment is outdated and is produced
+    # from annotation_ir.
+    FrameFragment = namedtuple(
+        'FrameFragment', 'start, stop, path, annotation_ir')
+
+    # Imported annotations are passed to the create callback by batches
+    # of this size, so they are not kept in memory for the whole file
+    _MAX_ANNO_SIZE = 30000
+
+    # Frames, which are not in cached fragments, are produced
+    # by fragments of this size
+    _FRAGMENT_SIZE = 1000
+
+    def __init__(self, annotation_ir, db_task, host='', create_callback=None,
+            frame_fragments=None):
         self._annotation_ir = annotation_ir
+        self._frame_fragments = frame_fragments
         self._db_task = db_task
         self._host = host
         self._create_callback = create_callback
-        self._MAX_ANNO_SIZE = 30000
+        self._anno_size = 0
         self._frame_info = {}
         self._frame_mapping = {}
         self._frame_step = db_task.data.get_frame_step()
@@ -56,40 +75,39 @@ class TaskData:
                 else:
                     self._attribute_mapping[db_label.id]['immutable'][db_attribute.id] = db_attribute.name
 
-        self._attribute_mapping_merged = {}
+        # Reverse mappings are used for lookups by names. If names are
+        # repeated, the first one is used, like in a scan over the mappings.
+        self._label_id_mapping = {}
+        for db_label in db_labels:
+            self._label_id_mapping.setdefault(db_label.name, db_label.id)
+
+        self._attribute_id_mapping = {}
+        self._attribute_names = {}
         for label_id, attr_mapping in self._attribute_mapping.items():
-            self._attribute_mapping_merged[label_id] = {
-                **attr_mapping['mutable'],
-                **attr_mapping['immutable'],
-            }
+            id_mapping = { attribute_type: {}
+                for attribute_type in ['mutable', 'immutable', 'all'] }
+            for attribute_type in ['mutable', 'immutable']:
+                for attr_id, attr_name in attr_mapping[attribute_type].items():
+                    id_mapping[attribute_type].setdefault(attr_name, attr_id)
+                    id_mapping['all'].setdefault(attr_name, attr_id)
+                    self._attribute_names.setdefault(attr_id, attr_name)
+            self._attribute_id_mapping[label_id] = id_mapping
 
         self._init_frame_info()
         self._init_meta()
 
     def _get_label_id(self, label_name):
-        for db_label in self._label_mapping.values():
-            if label_name == db_label.name:
-                return db_label.id
-        return None
+        return self._label_id_mapping.get(label_name)
 
     def _get_label_name(self, label_id):
         return self._label_mapping[label_id].name
 
     def _get_attribute_name(self, attribute_id):
-        for attribute_mapping in self._attribute_mapping_merged.values():
-            if attribute_id in attribute_mapping:
-                return attribute_mapping[attribute_id]
+        return self._attribute_names.get(attribute_id)
 
     def _get_attribute_id(self, label_id, attribute_name, attribute_type=None):
-        if attribute_type:
-            container = self._attribute_mapping[label_id][attribute_type]
-        else:
-            container = self._attribute_mapping_merged[label_id]
-
-        for attr_id, attr_name in container.items():
-            if attribute_name == attr_name:
-                return attr_id
-        return None
+        return self._attribute_id_mapping[label_id][attribute_type or 'all'] \
+            .get(attribute_name)
 
     def _get_mutable_attribute_id(self, label_id, attribute_name):
         return self._get_attribute_id(label_id, attribute_name, 'mutable')
@@ -228,41 +246,90 @@ class TaskData:
             attributes=self._export_attributes(tag["attributes"]),
         )
 
+    def _export_frame(self, idx, labeled_shapes, tags):
+        frame_info = self._frame_info[idx]
+        return TaskData.Frame(
+            idx=idx,
+            frame=self._db_task.data.start_frame + idx * self._frame_step,
+            name=frame_info['path'],
+            height=frame_info["height"],
+            width=frame_info["width"],
+            labeled_shapes=labeled_shapes,
+            tags=tags,
+        )
+
     def group_by_frame(self, include_empty=False):
-        frames = {}
-        def get_frame(idx):
-            frame_info = self._frame_info[idx]
-            frame = self._db_task.data.start_frame + idx * self._frame_step
-            if frame not in frames:
-                frames[frame] = TaskData.Frame(
-                    idx=idx,
-                    frame=frame,
-                    name=frame_info['path'],
-                    height=frame_info["height"],
-                    width=frame_info["width"],
-                    labeled_shapes=[],
-                    tags=[],
-                )
-            return frames[frame]
+        """
+        Yields frames in order. Shapes are produced frame by frame,
+        so interpolated shapes of all tracks are never kept in memory at once.
+        """
 
-        if include_empty:
-            for idx in self._frame_info:
-                get_frame(idx)
-
-        anno_manager = AnnotationManager(self._annotation_ir)
-        for shape in sorted(anno_manager.to_shapes(self._db_task.data.size),
-                key=lambda shape: shape.get("z_order", 0)):
-            if 'track_id' in shape:
-                exported_shape = self._export_tracked_shape(shape)
-            else:
-                exported_shape = self._export_labeled_shape(shape)
-            get_frame(shape['frame']).labeled_shapes.append(
-                exported_shape)
+        return self._group_by_frame(self._annotation_ir, include_empty)
 
-        for tag in self._annotation_ir.tags:
-            get_frame(tag['frame']).tags.append(self._export_tag(tag))
+    def _group_by_frame(self, annotation_ir, include_empty=False,
+            start=0, stop=float('inf')):
+        tags = {}
+        for tag in annotation_ir.tags:
+            if start <= tag['frame'] <= stop:
+                tags.setdefault(tag['frame'], []).append(tag)
 
-        return iter(frames.values())
+        frames = set(tags)
+        if include_empty:
+            frames.update(frame for frame in self._frame_info
+                if start <= frame <= stop)
+
+        anno_manager = AnnotationManager(annotation_ir)
+        shapes_by_frame = anno_manager.iter_shapes_by_frame(
+            self._db_task.data.size)
+        shapes_by_frame = takewhile(lambda item: item[0] <= stop,
+            dropwhile(lambda item: item[0] < start, shapes_by_frame))
+        shapes_by_frame = heapq.merge(
+            ((idx, []) for idx in sorted(frames)), shapes_by_frame,
+            key=lambda item: item[0])
+        for idx, items in groupby(shapes_by_frame, key=lambda item: item[0]):
+            labeled_shapes = []
+            for _, shapes in items:
+                for shape in shapes:
+                    if 'track_id' in shape:
+                        labeled_shapes.append(
+                            self._export_tracked_shape(shape))
+                    else:
+                        labeled_shapes.append(
+                            self._export_labeled_shape(shape))
+
+            yield self._export_frame(idx, labeled_shapes,
+                [self._export_tag(tag) for tag in tags.get(idx, [])])
+
+    def iter_frame_fragments(self, dump_frames):
+        """
+        Yields text fragments of annotations, which are produced by
+        dump_frames(frames) for consecutive parts of
+        group_by_frame(include_empty=True). Cached fragments are
+        read from the files instead, outdated ones are updated.
+        """
+
+        if self._frame_fragments is None:
+            frames = self.group_by_frame(include_empty=True)
+            while True:
+                part = list(islice(frames, self._FRAGMENT_SIZE))
+                if not part:
+                    break
+                yield dump_frames(part)
+            return
+
+        for fragment in self._frame_fragments:
+            if fragment.annotation_ir is None:
+                with open(fragment.path, encoding='utf-8') as f:
+                    yield f.read()
+                continue
+
+            text = dump_frames(self._group_by_frame(fragment.annotation_ir,
+                include_empty=True, start=fragment.start, stop=fragment.stop))
+            with NamedTemporaryFile('w', encoding='utf-8',
+                    dir=osp.dirname(fragment.path), delete=False) as f:
+                f.write(text)
+            os.replace(f.name, fragment.path)
+            yield text
 
     @property
     def shapes(self):
@@ -272,13 +339,9 @@ class TaskData:
     @property
     def tracks(self):
         for idx, track in enumerate(self._annotation_ir.tracks):
-            tracked_shapes = TrackManager.get_interpolated_shapes(
-                track, 0, self._db_task.data.size)
-            for tracked_shape in tracked_shapes:
-                tracked_shape["attributes"] += track["attributes"]
-                tracked_shape["track_id"] = idx
-                tracked_shape["group"] = track["group"]
-                tracked_shape["label_id"] = track["label_id"]
+            # Interpolated shapes are not cached in the track
+            tracked_shapes = TrackManager.iter_track_shapes(
+                track, idx, self._db_task.data.size)
 
             yield TaskData.Track(
                 label=self._get_label_name(track["label_id"]),
@@ -348,23 +411,27 @@ class TaskData:
         if self._len() > self._MAX_ANNO_SIZE:
             self._create_callback(self._annotation_ir.serialize())
             self._annotation_ir.reset()
+            self._anno_size = 0
 
     def add_tag(self, tag):
         imported_tag = self._import_tag(tag)
         if imported_tag['label_id']:
             self._annotation_ir.add_tag(imported_tag)
+            self._anno_size += 1
             self._call_callback()
 
     def add_shape(self, shape):
         imported_shape = self._import_shape(shape)
         if imported_shape['label_id']:
             self._annotation_ir.add_shape(imported_shape)
+            self._anno_size += 1
             self._call_callback()
 
     def add_track(self, track):
         imported_track = self._import_track(track)
         if imported_track['label_id']:
             self._annotation_ir.add_track(imported_track)
+            self._anno_size += len(imported_track['shapes'])
             self._call_callback()
 
     @property
@@ -372,11 +439,9 @@ class TaskData:
         return self._annotation_ir
 
     def _len(self):
-        track_len = 0
-        for track in self._annotation_ir.tracks:
-            track_len += len(track['shapes'])
-
-        return len(self._annotation_ir.tags) + len(self._annotation_ir.shapes) + track_len
+        # The number of added tags, shapes and track shapes,
+        # which are not passed to the callback yet
+        return self._anno_size
 
     @property
     def frame_info(self):
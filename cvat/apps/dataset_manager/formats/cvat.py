@@ -7,9 +7,10 @@ import os.path as osp
 import zipfile
 from collections import OrderedDict
 from glob import glob
+from io import StringIO
 from tempfile import TemporaryDirectory
 
-from cvat.apps.dataset_manager.util import make_zip_archive
+from cvat.apps.dataset_manager.util import open_zip_entry
 from cvat.apps.engine.frame_provider import FrameProvider
 from datumaro.util.image import save_image
 
@@ -46,6 +47,14 @@ def create_xml_dumper(file_object):
             self._level += 1
             self._add_version()
 
+        def open_fragment(self):
+            # Elements of a fragment are written as children of the root
+            self._level += 1
+
+        def add_fragment(self, fragment):
+            # The fragment is a text, which is written by another dumper
+            self.xmlgen.ignorableWhitespace(fragment)
+
         def _add_meta(self, meta):
             self._level += 1
             for k, v in meta.items():
@@ -168,6 +177,10 @@ def create_xml_dumper(file_object):
             self.xmlgen.endElement("annotations")
             self.xmlgen.endDocument()
 
+        def close_fragment(self):
+            self._level -= 1
+            self.xmlgen.endDocument()
+
     return XmlAnnotationWriter(file_object)
 
 def dump_as_cvat_annotation(file_object, annotations):
@@ -175,7 +188,19 @@ def dump_as_cvat_annotation(file_object, annotations):
     dumper.open_root()
     dumper.add_meta(annotations.meta)
 
-    for frame_annotation in annotations.group_by_frame(include_empty=True):
+    # Images are written by fragments, so images of unchanged jobs
+    # can be taken from the export cache
+    for fragment in annotations.iter_frame_fragments(
+            lambda frames: dump_images(frames, annotations.meta)):
+        dumper.add_fragment(fragment)
+    dumper.close_root()
+
+def dump_images(frames, meta):
+    file_object = StringIO()
+    dumper = create_xml_dumper(file_object)
+    dumper.open_fragment()
+
+    for frame_annotation in frames:
         frame_id = frame_annotation.frame
         dumper.open_image(OrderedDict([
             ("id", str(frame_id)),
@@ -226,7 +251,7 @@ def dump_as_cvat_annotation(file_object, annotations):
                     )),
                 ]))
 
-            if annotations.meta["task"]["z_order"] != "False":
+            if meta["task"]["z_order"] != "False":
                 dump_data['z_order'] = str(shape.z_order)
             if shape.group:
                 dump_data['group_id'] = str(shape.group)
@@ -281,7 +306,9 @@ def dump_as_cvat_annotation(file_object, annotations):
             dumper.close_tag()
 
         dumper.close_image()
-    dumper.close_root()
+    dumper.close_fragment()
+
+    return file_object.getvalue()
 
 def dump_as_cvat_interpolation(file_object, annotations):
     dumper = create_xml_dumper(file_object)
@@ -413,7 +440,7 @@ def load(file_object, annotations):
     from defusedxml import ElementTree
     context = ElementTree.iterparse(file_object, events=("start", "end"))
     context = iter(context)
-    ev, _ = next(context)
+    ev, root = next(context)
 
     supported_shapes = ('box', 'polygon', 'polyline', 'points', 'cuboid')
 
@@ -511,35 +538,45 @@ def load(file_object, annotations):
                 tag = None
             el.clear()
 
+            if el.tag in ('track', 'image'):
+                # Cleared elements are still referenced by the root,
+                # drop them to keep the memory usage constant
+                root.clear()
+
 def _export(dst_file, task_data, anno_callback, save_images=False):
-    with TemporaryDirectory() as temp_dir:
-        with open(osp.join(temp_dir, 'annotations.xml'), 'wb') as f:
+    with zipfile.ZipFile(dst_file, 'w') as archive:
+        # Annotations are written to the archive as frames are produced
+        with open_zip_entry(archive, 'annotations.xml') as f:
             anno_callback(f, task_data)
 
         if save_images:
-            img_dir = osp.join(temp_dir, 'images')
-            os.makedirs(img_dir)
             frame_provider = FrameProvider(task_data.db_task.data)
             frames = frame_provider.get_frames(
                 frame_provider.Quality.ORIGINAL,
                 frame_provider.Type.NUMPY_ARRAY)
-            for frame_id, (frame_data, _) in enumerate(frames):
-                frame_name = task_data.frame_info[frame_id]['path']
-                if '.' in frame_name:
-                    save_image(osp.join(img_dir, frame_name),
-                        frame_data, jpeg_quality=100)
-                else:
-                    save_image(osp.join(img_dir, frame_name + '.png'),
-                        frame_data)
-
-        make_zip_archive(temp_dir, dst_file)
+            with TemporaryDirectory() as temp_dir:
+                for frame_id, (frame_data, _) in enumerate(frames):
+                    frame_name = task_data.frame_info[frame_id]['path']
+                    if '.' in frame_name:
+                        params = { 'jpeg_quality': 100 }
+                    else:
+                        frame_name += '.png'
+                        params = {}
+
+                    # The image codec is selected by the file extension
+                    img_path = osp.join(temp_dir,
+                        'image' + osp.splitext(frame_name)[1])
+                    save_image(img_path, frame_data, **params)
+                    archive.write(img_path, osp.join('images', frame_name))
+                    os.remove(img_path)
 
 @exporter(name='CVAT for video', ext='ZIP', version='1.1')
 def _export_video(dst_file, task_data, save_images=False):
     _export(dst_file, task_data,
         anno_callback=dump_as_cvat_interpolation, save_images=save_images)
 
-@exporter(name='CVAT for images', ext='ZIP', version='1.1')
+@exporter(name='CVAT for images', ext='ZIP', version='1.1',
+    frame_fragments=True)
 def _export_images(dst_file, task_data, save_images=False):
     _export(dst_file, task_data,
         anno_callback=dump_as_cvat_annotation, save_images=save_images)
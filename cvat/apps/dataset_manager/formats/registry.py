@@ -15,6 +15,10 @@ class _Format:
     DISPLAY_NAME = '{NAME} {VERSION}'
 
 class Exporter(_Format):
+    # The exporter writes frames with TaskData.iter_frame_fragments(),
+    # so fragments of unchanged jobs can be cached
+    FRAME_FRAGMENTS = False
+
     def __call__(self, dst_file, task_data, **options):
         raise NotImplementedError()
 
@@ -47,11 +51,12 @@ def _wrap_format(f_or_cls, klass, name, version, ext, display_name):
     return target
 
 EXPORT_FORMATS = {}
-def exporter(name, version, ext, display_name=None):
+def exporter(name, version, ext, display_name=None, frame_fragments=False):
     assert name not in EXPORT_FORMATS, "Export format '%s' already registered" % name
     def wrap_with_params(f_or_cls):
         t = _wrap_format(f_or_cls, Exporter,
             name=name, ext=ext, version=version, display_name=display_name)
+        t.FRAME_FRAGMENTS = frame_fragments
         key = t.DISPLAY_NAME
         assert key not in EXPORT_FORMATS, "Export format '%s' already registered" % name
         EXPORT_FORMATS[key] = t
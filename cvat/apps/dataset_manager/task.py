@@ -3,18 +3,28 @@
 #
 # SPDX-License-Identifier: MIT
 
+import hashlib
+import json
+import os
+import os.path as osp
+import time
 from collections import OrderedDict
+from copy import deepcopy
 from enum import Enum
+from tempfile import NamedTemporaryFile
 
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, Max, OuterRef, Q, Subquery
+from django.db.models.deletion import Collector
 from django.utils import timezone
 
 from cvat.apps.engine import models, serializers
 from cvat.apps.engine.plugins import plugin_decorator
 from cvat.apps.profiler import silk_profile
 
-from .annotation import AnnotationIR, AnnotationManager
+from .annotation import (AnnotationIR, AnnotationManager,
+    ColumnarAnnotationIR)
 from .bindings import TaskData
 from .formats.registry import make_exporter, make_importer
 
@@ -39,21 +49,91 @@ class PatchAction(str, Enum):
     def __str__(self):
         return self.value
 
+def _delete_objects(db_objects):
+    """
+    Deletes objects like QuerySet.delete() and returns the number of
+    deleted rows and ids of the deleted objects. The ids are taken from
+    the objects, which are selected anyway to delete their related rows.
+    """
+    collector = Collector(using=db_objects.db)
+    collector.collect(db_objects)
+    if db_objects.model in collector.data:
+        ids = [obj.id for obj in collector.data[db_objects.model]]
+    else: # the objects are deleted without selecting them
+        ids = list(db_objects.values_list('id', flat=True))
+    deleted, _ = collector.delete()
+    return deleted, ids
+
+_BULK_CREATE_ATTEMPTS = 3
+
+def _get_last_id(db_model):
+    # Ids of deleted rows must not be given to new objects, so the counter
+    # of the table is used if the backend has one. It is never less than
+    # any id which has been inserted, including explicit ones.
+    last_id = db_model.objects.aggregate(Max('id'))['id__max'] or 0
+    table = db_model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s",
+                [table])
+        elif connection.vendor == 'mysql':
+            # MySQL 8 caches AUTO_INCREMENT in information_schema.TABLES
+            # (for 24 hours by default), the cache is disabled to get
+            # the current value
+            if not connection.mysql_is_mariadb and \
+                    (8, ) <= connection.mysql_version:
+                cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+            cursor.execute("SELECT AUTO_INCREMENT - 1 FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [table])
+        else:
+            return last_id
+        row = cursor.fetchone()
+
+    if row and row[0]:
+        last_id = max(last_id, int(row[0]))
+    return last_id
+
+def _bulk_create_with_ids(db_model, objects):
+    # The backend doesn't return ids of inserted rows, so a range of ids
+    # after the last used one is allocated for new objects explicitly.
+    # Objects with ids (e.g. updated ones) keep them. A concurrent insertion
+    # into the table leads to IntegrityError, in this case the range is
+    # allocated again.
+    new_objects = [obj for obj in objects if obj.id is None]
+    max_id = max((obj.id for obj in objects if obj.id is not None), default=0)
+    for attempt in range(_BULK_CREATE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                last_id = max(_get_last_id(db_model), max_id)
+                for obj_id, obj in enumerate(new_objects, start=last_id + 1):
+                    obj.id = obj_id
+                return db_model.objects.bulk_create(objects)
+        except IntegrityError:
+            if attempt + 1 == _BULK_CREATE_ATTEMPTS:
+                raise
+
 def bulk_create(db_model, objects, flt_param):
     if objects:
         if flt_param:
             if 'postgresql' in settings.DATABASES["default"]["ENGINE"]:
                 return db_model.objects.bulk_create(objects)
             else:
-                ids = list(db_model.objects.filter(**flt_param).values_list('id', flat=True))
-                db_model.objects.bulk_create(objects)
-
-                return list(db_model.objects.exclude(id__in=ids).filter(**flt_param))
+                return _bulk_create_with_ids(db_model, objects)
         else:
             return db_model.objects.bulk_create(objects)
 
     return []
 
+def get_job_cache_dir(db_task):
+    return osp.join(osp.abspath(db_task.get_task_dirname()),
+        'export_cache', 'jobs')
+
+def _get_job_cache_path(cache_dir, job_id):
+    return osp.join(cache_dir, '{}.json'.format(job_id))
+
+def _get_fragment_cache_path(cache_dir, job_id, key):
+    return osp.join(cache_dir, '{}_{}.fragment'.format(job_id, key))
+
 def _merge_table_rows(rows, keys_for_merge, field_id):
     # It is necessary to keep a stable order of original rows
     # (e.g. for tracked boxes). Otherwise prev_box.frame can be bigger
@@ -82,7 +162,209 @@ def _merge_table_rows(rows, keys_for_merge, field_id):
 
     return list(merged_rows.values())
 
+def _get_db_attributes(db_labels):
+    db_attributes = {}
+    for db_label in db_labels:
+        db_attributes[db_label.id] = {
+            "mutable": OrderedDict(),
+            "immutable": OrderedDict(),
+            "all": OrderedDict(),
+        }
+        for db_attr in db_label.attributespec_set.all():
+            default_value = dotdict([
+                ('spec_id', db_attr.id),
+                ('value', db_attr.default_value),
+            ])
+            if db_attr.mutable:
+                db_attributes[db_label.id]["mutable"][db_attr.id] = default_value
+            else:
+                db_attributes[db_label.id]["immutable"][db_attr.id] = default_value
+
+            db_attributes[db_label.id]["all"][db_attr.id] = default_value
+
+    return db_attributes
+
+def _extend_attributes(attributeval_set, default_attribute_values):
+    shape_attribute_specs_set = set(attr.spec_id for attr in attributeval_set)
+    for db_attr in default_attribute_values:
+        if db_attr.spec_id not in shape_attribute_specs_set:
+            attributeval_set.append(dotdict([
+                ('spec_id', db_attr.spec_id),
+                ('value', db_attr.value),
+            ]))
+
+def _filter_by_frames(db_objects, start_frame=None, stop_frame=None):
+    if start_frame is not None:
+        db_objects = db_objects.filter(frame__gte=start_frame)
+    if stop_frame is not None:
+        db_objects = db_objects.filter(frame__lte=stop_frame)
+    return db_objects
+
+def _filter_tracks_by_frames(db_tracks, start_frame=None, stop_frame=None):
+    # A track is visible from its first shape till its last shape if the shape
+    # is outside, or till the end of the job otherwise
+    if stop_frame is not None:
+        db_tracks = db_tracks.filter(frame__lte=stop_frame)
+    if start_frame is not None:
+        db_shapes = models.TrackedShape.objects.filter(track_id=OuterRef('id'))
+        db_tracks = db_tracks.annotate(
+            has_shapes_after_start=Exists(
+                db_shapes.filter(frame__gte=start_frame)),
+            is_last_shape_outside=Subquery(
+                db_shapes.order_by('-frame').values('outside')[:1]),
+        ).filter(Q(has_shapes_after_start=True) |
+            Q(is_last_shape_outside=False))
+    return db_tracks
+
+def _load_tags_from_db(db_tags, db_attributes):
+    db_tags = db_tags.prefetch_related(
+        "label",
+        "labeledimageattributeval_set"
+    ).values(
+        'id',
+        'job_id',
+        'frame',
+        'label_id',
+        'group',
+        'labeledimageattributeval__spec_id',
+        'labeledimageattributeval__value',
+        'labeledimageattributeval__id',
+    ).order_by('frame')
+
+    db_tags = _merge_table_rows(
+        rows=db_tags,
+        keys_for_merge={
+            "labeledimageattributeval_set": [
+                'labeledimageattributeval__spec_id',
+                'labeledimageattributeval__value',
+                'labeledimageattributeval__id',
+            ],
+        },
+        field_id='id',
+    )
+
+    for db_tag in db_tags:
+        _extend_attributes(db_tag.labeledimageattributeval_set,
+            db_attributes[db_tag.label_id]["all"].values())
+
+    return db_tags
+
+def _load_shapes_from_db(db_shapes, db_attributes):
+    db_shapes = db_shapes.prefetch_related(
+        "label",
+        "labeledshapeattributeval_set"
+    ).values(
+        'id',
+        'job_id',
+        'label_id',
+        'type',
+        'frame',
+        'group',
+        'occluded',
+        'z_order',
+        'points',
+        'labeledshapeattributeval__spec_id',
+        'labeledshapeattributeval__value',
+        'labeledshapeattributeval__id',
+        ).order_by('frame')
+
+    db_shapes = _merge_table_rows(
+        rows=db_shapes,
+        keys_for_merge={
+            'labeledshapeattributeval_set': [
+                'labeledshapeattributeval__spec_id',
+                'labeledshapeattributeval__value',
+                'labeledshapeattributeval__id',
+            ],
+        },
+        field_id='id',
+    )
+    for db_shape in db_shapes:
+        _extend_attributes(db_shape.labeledshapeattributeval_set,
+            db_attributes[db_shape.label_id]["all"].values())
+
+    return db_shapes
+
+def _load_tracks_from_db(db_tracks, db_attributes):
+    db_tracks = db_tracks.prefetch_related(
+        "label",
+        "labeledtrackattributeval_set",
+        "trackedshape_set__trackedshapeattributeval_set"
+    ).values(
+        "id",
+        "job_id",
+        "frame",
+        "label_id",
+        "group",
+        "labeledtrackattributeval__spec_id",
+        "labeledtrackattributeval__value",
+        "labeledtrackattributeval__id",
+        "trackedshape__type",
+        "trackedshape__occluded",
+        "trackedshape__z_order",
+        "trackedshape__points",
+        "trackedshape__id",
+        "trackedshape__frame",
+        "trackedshape__outside",
+        "trackedshape__trackedshapeattributeval__spec_id",
+        "trackedshape__trackedshapeattributeval__value",
+        "trackedshape__trackedshapeattributeval__id",
+    ).order_by('id', 'trackedshape__frame')
+
+    db_tracks = _merge_table_rows(
+        rows=db_tracks,
+        keys_for_merge={
+            "labeledtrackattributeval_set": [
+                "labeledtrackattributeval__spec_id",
+                "labeledtrackattributeval__value",
+                "labeledtrackattributeval__id",
+            ],
+            "trackedshape_set":[
+                "trackedshape__type",
+                "trackedshape__occluded",
+                "trackedshape__z_order",
+                "trackedshape__points",
+                "trackedshape__id",
+                "trackedshape__frame",
+                "trackedshape__outside",
+                "trackedshape__trackedshapeattributeval__spec_id",
+                "trackedshape__trackedshapeattributeval__value",
+                "trackedshape__trackedshapeattributeval__id",
+            ],
+        },
+        field_id="id",
+    )
+
+    for db_track in db_tracks:
+        db_track["trackedshape_set"] = _merge_table_rows(db_track["trackedshape_set"], {
+            'trackedshapeattributeval_set': [
+                'trackedshapeattributeval__value',
+                'trackedshapeattributeval__spec_id',
+                'trackedshapeattributeval__id',
+            ]
+        }, 'id')
+
+        # A result table can consist many equal rows for track/shape attributes
+        # We need filter unique attributes manually
+        db_track["labeledtrackattributeval_set"] = list(set(db_track["labeledtrackattributeval_set"]))
+        _extend_attributes(db_track.labeledtrackattributeval_set,
+            db_attributes[db_track.label_id]["immutable"].values())
+
+        default_attribute_values = db_attributes[db_track.label_id]["mutable"].values()
+        for db_shape in db_track["trackedshape_set"]:
+            db_shape["trackedshapeattributeval_set"] = list(
+                set(db_shape["trackedshapeattributeval_set"])
+            )
+            # in case of trackedshapes need to interpolate attriute values and extend it
+            # by previous shape attribute values (not default values)
+            _extend_attributes(db_shape["trackedshapeattributeval_set"], default_attribute_values)
+            default_attribute_values = db_shape["trackedshapeattributeval_set"]
+
+    return db_tracks
+
 class JobAnnotation:
+    _ID_BATCH_SIZE = 500
+
     def __init__(self, pk):
         self.db_job = models.Job.objects.select_related('segment__task') \
             .select_for_update().get(id=pk)
@@ -94,25 +376,7 @@ class JobAnnotation:
 
         self.db_labels = {db_label.id:db_label
             for db_label in db_segment.task.label_set.all()}
-
-        self.db_attributes = {}
-        for db_label in self.db_labels.values():
-            self.db_attributes[db_label.id] = {
-                "mutable": OrderedDict(),
-                "immutable": OrderedDict(),
-                "all": OrderedDict(),
-            }
-            for db_attr in db_label.attributespec_set.all():
-                default_value = dotdict([
-                    ('spec_id', db_attr.id),
-                    ('value', db_attr.default_value),
-                ])
-                if db_attr.mutable:
-                    self.db_attributes[db_label.id]["mutable"][db_attr.id] = default_value
-                else:
-                    self.db_attributes[db_label.id]["immutable"][db_attr.id] = default_value
-
-                self.db_attributes[db_label.id]["all"][db_attr.id] = default_value
+        self.db_attributes = _get_db_attributes(self.db_labels.values())
 
     def reset(self):
         self.ir_data.reset()
@@ -282,7 +546,28 @@ class JobAnnotation:
 
         self.ir_data.tags = tags
 
-    def _commit(self):
+    @staticmethod
+    def _get_ids(data):
+        return { field: [obj["id"] for obj in data[field]
+                if obj.get("id") is not None]
+            for field in ['tags', 'shapes', 'tracks'] }
+
+    @staticmethod
+    def _get_changes(prev_ids, saved_ids):
+        # Objects which are saved with ids of existing ones are updated
+        changes = { "deleted": {}, "created": {}, "updated": {} }
+        for field, ids in saved_ids.items():
+            prev = set(prev_ids[field])
+            saved = set(ids)
+            changes["deleted"][field] = [obj_id
+                for obj_id in prev_ids[field] if obj_id not in saved]
+            changes["created"][field] = [obj_id
+                for obj_id in ids if obj_id not in prev]
+            changes["updated"][field] = [obj_id
+                for obj_id in ids if obj_id in prev]
+        return changes
+
+    def _commit(self, changes):
         db_prev_commit = self.db_job.commits.last()
         db_curr_commit = models.JobCommit()
         if db_prev_commit:
@@ -292,9 +577,17 @@ class JobAnnotation:
         db_curr_commit.job = self.db_job
         db_curr_commit.message = "Changes: tags - {}; shapes - {}; tracks - {}".format(
             len(self.ir_data.tags), len(self.ir_data.shapes), len(self.ir_data.tracks))
+        db_curr_commit.changes = json.dumps(changes)
         db_curr_commit.save()
         self.ir_data.version = db_curr_commit.version
 
+        # Cached annotations of the job are outdated now
+        try:
+            os.remove(_get_job_cache_path(
+                get_job_cache_dir(self.db_job.segment.task), self.db_job.id))
+        except FileNotFoundError:
+            pass
+
     def _set_updated_date(self):
         db_task = self.db_job.segment.task
         db_task.updated_date = timezone.now()
@@ -315,35 +608,37 @@ class JobAnnotation:
 
     def create(self, data):
         self._create(data)
-        self._commit()
+        self._commit({ "created": self._get_ids(self.ir_data) })
 
     def put(self, data):
-        self._delete()
+        deleted_ids = self._delete()
         self._create(data)
-        self._commit()
+        self._commit(self._get_changes(deleted_ids, self._get_ids(self.ir_data)))
 
     def update(self, data):
-        self._delete(data)
+        deleted_ids = self._delete(data)
         self._create(data)
-        self._commit()
+        self._commit(self._get_changes(deleted_ids, self._get_ids(self.ir_data)))
 
     def _delete(self, data=None):
+        """Returns ids of the deleted objects"""
+
         deleted_shapes = 0
-        if data is None:
-            deleted_shapes += self.db_job.labeledimage_set.all().delete()[0]
-            deleted_shapes += self.db_job.labeledshape_set.all().delete()[0]
-            deleted_shapes += self.db_job.labeledtrack_set.all().delete()[0]
-        else:
-            labeledimage_ids = [image["id"] for image in data["tags"]]
-            labeledshape_ids = [shape["id"] for shape in data["shapes"]]
-            labeledtrack_ids = [track["id"] for track in data["tracks"]]
-            labeledimage_set = self.db_job.labeledimage_set
-            labeledimage_set = labeledimage_set.filter(pk__in=labeledimage_ids)
-            labeledshape_set = self.db_job.labeledshape_set
-            labeledshape_set = labeledshape_set.filter(pk__in=labeledshape_ids)
-            labeledtrack_set = self.db_job.labeledtrack_set
-            labeledtrack_set = labeledtrack_set.filter(pk__in=labeledtrack_ids)
+        deleted_ids = {}
+        for field, db_objects in [
+            ('tags', self.db_job.labeledimage_set),
+            ('shapes', self.db_job.labeledshape_set),
+            ('tracks', self.db_job.labeledtrack_set),
+        ]:
+            if data is None:
+                db_objects = db_objects.all()
+            else:
+                db_objects = db_objects.filter(
+                    pk__in=[obj["id"] for obj in data[field]])
+            deleted, deleted_ids[field] = _delete_objects(db_objects)
+            deleted_shapes += deleted
 
+        if data is not None:
             # It is not important for us that data had some "invalid" objects
             # which were skipped (not acutally deleted). The main idea is to
             # say that all requested objects are absent in DB after the method.
@@ -351,171 +646,32 @@ class JobAnnotation:
             self.ir_data.shapes = data['shapes']
             self.ir_data.tracks = data['tracks']
 
-            deleted_shapes += labeledimage_set.delete()[0]
-            deleted_shapes += labeledshape_set.delete()[0]
-            deleted_shapes += labeledtrack_set.delete()[0]
-
         if deleted_shapes:
             self._set_updated_date()
 
-    def delete(self, data=None):
-        self._delete(data)
-        self._commit()
+        return deleted_ids
 
-    @staticmethod
-    def _extend_attributes(attributeval_set, default_attribute_values):
-        shape_attribute_specs_set = set(attr.spec_id for attr in attributeval_set)
-        for db_attr in default_attribute_values:
-            if db_attr.spec_id not in shape_attribute_specs_set:
-                attributeval_set.append(dotdict([
-                    ('spec_id', db_attr.spec_id),
-                    ('value', db_attr.value),
-                ]))
-
-    def _init_tags_from_db(self):
-        db_tags = self.db_job.labeledimage_set.prefetch_related(
-            "label",
-            "labeledimageattributeval_set"
-        ).values(
-            'id',
-            'frame',
-            'label_id',
-            'group',
-            'labeledimageattributeval__spec_id',
-            'labeledimageattributeval__value',
-            'labeledimageattributeval__id',
-        ).order_by('frame')
-
-        db_tags = _merge_table_rows(
-            rows=db_tags,
-            keys_for_merge={
-                "labeledimageattributeval_set": [
-                    'labeledimageattributeval__spec_id',
-                    'labeledimageattributeval__value',
-                    'labeledimageattributeval__id',
-                ],
-            },
-            field_id='id',
-        )
-
-        for db_tag in db_tags:
-            self._extend_attributes(db_tag.labeledimageattributeval_set,
-                self.db_attributes[db_tag.label_id]["all"].values())
+    def delete(self, data=None):
+        self._commit({ "deleted": self._delete(data) })
 
+    def _init_tags_from_db(self, start_frame=None, stop_frame=None):
+        db_tags = _filter_by_frames(self.db_job.labeledimage_set,
+            start_frame, stop_frame)
+        db_tags = _load_tags_from_db(db_tags, self.db_attributes)
         serializer = serializers.LabeledImageSerializer(db_tags, many=True)
         self.ir_data.tags = serializer.data
 
-    def _init_shapes_from_db(self):
-        db_shapes = self.db_job.labeledshape_set.prefetch_related(
-            "label",
-            "labeledshapeattributeval_set"
-        ).values(
-            'id',
-            'label_id',
-            'type',
-            'frame',
-            'group',
-            'occluded',
-            'z_order',
-            'points',
-            'labeledshapeattributeval__spec_id',
-            'labeledshapeattributeval__value',
-            'labeledshapeattributeval__id',
-            ).order_by('frame')
-
-        db_shapes = _merge_table_rows(
-            rows=db_shapes,
-            keys_for_merge={
-                'labeledshapeattributeval_set': [
-                    'labeledshapeattributeval__spec_id',
-                    'labeledshapeattributeval__value',
-                    'labeledshapeattributeval__id',
-                ],
-            },
-            field_id='id',
-        )
-        for db_shape in db_shapes:
-            self._extend_attributes(db_shape.labeledshapeattributeval_set,
-                self.db_attributes[db_shape.label_id]["all"].values())
-
+    def _init_shapes_from_db(self, start_frame=None, stop_frame=None):
+        db_shapes = _filter_by_frames(self.db_job.labeledshape_set,
+            start_frame, stop_frame)
+        db_shapes = _load_shapes_from_db(db_shapes, self.db_attributes)
         serializer = serializers.LabeledShapeSerializer(db_shapes, many=True)
         self.ir_data.shapes = serializer.data
 
-    def _init_tracks_from_db(self):
-        db_tracks = self.db_job.labeledtrack_set.prefetch_related(
-            "label",
-            "labeledtrackattributeval_set",
-            "trackedshape_set__trackedshapeattributeval_set"
-        ).values(
-            "id",
-            "frame",
-            "label_id",
-            "group",
-            "labeledtrackattributeval__spec_id",
-            "labeledtrackattributeval__value",
-            "labeledtrackattributeval__id",
-            "trackedshape__type",
-            "trackedshape__occluded",
-            "trackedshape__z_order",
-            "trackedshape__points",
-            "trackedshape__id",
-            "trackedshape__frame",
-            "trackedshape__outside",
-            "trackedshape__trackedshapeattributeval__spec_id",
-            "trackedshape__trackedshapeattributeval__value",
-            "trackedshape__trackedshapeattributeval__id",
-        ).order_by('id', 'trackedshape__frame')
-
-        db_tracks = _merge_table_rows(
-            rows=db_tracks,
-            keys_for_merge={
-                "labeledtrackattributeval_set": [
-                    "labeledtrackattributeval__spec_id",
-                    "labeledtrackattributeval__value",
-                    "labeledtrackattributeval__id",
-                ],
-                "trackedshape_set":[
-                    "trackedshape__type",
-                    "trackedshape__occluded",
-                    "trackedshape__z_order",
-                    "trackedshape__points",
-                    "trackedshape__id",
-                    "trackedshape__frame",
-                    "trackedshape__outside",
-                    "trackedshape__trackedshapeattributeval__spec_id",
-                    "trackedshape__trackedshapeattributeval__value",
-                    "trackedshape__trackedshapeattributeval__id",
-                ],
-            },
-            field_id="id",
-        )
-
-        for db_track in db_tracks:
-            db_track["trackedshape_set"] = _merge_table_rows(db_track["trackedshape_set"], {
-                'trackedshapeattributeval_set': [
-                    'trackedshapeattributeval__value',
-                    'trackedshapeattributeval__spec_id',
-                    'trackedshapeattributeval__id',
-                ]
-            }, 'id')
-
-            # A result table can consist many equal rows for track/shape attributes
-            # We need filter unique attributes manually
-            db_track["labeledtrackattributeval_set"] = list(set(db_track["labeledtrackattributeval_set"]))
-            self._extend_attributes(db_track.labeledtrackattributeval_set,
-                self.db_attributes[db_track.label_id]["immutable"].values())
-
-            default_attribute_values = self.db_attributes[db_track.label_id]["mutable"].values()
-            for db_shape in db_track["trackedshape_set"]:
-                db_shape["trackedshapeattributeval_set"] = list(
-                    set(db_shape["trackedshapeattributeval_set"])
-                )
-                # in case of trackedshapes need to interpolate attriute values and extend it
-                # by previous shape attribute values (not default values)
-                self._extend_attributes(db_shape["trackedshapeattributeval_set"], default_attribute_values)
-                default_attribute_values = db_shape["trackedshapeattributeval_set"]
-
-
+    def _init_tracks_from_db(self, start_frame=None, stop_frame=None):
+        db_tracks = _filter_tracks_by_frames(self.db_job.labeledtrack_set,
+            start_frame, stop_frame)
+        db_tracks = _load_tracks_from_db(db_tracks, self.db_attributes)
         serializer = serializers.LabeledTrackSerializer(db_tracks, many=True)
         self.ir_data.tracks = serializer.data
 
@@ -523,11 +679,74 @@ class JobAnnotation:
         db_commit = self.db_job.commits.last()
         self.ir_data.version = db_commit.version if db_commit else 0
 
-    def init_from_db(self):
-        self._init_tags_from_db()
-        self._init_shapes_from_db()
-        self._init_tracks_from_db()
+    def init_from_db(self, start_frame=None, stop_frame=None):
+        # Tags and shapes are loaded only for frames in the range,
+        # tracks are loaded completely if they are visible in the range
+        self._init_tags_from_db(start_frame, stop_frame)
+        self._init_shapes_from_db(start_frame, stop_frame)
+        self._init_tracks_from_db(start_frame, stop_frame)
+        self._init_version_from_db()
+
+    def _get_changes_from_db(self, since_version):
+        changed_ids = { field: set() for field in ['tags', 'shapes', 'tracks'] }
+        deleted_ids = { field: set() for field in ['tags', 'shapes', 'tracks'] }
+
+        db_commits = self.db_job.commits.filter(version__gt=since_version) \
+            .order_by('version').values_list('changes', flat=True)
+        for changes in db_commits:
+            if changes is None:
+                # The commit was made before changes were recorded
+                return None
+
+            changes = json.loads(changes)
+            for field in changed_ids:
+                for obj_id in changes.get("deleted", {}).get(field, []):
+                    changed_ids[field].discard(obj_id)
+                    deleted_ids[field].add(obj_id)
+                for change in ["created", "updated"]:
+                    for obj_id in changes.get(change, {}).get(field, []):
+                        deleted_ids[field].discard(obj_id)
+                        changed_ids[field].add(obj_id)
+
+        return changed_ids, deleted_ids
+
+    def _init_objects_from_db(self, ids):
+        for field, db_objects, load, serializer_class in [
+            ('tags', self.db_job.labeledimage_set, _load_tags_from_db,
+                serializers.LabeledImageSerializer),
+            ('shapes', self.db_job.labeledshape_set, _load_shapes_from_db,
+                serializers.LabeledShapeSerializer),
+            ('tracks', self.db_job.labeledtrack_set, _load_tracks_from_db,
+                serializers.LabeledTrackSerializer),
+        ]:
+            obj_ids = sorted(ids[field])
+            objects = []
+            for batch_start in range(0, len(obj_ids), self._ID_BATCH_SIZE):
+                batch = obj_ids[batch_start : batch_start + self._ID_BATCH_SIZE]
+                serializer = serializer_class(load(
+                    db_objects.filter(id__in=batch), self.db_attributes),
+                    many=True)
+                objects.extend(serializer.data)
+            setattr(self.ir_data, field, objects)
+
+    def init_changes_from_db(self, since_version):
+        """
+        Loads annotations created or updated after the version and
+        returns ids of deleted annotations. If the changes are unknown,
+        all annotations are loaded and None is returned.
+        """
+
         self._init_version_from_db()
+        changes = None
+        if since_version <= self.ir_data.version:
+            changes = self._get_changes_from_db(since_version)
+        if changes is None:
+            self.init_from_db()
+            return None
+
+        changed_ids, deleted_ids = changes
+        self._init_objects_from_db(changed_ids)
+        return { field: sorted(ids) for field, ids in deleted_ids.items() }
 
     @property
     def data(self):
@@ -546,36 +765,47 @@ class JobAnnotation:
         self.create(task_data.data.slice(self.start_frame, self.stop_frame).serialize())
 
 class TaskAnnotation:
-    def __init__(self, pk):
+    def __init__(self, pk, columnar=False):
         self.db_task = models.Task.objects.prefetch_related("data__images").get(id=pk)
 
         # Postgres doesn't guarantee an order by default without explicit order_by
         self.db_jobs = models.Job.objects.select_related("segment").filter(segment__task_id=pk).order_by('id')
-        self.ir_data = AnnotationIR()
+        # The columnar representation takes less memory on big tasks,
+        # but keeps points with float32 precision
+        self.ir_data = ColumnarAnnotationIR() if columnar else AnnotationIR()
+        self.frame_fragments = None
 
     def reset(self):
         self.ir_data.reset()
+        self.frame_fragments = None
 
-    def _patch_data(self, data, action):
+    def _patch_data(self, data, action, keep_data=True):
         _data = data if isinstance(data, AnnotationIR) else AnnotationIR(data)
-        splitted_data = {}
-        jobs = {}
-        for db_job in self.db_jobs:
-            jid = db_job.id
-            start = db_job.segment.start_frame
-            stop = db_job.segment.stop_frame
-            jobs[jid] = { "start": start, "stop": stop }
-            splitted_data[jid] = _data.slice(start, stop)
-
-        for jid, job_data in splitted_data.items():
+
+        # Lock all the jobs at once in the order of their ids before
+        # any changes. Concurrent requests, which change several jobs
+        # of the task, are serialized instead of waiting for each other.
+        db_jobs = list(self.db_jobs.select_for_update())
+        splitted_data = _data.split([
+            (db_job.segment.start_frame, db_job.segment.stop_frame)
+            for db_job in db_jobs
+        ])
+
+        # Jobs are saved one by one on purpose. Django connections are
+        # per-thread, so parallel writers would work outside of this
+        # transaction (a failed job couldn't roll back the others) and
+        # would wait for the job rows, which are locked above.
+        for db_job, job_data in zip(db_jobs, splitted_data):
             _data = AnnotationIR()
             if action is None:
-                _data.data = put_job_data(jid, job_data)
+                _data.data = put_job_data(db_job.id, job_data)
             else:
-                _data.data = patch_job_data(jid, job_data, action)
+                _data.data = patch_job_data(db_job.id, job_data, action)
             if _data.version > self.ir_data.version:
                 self.ir_data.version = _data.version
-            self._merge_data(_data, jobs[jid]["start"], self.db_task.overlap)
+            if keep_data:
+                self._merge_data(_data, db_job.segment.start_frame,
+                    self.db_task.overlap)
 
     def _merge_data(self, data, start_frame, overlap):
         annotation_manager = AnnotationManager(self.ir_data)
@@ -597,38 +827,229 @@ class TaskAnnotation:
             for db_job in self.db_jobs:
                 delete_job_data(db_job.id)
 
+    # SQLite limits the number of parameters in a query
+    _JOB_BATCH_SIZE = 500
+
+    def _get_job_versions(self):
+        return dict(models.JobCommit.objects \
+            .filter(job__segment__task_id=self.db_task.id) \
+            .values('job_id').annotate(version=Max('version')) \
+            .values_list('job_id', 'version'))
+
+    def _load_jobs_from_db(self, job_ids, versions):
+        """
+        Loads annotations of the jobs with a few queries for all of them
+        instead of a few queries per job. Returns an AnnotationIR per job.
+        """
+
+        db_attributes = _get_db_attributes(
+            self.db_task.label_set.prefetch_related('attributespec_set'))
+
+        jobs = OrderedDict()
+        for job_id in job_ids:
+            jobs[job_id] = AnnotationIR()
+            jobs[job_id].version = versions.get(job_id, 0)
+
+        for batch_start in range(0, len(job_ids), self._JOB_BATCH_SIZE):
+            batch = job_ids[batch_start : batch_start + self._JOB_BATCH_SIZE]
+            for field, db_model, load, serializer_class in [
+                ('tags', models.LabeledImage, _load_tags_from_db,
+                    serializers.LabeledImageSerializer),
+                ('shapes', models.LabeledShape, _load_shapes_from_db,
+                    serializers.LabeledShapeSerializer),
+                ('tracks', models.LabeledTrack, _load_tracks_from_db,
+                    serializers.LabeledTrackSerializer),
+            ]:
+                db_objects = load(db_model.objects.filter(job_id__in=batch),
+                    db_attributes)
+                serializer = serializer_class(db_objects, many=True)
+                for db_object, obj in zip(db_objects, serializer.data):
+                    jobs[db_object.job_id][field].append(obj)
+
+        return jobs
+
     def init_from_db(self):
         self.reset()
 
-        for db_job in self.db_jobs:
-            annotation = JobAnnotation(db_job.id)
-            annotation.init_from_db()
-            if annotation.ir_data.version > self.ir_data.version:
-                self.ir_data.version = annotation.ir_data.version
-            db_segment = db_job.segment
-            start_frame = db_segment.start_frame
-            overlap = self.db_task.overlap
-            self._merge_data(annotation.ir_data, start_frame, overlap)
+        db_jobs = list(self.db_jobs.select_for_update())
+        jobs = self._load_jobs_from_db([db_job.id for db_job in db_jobs],
+            self._get_job_versions())
+        for db_job in db_jobs:
+            ir_data = jobs[db_job.id]
+            if ir_data.version > self.ir_data.version:
+                self.ir_data.version = ir_data.version
+            self._merge_data(ir_data, db_job.segment.start_frame,
+                self.db_task.overlap)
+
+    def _get_labels_key(self):
+        # Deletion of a label removes its annotations without a new commit
+        labels = [(db_label.id, db_label.name, [(db_attr.id, db_attr.name,
+                db_attr.mutable, db_attr.default_value)
+                for db_attr in db_label.attributespec_set.order_by('id')])
+            for db_label in self.db_task.label_set.order_by('id')]
+        return hashlib.md5(json.dumps(labels).encode()).hexdigest()
+
+    @staticmethod
+    def _load_job_cache(cache_path, version, labels_key):
+        # The file can be removed concurrently, when the job is changed
+        # or the cache is cleaned
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f, object_pairs_hook=OrderedDict)
+            # The access time is used by the cache cleaning
+            os.utime(cache_path, ns=(int(time.time() * 1e9),
+                os.stat(cache_path).st_mtime_ns))
+        except FileNotFoundError:
+            return None
+        if cache['version'] != version or cache['labels'] != labels_key:
+            return None
+
+        ir_data = AnnotationIR()
+        ir_data.data = cache['data']
+        return ir_data
+
+    @staticmethod
+    def _save_job_cache(cache_path, ir_data, labels_key):
+        cache_dir = osp.dirname(cache_path)
+        with NamedTemporaryFile('w', dir=cache_dir, delete=False) as f:
+            json.dump({
+                'version': ir_data.version,
+                'labels': labels_key,
+                'data': ir_data.data,
+            }, f)
+        os.replace(f.name, cache_path)
+
+    def _load_jobs_from_cache(self, cache_dir, db_jobs, versions, labels_key):
+        jobs = OrderedDict()
+        for db_job in db_jobs:
+            jobs[db_job.id] = self._load_job_cache(
+                _get_job_cache_path(cache_dir, db_job.id),
+                versions.get(db_job.id, 0), labels_key)
+
+        changed_jobs = self._load_jobs_from_db(
+            [job_id for job_id, ir_data in jobs.items() if ir_data is None],
+            versions)
+        for job_id, ir_data in changed_jobs.items():
+            self._save_job_cache(_get_job_cache_path(cache_dir, job_id),
+                ir_data, labels_key)
+        jobs.update(changed_jobs)
+
+        return jobs
+
+    def init_from_cache(self, cache_dir, exporter=None):
+        """
+        Works like init_from_db, but keeps annotations of each job in
+        the cache directory. Only jobs which were changed after the previous
+        call (i.e. have a newer commit) are loaded from the DB.
+
+        If the exporter writes frame fragments, the jobs are not merged.
+        Fragments of the frames of each job are kept in the cache directory
+        too, and only annotations for outdated fragments are loaded.
+        """
+
+        self.reset()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        db_jobs = list(self.db_jobs.select_for_update())
+        labels_key = self._get_labels_key()
+        versions = self._get_job_versions()
+
+        # Fragments are defined by jobs only if the jobs don't overlap
+        if exporter is not None and exporter.FRAME_FRAGMENTS and \
+                all(db_prev_job.segment.stop_frame + 1 == \
+                    db_job.segment.start_frame
+                    for db_prev_job, db_job in zip(db_jobs, db_jobs[1:])):
+            self._init_frame_fragments(cache_dir, exporter.DISPLAY_NAME,
+                db_jobs, versions, labels_key)
+            return
+
+        jobs = self._load_jobs_from_cache(cache_dir, db_jobs,
+            versions, labels_key)
+        for db_job in db_jobs:
+            ir_data = jobs[db_job.id]
+            if ir_data.version > self.ir_data.version:
+                self.ir_data.version = ir_data.version
+            self._merge_data(ir_data, db_job.segment.start_frame,
+                self.db_task.overlap)
+
+    def _init_frame_fragments(self, cache_dir, format_name,
+            db_jobs, versions, labels_key):
+        # Without overlaps, annotations of a job are changed by the merge
+        # only by the previous job, which finishes its open tracks on
+        # the first frame of the job. So frames of the job are defined by
+        # the versions of both jobs.
+        fragment_paths = []
+        outdated = []
+        for idx, db_job in enumerate(db_jobs):
+            key = [format_name, labels_key, self.db_task.z_order,
+                versions.get(db_job.id, 0)]
+            if idx:
+                key.append(versions.get(db_jobs[idx - 1].id, 0))
+            path = _get_fragment_cache_path(cache_dir, db_job.id,
+                hashlib.md5(json.dumps(key).encode()).hexdigest())
+            fragment_paths.append(path)
+            try:
+                # The access time is used by the cache cleaning
+                os.utime(path, ns=(int(time.time() * 1e9),
+                    os.stat(path).st_mtime_ns))
+            except FileNotFoundError:
+                outdated.append(idx)
+
+        loaded_jobs = sorted(set(outdated) | \
+            set(idx - 1 for idx in outdated if idx))
+        jobs = self._load_jobs_from_cache(cache_dir,
+            [db_jobs[idx] for idx in loaded_jobs], versions, labels_key)
+
+        self.frame_fragments = []
+        for idx, db_job in enumerate(db_jobs):
+            ir_data = None
+            if idx in outdated:
+                # Annotations are merged like in the merge of all jobs
+                ir_data = type(self.ir_data)()
+                annotation_manager = AnnotationManager(ir_data)
+                for db_merged_job in db_jobs[max(0, idx - 1) : idx + 1]:
+                    annotation_manager.merge(
+                        AnnotationIR(deepcopy(jobs[db_merged_job.id].data)),
+                        db_merged_job.segment.start_frame, 0)
+                if idx + 1 < len(db_jobs):
+                    annotation_manager.merge(AnnotationIR(),
+                        db_jobs[idx + 1].segment.start_frame, 0)
+
+            self.frame_fragments.append(TaskData.FrameFragment(
+                start=db_job.segment.start_frame,
+                stop=db_job.segment.stop_frame,
+                path=fragment_paths[idx],
+                annotation_ir=ir_data,
+            ))
+
+        self.ir_data.version = max(versions.values(), default=0)
 
     def export(self, dst_file, exporter, host='', **options):
         task_data = TaskData(
             annotation_ir=self.ir_data,
             db_task=self.db_task,
             host=host,
+            frame_fragments=self.frame_fragments,
         )
         exporter(dst_file, task_data, **options)
 
+    def _import_batch(self, data):
+        # Saved objects are not merged into the task data,
+        # so the import takes memory only for the current batch
+        self._patch_data(data, PatchAction.CREATE, keep_data=False)
+
     def import_annotations(self, src_file, importer, **options):
         task_data = TaskData(
             annotation_ir=AnnotationIR(),
             db_task=self.db_task,
-            create_callback=self.create,
+            create_callback=self._import_batch,
         )
         self.delete()
+        self.reset()
 
         importer(src_file, task_data, **options)
 
-        self.create(task_data.data.serialize())
+        self._import_batch(task_data.data.serialize())
 
     @property
     def data(self):
@@ -637,12 +1058,22 @@ class TaskAnnotation:
 
 @silk_profile(name="GET job data")
 @transaction.atomic
-def get_job_data(pk):
+def get_job_data(pk, start_frame=None, stop_frame=None):
     annotation = JobAnnotation(pk)
-    annotation.init_from_db()
+    annotation.init_from_db(start_frame, stop_frame)
 
     return annotation.data
 
+@silk_profile(name="GET job data changes")
+@transaction.atomic
+def get_job_changes(pk, since_version):
+    annotation = JobAnnotation(pk)
+    deleted = annotation.init_changes_from_db(since_version)
+
+    data = annotation.data
+    data["deleted"] = deleted
+    return data
+
 @silk_profile(name="POST job data")
 @transaction.atomic
 def put_job_data(pk, data):
@@ -707,25 +1138,29 @@ def delete_task_data(pk):
     annotation.delete()
 
 def export_task(task_id, dst_file, format_name,
-        server_url=None, save_images=False):
+        server_url=None, save_images=False, cache_dir=None):
     # For big tasks dump function may run for a long time and
     # we dont need to acquire lock after the task has been initialized from DB.
     # But there is the bug with corrupted dump file in case 2 or
     # more dump request received at the same time:
     # https://github.com/opencv/cvat/issues/217
+    exporter = make_exporter(format_name)
     with transaction.atomic():
-        task = TaskAnnotation(task_id)
-        task.init_from_db()
+        task = TaskAnnotation(task_id,
+            columnar=settings.EXPORT_COLUMNAR_ANNOTATIONS)
+        if cache_dir:
+            task.init_from_cache(cache_dir, exporter)
+        else:
+            task.init_from_db()
 
-    exporter = make_exporter(format_name)
     with open(dst_file, 'wb') as f:
         task.export(f, exporter, host=server_url,
             save_images=save_images)
 
 @transaction.atomic
 def import_task_annotations(task_id, src_file, format_name):
+    # Existing annotations are replaced, so they are not loaded
     task = TaskAnnotation(task_id)
-    task.init_from_db()
 
     importer = make_importer(format_name)
     with open(src_file, 'rb') as f:
@@ -0,0 +1,225 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+# Benchmarks are not run by default. Use the following command to run them:
+# python manage.py test --pattern="_benchmark*.py" cvat/apps/dataset_manager/tests
+
+import time
+from copy import copy, deepcopy
+from unittest import TestCase
+
+import numpy as np
+from shapely import geometry
+
+from cvat.apps.dataset_manager.annotation import (AnnotationIR,
+    ObjectManager, ShapeManager, TrackManager)
+from cvat.apps.engine.models import ShapeType
+
+
+def normalize_shape(shape):
+    # The previous implementation, which uses shapely
+    points = list(shape["points"])
+    if len(points) == 2:
+        points.extend(points) # duplicate points for single point case
+    points = np.asarray(points).reshape(-1, 2)
+    broken_line = geometry.LineString(points)
+    points = []
+    for off in range(0, 100, 1):
+        p = broken_line.interpolate(off / 100, True)
+        points.append(p.x)
+        points.append(p.y)
+
+    shape = copy(shape)
+    shape["points"] = points
+
+    return shape
+
+def interpolate(shape0, shape1):
+    # The previous implementation, which processes frames one by one
+    shapes = []
+    is_same_type = shape0["type"] == shape1["type"]
+    is_polygon = shape0["type"] == ShapeType.POLYGON
+    is_polyline = shape0["type"] == ShapeType.POLYLINE
+    is_same_size = len(shape0["points"]) == len(shape1["points"])
+    if not is_same_type or is_polygon or is_polyline or not is_same_size:
+        shape0 = normalize_shape(shape0)
+        shape1 = normalize_shape(shape1)
+
+    distance = shape1["frame"] - shape0["frame"]
+    step = np.subtract(shape1["points"], shape0["points"]) / distance
+    for frame in range(shape0["frame"] + 1, shape1["frame"]):
+        off = frame - shape0["frame"]
+        if shape1["outside"]:
+            points = np.asarray(shape0["points"]).reshape(-1, 2)
+        else:
+            points = (shape0["points"] + step * off).reshape(-1, 2)
+        shape = deepcopy(shape0)
+        if len(points) == 1:
+            shape["points"] = points.flatten()
+        else:
+            broken_line = geometry.LineString(points).simplify(0.05, False)
+            shape["points"] = [x for p in broken_line.coords for x in p]
+
+        shape["keyframe"] = False
+        shape["frame"] = frame
+        shapes.append(shape)
+    return shapes
+
+def generate_track(shape_type, points, keyframe_step=50, keyframe_count=20):
+    shapes = []
+    for i in range(keyframe_count):
+        shapes.append({
+            "type": shape_type,
+            "occluded": False,
+            "z_order": 0,
+            "points": [p + 3 * i for p in points],
+            "id": None,
+            "frame": i * keyframe_step,
+            "outside": False,
+            "attributes": [{"spec_id": 1, "value": str(i)}],
+        })
+    return {
+        "id": None,
+        "frame": 0,
+        "label_id": 1,
+        "group": None,
+        "attributes": [],
+        "shapes": shapes,
+    }
+
+class TrackInterpolationBenchmark(TestCase):
+    TRACKS = [
+        ("rectangle", [10, 10, 50, 60]),
+        ("points", [10, 10]),
+        ("polygon", [10, 10, 50, 10, 60, 40, 30, 70, 5, 40]),
+        ("polyline", [0, 0, 20, 30, 40, 10, 70, 50]),
+    ]
+
+    def _interpolate(self, track, interpolate_fn):
+        shapes = []
+        prev_shape = None
+        for shape in track["shapes"]:
+            if prev_shape:
+                shapes.extend(interpolate_fn(prev_shape, shape))
+            prev_shape = shape
+        return shapes
+
+    def _interpolate_new(self, track):
+        track = deepcopy(track)
+        end_frame = track["shapes"][-1]["frame"]
+        return [s for s in TrackManager.get_interpolated_shapes(track,
+            0, end_frame) if not s["keyframe"]]
+
+    def _compare_shapes(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for expected_shape, actual_shape in zip(expected, actual):
+            self.assertEqual(expected_shape["frame"], actual_shape["frame"])
+            np.testing.assert_allclose(expected_shape["points"],
+                actual_shape["points"], atol=1e-6)
+
+    def test_interpolation(self):
+        for shape_type, points in self.TRACKS:
+            with self.subTest(type=shape_type):
+                track = generate_track(shape_type, points)
+
+                start = time.perf_counter()
+                expected = self._interpolate(track, interpolate)
+                old_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                actual = self._interpolate_new(track)
+                new_time = time.perf_counter() - start
+
+                print("\nInterpolation of a {} track ({} frames): "
+                    "per-frame {:.3f}s, vectorized {:.3f}s (x{:.2f})".format(
+                    shape_type, len(expected), old_time, new_time,
+                    old_time / new_time))
+
+                self._compare_shapes(expected, actual)
+
+class ShapeMergeBenchmark(TestCase):
+    BOX_COUNT = 600
+
+    def _generate_boxes(self, rng, count):
+        x = rng.uniform(0, 2000, count)
+        y = rng.uniform(0, 2000, count)
+        return [{"type": "rectangle", "frame": 0, "label_id": 1,
+                "points": [x0, y0, x0 + 40, y0 + 30]}
+            for x0, y0 in zip(x, y)]
+
+    def test_match_objects(self):
+        rng = np.random.RandomState(0)
+        old_shapes = self._generate_boxes(rng, self.BOX_COUNT)
+        int_shapes = [dict(shape, points=[p + 2 for p in shape["points"]])
+            for shape in old_shapes]
+        manager = ShapeManager(old_shapes)
+
+        start = time.perf_counter()
+        expected = ObjectManager._match_objects(manager,
+            int_shapes, old_shapes, 0, 0)
+        dense_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = manager._match_objects(int_shapes, old_shapes, 0, 0)
+        indexed_time = time.perf_counter() - start
+
+        print("\nMatching of {} boxes on a frame: cost matrix {:.2f}s, "
+            "spatial index {:.3f}s (x{:.2f})".format(self.BOX_COUNT,
+            dense_time, indexed_time, dense_time / indexed_time))
+
+        self.assertEqual(sorted(expected), sorted(actual))
+
+def slice_annotations(data, start, stop):
+    # The previous implementation, which scans and deep-copies objects
+    sliced = AnnotationIR()
+    sliced.tags = [deepcopy(t)
+        for t in data.tags if AnnotationIR._is_shape_inside(t, start, stop)]
+    sliced.shapes = [deepcopy(s)
+        for s in data.shapes if AnnotationIR._is_shape_inside(s, start, stop)]
+    sliced.tracks = [AnnotationIR._slice_track(deepcopy(t), start, stop)
+        for t in data.tracks if AnnotationIR._is_track_inside(t, start, stop)]
+    return sliced
+
+class AnnotationSliceBenchmark(TestCase):
+    FRAME_COUNT = 5000
+    SEGMENT_SIZE = 100
+    SHAPES_PER_FRAME = 20
+
+    def _generate_data(self):
+        data = AnnotationIR()
+        for frame in range(self.FRAME_COUNT):
+            for i in range(self.SHAPES_PER_FRAME):
+                data.add_shape({"type": "rectangle", "frame": frame,
+                    "label_id": 1, "group": None, "occluded": False,
+                    "z_order": 0, "points": [i, i, i + 10, i + 10],
+                    "attributes": [{"spec_id": 1, "value": str(i)}]})
+        for start in range(0, self.FRAME_COUNT, 25):
+            data.add_track(generate_track("rectangle", [10, 10, 50, 60],
+                keyframe_step=10, keyframe_count=10))
+            for shape in data.tracks[-1]["shapes"]:
+                shape["frame"] += start
+            data.tracks[-1]["shapes"][-1]["outside"] = True
+        return data
+
+    def test_slice(self):
+        data = self._generate_data()
+        segments = [(start, start + self.SEGMENT_SIZE - 1)
+            for start in range(0, self.FRAME_COUNT, self.SEGMENT_SIZE)]
+
+        start_time = time.perf_counter()
+        expected = [slice_annotations(data, start, stop)
+            for start, stop in segments]
+        old_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        actual = [data.slice(start, stop) for start, stop in segments]
+        new_time = time.perf_counter() - start_time
+
+        print("\nSlicing of {} shapes and {} tracks into {} segments: "
+            "scan {:.2f}s, index {:.3f}s (x{:.2f})".format(
+            len(data.shapes), len(data.tracks), len(segments),
+            old_time, new_time, old_time / new_time))
+
+        for expected_part, actual_part in zip(expected, actual):
+            self.assertEqual(expected_part.data, actual_part.data)
@@ -0,0 +1,115 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+# Benchmarks are not run by default. Use the following command to run them:
+# python manage.py test --pattern="_benchmark*.py" cvat/apps/dataset_manager/tests
+
+import time
+
+from django.test import TestCase
+
+from cvat.apps.dataset_manager.annotation import AnnotationIR
+from cvat.apps.dataset_manager.bindings import TaskData
+from cvat.apps.engine import models
+
+
+class LinearLookupTaskData(TaskData):
+    # The previous implementation, which scans labels and attributes
+
+    def _get_label_id(self, label_name):
+        for db_label in self._label_mapping.values():
+            if label_name == db_label.name:
+                return db_label.id
+        return None
+
+    def _get_attribute_name(self, attribute_id):
+        for attribute_mapping in self._attribute_mapping.values():
+            for attribute_type in ['mutable', 'immutable']:
+                if attribute_id in attribute_mapping[attribute_type]:
+                    return attribute_mapping[attribute_type][attribute_id]
+
+    def _get_attribute_id(self, label_id, attribute_name, attribute_type=None):
+        attribute_types = [attribute_type] if attribute_type \
+            else ['mutable', 'immutable']
+        for attribute_type in attribute_types:
+            container = self._attribute_mapping[label_id][attribute_type]
+            for attr_id, attr_name in container.items():
+                if attribute_name == attr_name:
+                    return attr_id
+        return None
+
+def generate_task(label_count, attribute_count, frame_count=10):
+    db_data = models.Data.objects.create(size=frame_count,
+        stop_frame=frame_count - 1)
+    models.Image.objects.bulk_create(
+        models.Image(data=db_data, path='frame_{}.jpg'.format(frame),
+            frame=frame, width=100, height=100)
+        for frame in range(frame_count))
+    db_task = models.Task.objects.create(name='benchmark', mode='annotation',
+        overlap=0, segment_size=frame_count, data=db_data)
+    db_segment = models.Segment.objects.create(task=db_task,
+        start_frame=0, stop_frame=frame_count - 1)
+    models.Job.objects.create(segment=db_segment)
+
+    models.Label.objects.bulk_create(
+        models.Label(task=db_task, name='label_{}'.format(i))
+        for i in range(label_count))
+    models.AttributeSpec.objects.bulk_create(
+        models.AttributeSpec(label=db_label, name='attr_{}'.format(i),
+            mutable=bool(i % 2), input_type='text', default_value='',
+            values='')
+        for db_label in db_task.label_set.all()
+        for i in range(attribute_count))
+
+    return db_task
+
+class TaskDataLookupBenchmark(TestCase):
+    LABEL_COUNT = 300
+    ATTRIBUTE_COUNT = 30
+    SHAPE_COUNT = 10000
+
+    def _generate_shapes(self, task_data):
+        return [task_data.LabeledShape(type='rectangle', frame=i % 10,
+                label='label_{}'.format(self.LABEL_COUNT - 1 - i % 10),
+                points=[0, 0, 10, 10], occluded=False, group=0, z_order=0,
+                attributes=[task_data.Attribute(name='attr_{}'.format(j),
+                    value=str(i)) for j in range(self.ATTRIBUTE_COUNT)])
+            for i in range(self.SHAPE_COUNT)]
+
+    def _run(self, task_data_class, db_task):
+        task_data = task_data_class(annotation_ir=AnnotationIR(),
+            db_task=db_task)
+        shapes = self._generate_shapes(task_data)
+
+        start = time.perf_counter()
+        for shape in shapes:
+            task_data.add_shape(shape)
+        import_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        exported = [task_data._export_labeled_shape(shape)
+            for shape in task_data.data.shapes]
+        export_time = time.perf_counter() - start
+
+        return import_time, export_time, task_data.data.shapes, exported
+
+    def test_lookups(self):
+        db_task = generate_task(self.LABEL_COUNT, self.ATTRIBUTE_COUNT)
+
+        old_import, old_export, old_shapes, old_exported = self._run(
+            LinearLookupTaskData, db_task)
+        new_import, new_export, new_shapes, new_exported = self._run(
+            TaskData, db_task)
+
+        print("\nImport of {} shapes with {} labels of {} attributes: "
+            "scan {:.2f}s, dict {:.2f}s (x{:.2f})".format(self.SHAPE_COUNT,
+            self.LABEL_COUNT, self.ATTRIBUTE_COUNT, old_import, new_import,
+            old_import / new_import))
+        print("Export of {} shapes with {} labels of {} attributes: "
+            "scan {:.2f}s, dict {:.2f}s (x{:.2f})".format(self.SHAPE_COUNT,
+            self.LABEL_COUNT, self.ATTRIBUTE_COUNT, old_export, new_export,
+            old_export / new_export))
+
+        self.assertEqual(old_shapes, new_shapes)
+        self.assertEqual(old_exported, new_exported)
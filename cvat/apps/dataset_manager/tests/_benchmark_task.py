@@ -0,0 +1,163 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+# Benchmarks are not run by default. Use the following command to run them:
+# python manage.py test --pattern="_benchmark*.py" cvat/apps/dataset_manager/tests
+
+import json
+import time
+
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from cvat.apps.dataset_manager.task import (JobAnnotation, TaskAnnotation,
+    bulk_create)
+from cvat.apps.engine import models
+
+
+def generate_task(job_count, segment_size=10, shapes_per_job=20):
+    db_task = models.Task.objects.create(name='benchmark', mode='annotation',
+        overlap=0, segment_size=segment_size)
+    db_label = models.Label.objects.create(task=db_task, name='car')
+    db_attr = models.AttributeSpec.objects.create(label=db_label,
+        name='model', mutable=False, input_type='select',
+        default_value='mazda', values='bmw\nmazda')
+    db_mutable_attr = models.AttributeSpec.objects.create(label=db_label,
+        name='parked', mutable=True, input_type='checkbox',
+        default_value='false', values='false\ntrue')
+
+    models.Segment.objects.bulk_create(
+        models.Segment(task=db_task, start_frame=i * segment_size,
+            stop_frame=(i + 1) * segment_size - 1)
+        for i in range(job_count))
+    db_segments = list(models.Segment.objects.filter(task=db_task) \
+        .order_by('id'))
+    models.Job.objects.bulk_create(models.Job(segment=db_segment)
+        for db_segment in db_segments)
+    db_jobs = list(models.Job.objects.filter(segment__task=db_task) \
+        .select_related('segment').order_by('id'))
+
+    models.LabeledImage.objects.bulk_create(
+        models.LabeledImage(job=db_job, label=db_label,
+            frame=db_job.segment.start_frame)
+        for db_job in db_jobs)
+    models.LabeledShape.objects.bulk_create(
+        models.LabeledShape(job=db_job, label=db_label,
+            frame=db_job.segment.start_frame + i % segment_size,
+            type=models.ShapeType.RECTANGLE, points=[i, i, i + 10, i + 10])
+        for db_job in db_jobs for i in range(shapes_per_job))
+    models.LabeledShapeAttributeVal.objects.bulk_create(
+        models.LabeledShapeAttributeVal(shape=db_shape, spec=db_attr,
+            value='bmw')
+        for db_shape in models.LabeledShape.objects \
+            .filter(job__segment__task=db_task)[::2])
+    models.LabeledTrack.objects.bulk_create(
+        models.LabeledTrack(job=db_job, label=db_label,
+            frame=db_job.segment.start_frame)
+        for db_job in db_jobs)
+    db_tracks = models.LabeledTrack.objects.filter(job__segment__task=db_task) \
+        .select_related('job__segment')
+    models.TrackedShape.objects.bulk_create(
+        models.TrackedShape(track=db_track,
+            frame=db_track.job.segment.start_frame + i,
+            type=models.ShapeType.RECTANGLE, points=[i, i, i + 10, i + 10],
+            outside=(i == 2))
+        for db_track in db_tracks for i in range(3))
+    models.TrackedShapeAttributeVal.objects.bulk_create(
+        models.TrackedShapeAttributeVal(shape=db_shape, spec=db_mutable_attr,
+            value='true')
+        for db_shape in models.TrackedShape.objects \
+            .filter(track__job__segment__task=db_task, frame__gt=0))
+    models.JobCommit.objects.bulk_create(
+        models.JobCommit(job=db_job, version=1)
+        for db_job in db_jobs)
+
+    return db_task
+
+def init_from_db_by_jobs(annotation):
+    # The previous implementation, which loads each job separately
+    for db_job in annotation.db_jobs:
+        job_annotation = JobAnnotation(db_job.id)
+        job_annotation.init_from_db()
+        if job_annotation.ir_data.version > annotation.ir_data.version:
+            annotation.ir_data.version = job_annotation.ir_data.version
+        annotation._merge_data(job_annotation.ir_data,
+            db_job.segment.start_frame, annotation.db_task.overlap)
+
+def bulk_create_by_exclude(db_model, objects, flt_param):
+    # The previous implementation for backends other than PostgreSQL
+    ids = list(db_model.objects.filter(**flt_param).values_list('id', flat=True))
+    db_model.objects.bulk_create(objects)
+
+    return list(db_model.objects.exclude(id__in=ids).filter(**flt_param))
+
+class TaskAnnotationLoadingBenchmark(TestCase):
+    JOB_COUNT = 500
+
+    def _load(self, task_id, init):
+        with transaction.atomic(), \
+                CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            annotation = TaskAnnotation(task_id)
+            init(annotation)
+            elapsed = time.perf_counter() - start
+        return elapsed, len(queries), json.loads(json.dumps(annotation.data))
+
+    def test_batched_loading(self):
+        db_task = generate_task(self.JOB_COUNT)
+
+        jobs_time, jobs_queries, jobs_data = self._load(db_task.id,
+            init_from_db_by_jobs)
+        batched_time, batched_queries, batched_data = self._load(db_task.id,
+            TaskAnnotation.init_from_db)
+
+        print("\nLoading of a task with {} jobs: by jobs {:.2f}s "
+            "({} queries), batched {:.2f}s ({} queries, x{:.2f})".format(
+            self.JOB_COUNT, jobs_time, jobs_queries,
+            batched_time, batched_queries, jobs_time / batched_time))
+
+        self.assertEqual(jobs_data, batched_data)
+
+class BulkCreateBenchmark(TestCase):
+    EXISTING_SHAPES = 100000
+    NEW_SHAPES = 1000
+
+    def _save(self, db_job, db_label, create):
+        db_shapes = [models.LabeledShape(job=db_job, label=db_label,
+                frame=0, type=models.ShapeType.RECTANGLE, points=[i, 0, 1, 1])
+            for i in range(self.NEW_SHAPES)]
+
+        with transaction.atomic(), \
+                CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            db_shapes = create(models.LabeledShape, db_shapes,
+                {"job_id": db_job.id})
+            elapsed = time.perf_counter() - start
+
+        return elapsed, len(queries), db_shapes
+
+    def test_bulk_create(self):
+        db_task = generate_task(1, shapes_per_job=self.EXISTING_SHAPES)
+        db_job = models.Job.objects.get(segment__task=db_task)
+        db_label = db_task.label_set.first()
+
+        old_time, old_queries, old_shapes = self._save(db_job, db_label,
+            bulk_create_by_exclude)
+        new_time, new_queries, new_shapes = self._save(db_job, db_label,
+            bulk_create)
+
+        print("\nSaving of {} shapes to a job with {} shapes: "
+            "by exclude {:.3f}s ({} queries), with ids {:.3f}s "
+            "({} queries, x{:.2f})".format(self.NEW_SHAPES,
+            self.EXISTING_SHAPES, old_time, old_queries,
+            new_time, new_queries, old_time / new_time))
+
+        self.assertEqual(self.NEW_SHAPES, len(old_shapes))
+        self.assertEqual(self.NEW_SHAPES, len(new_shapes))
+        saved_shapes = models.LabeledShape.objects.in_bulk(
+            [db_shape.id for db_shape in new_shapes])
+        for db_shape in new_shapes:
+            self.assertEqual(db_shape.points,
+                saved_shapes[db_shape.id].points)
@@ -61,10 +61,14 @@ def _setUpModule():
     # _GitImportFix.restore()
 
 from io import BytesIO
+import json
+import os
 import os.path as osp
 import random
+import re
 import tempfile
 import zipfile
+from unittest import mock
 
 from PIL import Image
 from django.contrib.auth.models import User, Group
@@ -231,13 +235,13 @@ class TaskExportTest(APITestCase):
         self._put_api_v1_task_id_annotations(task["id"], annotations)
         return annotations
 
-    def _generate_task(self):
+    def _generate_task(self, segment_size=100, size=3):
         task = {
             "name": "my task #1",
             "owner": '',
             "assignee": '',
             "overlap": 0,
-            "segment_size": 100,
+            "segment_size": segment_size,
             "z_order": False,
             "labels": [
                 {
@@ -261,7 +265,7 @@ class TaskExportTest(APITestCase):
                 {"name": "person"},
             ]
         }
-        return self._create_task(task, 3)
+        return self._create_task(task, size)
 
     def _create_task(self, data, size):
         with ForceLogin(self.user, self.client):
@@ -385,3 +389,176 @@ class TaskExportTest(APITestCase):
                     self.assertEqual(len(dataset), task["size"])
                 self._test_export(check, task, format_name, save_images=False)
 
+
+    def test_can_reuse_cached_job_annotations(self):
+        def get_task_data(task_id, cache_dir=None):
+            annotation = dm.task.TaskAnnotation(task_id)
+            if cache_dir:
+                annotation.init_from_cache(cache_dir)
+            else:
+                annotation.init_from_db()
+            return json.loads(json.dumps(annotation.data))
+
+        task = self._generate_task(segment_size=2, size=4)
+        self._put_api_v1_task_id_annotations(task["id"], {
+            "version": 0,
+            "tags": [{
+                "frame": frame,
+                "label_id": task["labels"][0]["id"],
+                "group": None,
+                "attributes": [],
+            } for frame in range(task["size"])],
+            "shapes": [{
+                "frame": frame,
+                "label_id": task["labels"][1]["id"],
+                "group": None,
+                "attributes": [],
+                "points": [1.0, 2.1, 100, 300.222],
+                "type": "rectangle",
+                "occluded": False,
+            } for frame in range(task["size"])],
+            "tracks": [],
+        })
+        jobs = list(dm.task.TaskAnnotation(task["id"]).db_jobs)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.assertEqual(get_task_data(task["id"]),
+                get_task_data(task["id"], cache_dir))
+            cache_files = {job.id: osp.join(cache_dir, '{}.json'.format(job.id))
+                for job in jobs}
+            mtimes = {job_id: os.stat(path).st_mtime_ns
+                for job_id, path in cache_files.items()}
+
+            changed_job = jobs[len(jobs) - 1]
+            dm.task.patch_job_data(changed_job.id, {
+                "version": 0,
+                "tags": [{
+                    "frame": changed_job.segment.start_frame,
+                    "label_id": task["labels"][1]["id"],
+                    "group": None,
+                    "attributes": [],
+                }],
+                "shapes": [],
+                "tracks": [],
+            }, dm.task.PatchAction.CREATE)
+
+            self.assertEqual(get_task_data(task["id"]),
+                get_task_data(task["id"], cache_dir))
+            for job_id, path in cache_files.items():
+                if job_id == changed_job.id:
+                    self.assertNotEqual(mtimes[job_id], os.stat(path).st_mtime_ns)
+                else:
+                    self.assertEqual(mtimes[job_id], os.stat(path).st_mtime_ns)
+
+    def test_can_invalidate_and_clean_cached_job_annotations(self):
+        task = self._generate_task(segment_size=2, size=4)
+        self._generate_annotations(task)
+        jobs = list(dm.task.TaskAnnotation(task["id"]).db_jobs)
+        cache_dir = dm.task.get_job_cache_dir(jobs[0].segment.task)
+        cache_files = [osp.join(cache_dir, '{}.json'.format(job.id))
+            for job in jobs]
+
+        dm.task.TaskAnnotation(task["id"]).init_from_cache(cache_dir)
+        self.assertTrue(all(osp.isfile(path) for path in cache_files))
+
+        dm.task.delete_job_data(jobs[0].id)
+        self.assertFalse(osp.exists(cache_files[0]))
+        self.assertTrue(osp.isfile(cache_files[1]))
+
+        dm.task.TaskAnnotation(task["id"]).init_from_cache(cache_dir)
+        os.utime(cache_files[0], (0, 0))
+        dm.views.clear_job_cache(task["id"], cache_dir)
+        self.assertFalse(osp.exists(cache_files[0]))
+        self.assertTrue(osp.isfile(cache_files[1]))
+
+    def test_can_reuse_cached_frame_fragments(self):
+        def export(task_id, cache_dir=None):
+            with tempfile.TemporaryDirectory() as temp_dir:
+                file_path = osp.join(temp_dir, 'annotations.zip')
+                dm.task.export_task(task_id, file_path, 'CVAT for images 1.1',
+                    cache_dir=cache_dir)
+                with zipfile.ZipFile(file_path) as archive:
+                    annotations = archive.read('annotations.xml').decode()
+            return re.sub('<dumped>.*</dumped>', '', annotations)
+
+        def get_fragment_mtimes(cache_dir):
+            return {entry.name: entry.stat().st_mtime_ns
+                for entry in os.scandir(cache_dir)
+                if entry.name.endswith('.fragment')}
+
+        task = self._generate_task(segment_size=2, size=6)
+        self._generate_annotations(task)
+        jobs = list(dm.task.TaskAnnotation(task["id"]).db_jobs)
+        # Open tracks of a job are finished on the first frame of the next job
+        dm.task.patch_job_data(jobs[0].id, {
+            "version": 0,
+            "tags": [],
+            "shapes": [],
+            "tracks": [{
+                "frame": 0,
+                "label_id": task["labels"][1]["id"],
+                "group": None,
+                "attributes": [],
+                "shapes": [{
+                    "frame": 0,
+                    "attributes": [],
+                    "points": [1.0, 2.0, 30.0, 4.0, 5.0, 60.0],
+                    "type": "polygon",
+                    "occluded": False,
+                    "outside": False,
+                }],
+            }],
+        }, dm.task.PatchAction.CREATE)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.assertEqual(export(task["id"]), export(task["id"], cache_dir))
+            mtimes = get_fragment_mtimes(cache_dir)
+            self.assertEqual(len(jobs), len(mtimes))
+
+            dm.task.patch_job_data(jobs[1].id, {
+                "version": 0,
+                "tags": [{
+                    "frame": jobs[1].segment.start_frame,
+                    "label_id": task["labels"][1]["id"],
+                    "group": None,
+                    "attributes": [],
+                }],
+                "shapes": [],
+                "tracks": [],
+            }, dm.task.PatchAction.CREATE)
+
+            self.assertEqual(export(task["id"]), export(task["id"], cache_dir))
+            # Fragments of the changed job and the next one are updated
+            updated_mtimes = get_fragment_mtimes(cache_dir)
+            self.assertEqual(len(jobs) + 2, len(updated_mtimes))
+            self.assertEqual(mtimes, { name: mtime
+                for name, mtime in updated_mtimes.items() if name in mtimes })
+
+            self.assertEqual(export(task["id"]), export(task["id"], cache_dir))
+            self.assertEqual(updated_mtimes, get_fragment_mtimes(cache_dir))
+
+    def test_can_import_annotations_by_batches(self):
+        def get_object_counts(task_id):
+            data = dm.task.get_task_data(task_id)
+            return (len(data["tags"]), len(data["shapes"]),
+                [len(track["shapes"]) for track in data["tracks"]])
+
+        task = self._generate_task(segment_size=2, size=3)
+        self._generate_annotations(task)
+        expected = get_object_counts(task["id"])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = osp.join(temp_dir, 'annotations.zip')
+            dm.task.export_task(task["id"], file_path, 'CVAT for video 1.1')
+
+            dm.task.import_task_annotations(task["id"], file_path, 'CVAT 1.1')
+            imported = get_object_counts(task["id"])
+
+            with mock.patch.object(dm.bindings.TaskData, '_MAX_ANNO_SIZE', 1):
+                dm.task.import_task_annotations(task["id"], file_path,
+                    'CVAT 1.1')
+            self.assertEqual(imported, get_object_counts(task["id"]))
+
+        # Shapes are exported as tracks in this format,
+        # tracks can be split by jobs
+        self.assertLessEqual(expected[1] + len(expected[2]), len(imported[2]))
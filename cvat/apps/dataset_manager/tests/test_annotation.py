@@ -2,9 +2,14 @@
 #
 # SPDX-License-Identifier: MIT
 
-from cvat.apps.dataset_manager.annotation import TrackManager
+from cvat.apps.dataset_manager.annotation import (AnnotationIR,
+    AnnotationManager, ColumnarAnnotationIR, IntervalIndex, ObjectManager,
+    ShapeColumns, ShapeManager, TrackColumns, TrackManager)
 
-from unittest import TestCase
+from copy import deepcopy
+from unittest import TestCase, mock
+
+import numpy as np
 
 
 class TrackManagerTest(TestCase):
@@ -36,4 +41,362 @@ class TrackManagerTest(TestCase):
 
         interpolated = TrackManager.get_interpolated_shapes(track, 0, 2)
 
-        self.assertEqual(len(interpolated), 3)
\ No newline at end of file
+        self.assertEqual(len(interpolated), 3)
+
+    def test_normalize_shape(self):
+        shape = { "type": "polyline", "points": [0, 0, 10, 0, 10, 10] }
+
+        points = TrackManager.normalize_shape(shape)["points"]
+
+        self.assertEqual(200, len(points))
+        self.assertEqual([0, 0], points[0:2])
+        self.assertEqual([5, 0], points[50:52])
+        self.assertEqual([10, 0], points[100:102])
+        self.assertEqual([10, 5], points[150:152])
+
+    def test_polygon_interpolation(self):
+        track = {
+            "frame": 0,
+            "label_id": 0,
+            "group": None,
+            "attributes": [],
+            "shapes": [
+                {
+                    "frame": 0,
+                    "points": [0, 0, 10, 0, 10, 10, 0, 10],
+                    "type": "polygon",
+                    "occluded": False,
+                    "outside": False,
+                    "attributes": [{"spec_id": 1, "value": "a"}]
+                },
+                {
+                    "frame": 4,
+                    "points": [4, 4, 14, 4, 14, 14, 4, 14],
+                    "type": "polygon",
+                    "occluded": False,
+                    "outside": False,
+                    "attributes": []
+                },
+            ]
+        }
+
+        interpolated = TrackManager.get_interpolated_shapes(track, 0, 4)
+
+        self.assertEqual([0, 1, 2, 3, 4], [s["frame"] for s in interpolated])
+        self.assertEqual([2, 2, 11.9, 2], interpolated[2]["points"][:4])
+        self.assertEqual([{"spec_id": 1, "value": "a"}],
+            interpolated[2]["attributes"])
+        self.assertIsNot(interpolated[1]["attributes"],
+            interpolated[2]["attributes"])
+
+class TagManagerTest(TestCase):
+    @staticmethod
+    def _generate_tags(start, stop):
+        return [{"id": None, "frame": frame, "label_id": 1, "group": None,
+            "attributes": []} for frame in range(start, stop + 1)]
+
+    def test_can_merge_tags_on_overlapped_frames(self):
+        segments = [(0, 9), (8, 17)]
+        overlap = 2
+
+        for ir_class in [AnnotationIR, ColumnarAnnotationIR]:
+            with self.subTest(ir=ir_class.__name__):
+                ir = ir_class()
+                for start, stop in segments:
+                    data = {"version": 0, "tags": self._generate_tags(start, stop),
+                        "shapes": [], "tracks": []}
+                    AnnotationManager(ir).merge(AnnotationIR(data),
+                        start, overlap)
+
+                self.assertEqual(list(range(18)),
+                    sorted(tag["frame"] for tag in ir.data["tags"]))
+
+class ColumnarAnnotationIRTest(TestCase):
+    def _round_points(self, data):
+        # Points are kept with float32 precision
+        if isinstance(data, dict):
+            return { k: [round(float(p), 3) for p in v] if k == 'points'
+                else self._round_points(v) for k, v in data.items() }
+        elif isinstance(data, list):
+            return [self._round_points(v) for v in data]
+        return data
+
+    def _compare_data(self, expected, actual):
+        self.assertEqual(self._round_points(expected),
+            self._round_points(actual))
+
+    @staticmethod
+    def _generate_annotations(start, stop):
+        # Coordinates are exactly representable as float32
+        def shape(frame, offset, **kwargs):
+            shape = {
+                "type": "rectangle",
+                "occluded": False,
+                "z_order": frame % 3,
+                "points": [offset + 0.5, offset, offset + 10.25, offset + 20],
+                "id": None,
+                "frame": frame,
+                "attributes": [{"spec_id": 1, "value": str(frame)}],
+            }
+            shape.update(kwargs)
+            return shape
+
+        return {
+            "version": 1,
+            "tags": [
+                {"id": None, "frame": start, "label_id": 1, "group": None,
+                    "attributes": []},
+            ],
+            "shapes": [
+                shape(frame, 0, label_id=1, group=None)
+                for frame in range(start, stop + 1)
+            ] + [
+                shape(start, 30, label_id=2, group=1, type="polygon",
+                    points=[1, 2, 3, 4.5, 5, 6]),
+                shape(stop, 40, label_id=2, group=None, type="points",
+                    points=[7.5, 8]),
+            ],
+            "tracks": [
+                {
+                    "id": None, "frame": start, "label_id": 1, "group": None,
+                    "attributes": [{"spec_id": 2, "value": "car"}],
+                    "shapes": [
+                        shape(start, 0, outside=False),
+                        shape(stop, 4, outside=False),
+                    ],
+                },
+                {
+                    "id": None, "frame": start + 1, "label_id": 2, "group": 2,
+                    "attributes": [],
+                    "shapes": [
+                        shape(start + 1, 100, type="polyline",
+                            points=[1, 1, 2, 2, 3, 3], outside=False),
+                        shape(start + 3, 100, type="polyline",
+                            points=[5, 5, 7, 7], outside=True),
+                    ],
+                },
+            ],
+        }
+
+    def test_can_convert_to_dicts(self):
+        data = self._generate_annotations(0, 5)
+
+        ir = ColumnarAnnotationIR(deepcopy(data))
+
+        self.assertEqual(data, ir.data)
+
+    def test_can_slice(self):
+        data = self._generate_annotations(0, 10)
+
+        expected = AnnotationIR(deepcopy(data)).slice(2, 6)
+        actual = ColumnarAnnotationIR(deepcopy(data)).slice(2, 6)
+
+        self._compare_data(expected.data, actual.data)
+
+    def test_can_merge_and_convert_to_shapes(self):
+        segments = [(0, 9), (8, 17), (16, 25)]
+        overlap = 2
+
+        expected = AnnotationIR()
+        actual = ColumnarAnnotationIR()
+        for start, stop in segments:
+            data = self._generate_annotations(start, stop)
+            AnnotationManager(expected).merge(AnnotationIR(deepcopy(data)),
+                start, overlap)
+            AnnotationManager(actual).merge(AnnotationIR(deepcopy(data)),
+                start, overlap)
+
+        self.assertEqual(len(expected.shapes), len(actual.shapes))
+        self.assertEqual(len(expected.tracks), len(actual.tracks))
+        # Interpolated shapes are cached during the merge for shorter
+        # frame ranges, they should be computed again
+        for track in expected.tracks:
+            track.pop("interpolated_shapes", None)
+        self._compare_data(
+            AnnotationManager(expected).to_shapes(30),
+            AnnotationManager(actual).to_shapes(30))
+
+    def test_can_merge_without_copying_columns(self):
+        segments = [(start, start + 9) for start in range(0, 60, 8)]
+        overlap = 2
+
+        expected = AnnotationIR()
+        actual = ColumnarAnnotationIR()
+        with mock.patch.object(ShapeColumns, 'concat',
+                    wraps=ShapeColumns.concat) as shapes_concat, \
+                mock.patch.object(TrackColumns, 'concat',
+                    wraps=TrackColumns.concat) as tracks_concat:
+            for start, stop in segments:
+                data = self._generate_annotations(start, stop)
+                AnnotationManager(expected).merge(AnnotationIR(deepcopy(data)),
+                    start, overlap)
+                AnnotationManager(actual).merge(AnnotationIR(deepcopy(data)),
+                    start, overlap)
+        self.assertEqual(0, shapes_concat.call_count)
+        self.assertEqual(0, tracks_concat.call_count)
+
+        for track in expected.tracks:
+            track.pop("interpolated_shapes", None)
+        self._compare_data(
+            AnnotationManager(expected).to_shapes(70),
+            AnnotationManager(actual).to_shapes(70))
+
+class IntervalIndexTest(TestCase):
+    def test_can_find_intervals(self):
+        rng = np.random.RandomState(0)
+        starts = rng.randint(0, 100, 200)
+        intervals = [(int(s), int(s + l)) for s, l in
+            zip(starts, rng.randint(0, 20, len(starts)))]
+        intervals.append((50, float("inf")))
+        index = IntervalIndex(intervals)
+
+        for start, stop in [(0, 0), (10, 15), (40, 200), (99, 99), (300, 400)]:
+            with self.subTest(range=(start, stop)):
+                expected = [idx for idx, (a, b) in enumerate(intervals)
+                    if a <= stop and start <= b]
+                self.assertEqual(expected, index.find(start, stop))
+
+class AnnotationIRTest(TestCase):
+    @staticmethod
+    def _generate_data():
+        data = ColumnarAnnotationIRTest._generate_annotations(0, 30)
+        long_track = deepcopy(data["tracks"][0])
+        long_track["shapes"][1]["frame"] = 12
+        long_track["shapes"][1]["outside"] = True
+        long_track["shapes"].append(dict(long_track["shapes"][0], frame=20))
+        data["tracks"].append(long_track)
+        data["shapes"].reverse()
+        return data
+
+    def test_can_slice(self):
+        data = self._generate_data()
+        ir = AnnotationIR(deepcopy(data))
+
+        for start, stop in [(0, 9), (8, 17), (11, 13), (16, 25), (24, 30)]:
+            with self.subTest(segment=(start, stop)):
+                expected = {
+                    "tags": [t for t in data["tags"]
+                        if start <= t["frame"] <= stop],
+                    "shapes": [s for s in data["shapes"]
+                        if start <= s["frame"] <= stop],
+                    "tracks": [AnnotationIR._slice_track(t, start, stop)
+                        for t in data["tracks"]
+                        if AnnotationIR._is_track_inside(t, start, stop)],
+                }
+
+                actual = ir.slice(start, stop)
+
+                for field in expected:
+                    self.assertEqual(expected[field], actual[field])
+
+        for field in ["tags", "shapes", "tracks"]:
+            self.assertEqual(data[field], ir[field])
+
+    def test_can_update_index_on_changes(self):
+        ir = AnnotationIR(self._generate_data())
+        self.assertEqual(1, len(ir.slice(5, 5).shapes))
+
+        ir.add_shape(dict(ir.shapes[0], frame=5))
+        self.assertEqual(2, len(ir.slice(5, 5).shapes))
+
+        ir.shapes = []
+        self.assertEqual(0, len(ir.slice(5, 5).shapes))
+
+    def test_can_update_index_on_changes_in_place(self):
+        ir = AnnotationIR(self._generate_data())
+        shapes = ir.slice(5, 5).shapes
+        self.assertEqual(1, len(shapes))
+
+        ir.shapes[0]["frame"] = 5
+        self.assertEqual(2, len(ir.slice(5, 5).shapes))
+
+        ir.shapes[0] = dict(ir.shapes[0], frame=6)
+        self.assertEqual(shapes, ir.slice(5, 5).shapes)
+
+        self.assertNotEqual([], ir.slice(0, 99).tracks)
+        for track in ir.tracks:
+            for shape in track["shapes"]:
+                shape["frame"] += 100
+        self.assertEqual([], ir.slice(0, 99).tracks)
+
+    def test_can_split_like_slice(self):
+        data = self._generate_data()
+        segments = [(0, 9), (8, 17), (16, 25), (24, 30)]
+        ir = AnnotationIR(deepcopy(data))
+
+        parts = ir.split(segments)
+
+        self.assertEqual(len(segments), len(parts))
+        for (start, stop), part in zip(segments, parts):
+            with self.subTest(segment=(start, stop)):
+                self.assertEqual(ir.slice(start, stop).data, part.data)
+        for field in ["tags", "shapes", "tracks"]:
+            self.assertEqual(data[field], ir[field])
+
+class AnnotationManagerTest(TestCase):
+    def _get_expected_shapes_by_frame(self, data, end_frame):
+        shapes = AnnotationManager(AnnotationIR(deepcopy(data))) \
+            .to_shapes(end_frame)
+        shapes_by_frame = {}
+        for shape in sorted(shapes, key=lambda s: s.get("z_order", 0)):
+            shapes_by_frame.setdefault(shape["frame"], []).append(shape)
+        return sorted(shapes_by_frame.items())
+
+    def test_can_iterate_shapes_by_frame(self):
+        data = ColumnarAnnotationIRTest._generate_annotations(0, 10)
+        expected = self._get_expected_shapes_by_frame(data, 15)
+
+        actual = list(AnnotationManager(AnnotationIR(deepcopy(data))) \
+            .iter_shapes_by_frame(15))
+
+        self.assertEqual(expected, actual)
+
+    def test_can_iterate_columnar_shapes_by_frame(self):
+        data = ColumnarAnnotationIRTest._generate_annotations(0, 10)
+        expected = self._get_expected_shapes_by_frame(data, 15)
+
+        actual = list(AnnotationManager(ColumnarAnnotationIR(deepcopy(data))) \
+            .iter_shapes_by_frame(15))
+
+        self.assertEqual(expected, actual)
+
+
+class ShapeManagerTest(TestCase):
+    @staticmethod
+    def _generate_boxes(count, seed=0):
+        rng = np.random.RandomState(seed)
+        shapes = []
+        for x, y, w, h, label in zip(rng.uniform(0, 1000, count),
+                rng.uniform(0, 1000, count), rng.uniform(5, 50, count),
+                rng.uniform(5, 50, count), rng.randint(1, 3, count)):
+            shapes.append({
+                "type": "rectangle", "frame": 0, "label_id": int(label),
+                "points": [x, y, x + w, y + h],
+            })
+        return shapes
+
+    def test_can_match_objects_like_full_cost_matrix(self):
+        old_shapes = self._generate_boxes(300, seed=0)
+        rng = np.random.RandomState(1)
+        int_shapes = [dict(shape,
+                points=list(np.array(shape["points"]) + rng.uniform(-5, 5)))
+            for shape in old_shapes[::2]] + self._generate_boxes(100, seed=2)
+        manager = ShapeManager(old_shapes)
+
+        expected = ObjectManager._match_objects(manager,
+            int_shapes, old_shapes, 0, 0)
+        actual = manager._match_objects(int_shapes, old_shapes, 0, 0)
+
+        self.assertTrue(expected)
+        self.assertEqual(sorted(expected), sorted(actual))
+
+    def test_polygon_similarity_uses_both_polygons(self):
+        polygon0 = { "type": "polygon", "label_id": 1,
+            "points": [0, 0, 10, 0, 10, 10, 0, 10] }
+        polygon1 = { "type": "polygon", "label_id": 1,
+            "points": [5, 0, 15, 0, 15, 10, 5, 10] }
+
+        similarity = ShapeManager._calc_objects_similarity(
+            polygon0, polygon1, 0, 0)
+
+        self.assertAlmostEqual(1 / 3, similarity)
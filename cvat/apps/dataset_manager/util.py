@@ -5,7 +5,10 @@
 
 import inspect
 import os, os.path as osp
+import sys
 import zipfile
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory
 
 
 def current_function_name(depth=1):
@@ -18,3 +21,21 @@ def make_zip_archive(src_path, dst_path):
             for name in filenames:
                 path = osp.join(dirpath, name)
                 archive.write(path, osp.relpath(path, src_path))
+
+
+@contextmanager
+def open_zip_entry(archive, name):
+    """
+    Opens a file in the archive for writing. The data is written directly
+    to the archive, except for Python < 3.6, where a temporary file is used.
+    """
+
+    if sys.version_info >= (3, 6):
+        with archive.open(name, 'w', force_zip64=True) as f:
+            yield f
+    else:
+        with TemporaryDirectory() as temp_dir:
+            path = osp.join(temp_dir, osp.basename(name))
+            with open(path, 'wb') as f:
+                yield f
+            archive.write(path, name)
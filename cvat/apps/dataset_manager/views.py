@@ -5,6 +5,7 @@
 import os
 import os.path as osp
 import tempfile
+import time
 from datetime import timedelta
 
 import django_rq
@@ -45,6 +46,7 @@ def export_task(task_id, dst_format, server_url=None, save_images=False):
         db_task = Task.objects.get(pk=task_id)
 
         cache_dir = get_export_cache_dir(db_task)
+        job_cache_dir = task.get_job_cache_dir(db_task)
 
         exporter = EXPORT_FORMATS[dst_format]
         output_base = '%s_%s' % ('dataset' if save_images else 'task',
@@ -59,7 +61,8 @@ def export_task(task_id, dst_format, server_url=None, save_images=False):
             with tempfile.TemporaryDirectory(dir=cache_dir) as temp_dir:
                 temp_file = osp.join(temp_dir, 'result')
                 task.export_task(task_id, temp_file, dst_format,
-                    server_url=server_url, save_images=save_images)
+                    server_url=server_url, save_images=save_images,
+                    cache_dir=job_cache_dir)
                 os.replace(temp_file, output_path)
 
             archive_ctime = osp.getctime(output_path)
@@ -68,12 +71,16 @@ def export_task(task_id, dst_format, server_url=None, save_images=False):
                 func=clear_export_cache,
                 task_id=task_id,
                 file_path=output_path, file_ctime=archive_ctime)
+            job_cleaning_job = scheduler.enqueue_in(time_delta=CACHE_TTL,
+                func=clear_job_cache,
+                task_id=task_id,
+                cache_dir=job_cache_dir)
             slogger.task[task_id].info(
                 "The task '{}' is exported as '{}' at '{}' "
                 "and available for downloading for the next {}. "
-                "Export cache cleaning job is enqueued, id '{}'".format(
+                "Export cache cleaning jobs are enqueued, ids '{}', '{}'".format(
                 db_task.name, dst_format, output_path, CACHE_TTL,
-                cleaning_job.id))
+                cleaning_job.id, job_cleaning_job.id))
 
         return output_path
     except Exception:
@@ -97,6 +104,27 @@ def clear_export_cache(task_id, file_path, file_ctime):
         log_exception(slogger.task[task_id])
         raise
 
+def clear_job_cache(task_id, cache_dir):
+    # Job annotations are reused by exports, so only files which were not
+    # used during CACHE_TTL are removed
+    try:
+        if not osp.isdir(cache_dir):
+            return
+
+        expiration_time = time.time() - CACHE_TTL.total_seconds()
+        for entry in os.scandir(cache_dir):
+            try:
+                stat = entry.stat()
+                if max(stat.st_atime, stat.st_mtime) < expiration_time:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass # the file is removed concurrently
+        slogger.task[task_id].info(
+            "Job annotation cache '{}' successfully cleaned".format(cache_dir))
+    except Exception:
+        log_exception(slogger.task[task_id])
+        raise
+
 
 def get_export_formats():
     return list(EXPORT_FORMATS.values())
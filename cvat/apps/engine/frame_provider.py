@@ -3,15 +3,32 @@
 # SPDX-License-Identifier: MIT
 
 import math
+import os
+import shutil
+import struct
+import os.path as osp
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from enum import Enum
 from io import BytesIO
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import numpy as np
+from django.conf import settings
 from PIL import Image
 
-from cvat.apps.engine.media_extractors import VideoReader, ZipReader
+from cvat.apps.engine.media_extractors import (Mpeg4CompressedChunkWriter,
+    VideoChunkReader, VideoReader, ZipCompressedChunkWriter, ZipReader,
+    get_video_chunk_index_path)
 from cvat.apps.engine.mime_types import mimetypes
-from cvat.apps.engine.models import DataChoice
+from cvat.apps.engine.models import Data, DataChoice, StorageMethodChoice
 
 
 class RandomAccessIterator:
@@ -41,6 +58,272 @@ class RandomAccessIterator:
         self.iterator = iter(self.iterable)
         self.pos = -1
 
+class ChunkReaderCache:
+    """LRU cache of open chunk readers. It is shared by all FrameProvider
+    instances of a process, so neighbouring frames requested one by one
+    don't reopen and decode the same chunk again. The size of the cache
+    is limited by the total size of cached chunk files."""
+
+    class Entry:
+        def __init__(self, reader, size, mtime):
+            self.reader = reader
+            self.size = size
+            self.mtime = mtime
+            # Readers keep the decoding position, so they can't be used
+            # by several threads at once
+            self.lock = Lock()
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, path, create_reader):
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            # A chunk can be recreated with the same key if the data id
+            # of a deleted task is reused
+            if entry is not None and entry.mtime == stat.st_mtime:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry
+            self._misses += 1
+
+        entry = self.Entry(create_reader(), stat.st_size, stat.st_mtime)
+        if self._max_size < entry.size:
+            return entry
+
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._size -= old_entry.size
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._max_size < self._size:
+                _, old_entry = self._entries.popitem(last=False)
+                self._size -= old_entry.size
+                self._evictions += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'size': self._size,
+            }
+
+_chunk_reader_cache = None
+_chunk_reader_cache_lock = Lock()
+
+def get_chunk_reader_cache():
+    global _chunk_reader_cache
+    with _chunk_reader_cache_lock:
+        if _chunk_reader_cache is None:
+            _chunk_reader_cache = ChunkReaderCache(
+                settings.FRAME_PROVIDER_CACHE_SIZE)
+        return _chunk_reader_cache
+
+class CompressedChunkCache:
+    """Creates compressed chunks of tasks with the 'cache' storage method
+    from original chunks on the first request. The chunks are kept in the
+    data directories of tasks. When the total size of the chunks exceeds
+    the limit, the least recently used chunks are removed. A chunk is
+    created under a file lock, so concurrent requests of several server
+    processes don't encode it twice."""
+
+    # Interval (in seconds) of rebuilding the index of cached chunks
+    # from the cache directories
+    SCAN_INTERVAL = 10 * 60
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        # Chunks are evicted until the cache size is below this limit,
+        # so a full cache doesn't evict a chunk on each miss
+        self._min_size = int(max_size * 0.9)
+        # Sizes of the cached chunks in the order of access. The index is
+        # rebuilt from the cache directories periodically, so that it
+        # includes chunks and access times of other server processes.
+        self._chunks = OrderedDict()
+        self._size = 0
+        self._scan_time = None
+        self._index_lock = Lock()
+        # Used instead of file locks if they are not available
+        self._lock = Lock()
+
+    @contextmanager
+    def _lock_chunk(self, chunk_path):
+        if fcntl is None:
+            with self._lock:
+                yield
+            return
+
+        lock_path = chunk_path + '.lock'
+        while True:
+            with open(lock_path, 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # The lock file is removed by its owner after use, so the
+                # lock is held only if the file is still in place
+                try:
+                    locked = os.stat(lock_path).st_ino == \
+                        os.fstat(lock_file.fileno()).st_ino
+                except FileNotFoundError:
+                    locked = False
+                if not locked:
+                    continue
+
+                try:
+                    yield
+                finally:
+                    os.remove(lock_path)
+                return
+
+    @staticmethod
+    def _create_chunk(db_data, chunk_number, chunk_path):
+        original_chunk_path = db_data.get_original_chunk_path(chunk_number)
+        if db_data.original_chunk_type == DataChoice.VIDEO:
+            images = list(VideoReader([original_chunk_path]))
+        else:
+            images = list(ZipReader([original_chunk_path]))
+
+        if db_data.compressed_chunk_type == DataChoice.VIDEO:
+            writer = Mpeg4CompressedChunkWriter(db_data.image_quality)
+        else:
+            writer = ZipCompressedChunkWriter(db_data.image_quality)
+
+        # The chunk appears only when it is complete
+        tmp_dir = tempfile.mkdtemp(dir=osp.dirname(chunk_path))
+        try:
+            tmp_chunk_path = osp.join(tmp_dir, osp.basename(chunk_path))
+            writer.save_as_chunk(images, tmp_chunk_path)
+            tmp_index_path = get_video_chunk_index_path(tmp_chunk_path)
+            if osp.exists(tmp_index_path):
+                os.replace(tmp_index_path,
+                    get_video_chunk_index_path(chunk_path))
+            os.replace(tmp_chunk_path, chunk_path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def _remove_chunk(chunk_path):
+        for path in [get_video_chunk_index_path(chunk_path), chunk_path]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _get_chunk_size(chunk_path):
+        size = 0
+        for path in [chunk_path, get_video_chunk_index_path(chunk_path)]:
+            try:
+                size += os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    @classmethod
+    def _scan(cls):
+        chunks = []
+        data_ids = Data.objects.filter(storage_method=StorageMethodChoice.CACHE) \
+            .values_list('id', flat=True)
+        for data_id in data_ids:
+            chunk_dir = Data(id=data_id).get_compressed_cache_dirname()
+            if not osp.isdir(chunk_dir):
+                continue
+            for entry in os.scandir(chunk_dir):
+                # Index files are counted together with their chunks
+                if not entry.is_file() or entry.name.endswith('.lock') or \
+                        entry.name.endswith('.index.json'):
+                    continue
+                try:
+                    atime = entry.stat().st_atime
+                except FileNotFoundError:
+                    continue
+                chunks.append((atime, entry.path,
+                    cls._get_chunk_size(entry.path)))
+        return chunks
+
+    def _update_index(self, chunk_path):
+        if self._scan_time is None or \
+                self.SCAN_INTERVAL < time.monotonic() - self._scan_time:
+            self._chunks = OrderedDict((path, size)
+                for _, path, size in sorted(self._scan()))
+            self._size = sum(self._chunks.values())
+            self._scan_time = time.monotonic()
+        elif chunk_path not in self._chunks:
+            size = self._get_chunk_size(chunk_path)
+            self._chunks[chunk_path] = size
+            self._size += size
+
+        if chunk_path in self._chunks:
+            self._chunks.move_to_end(chunk_path)
+
+    def _evict(self, keep_path):
+        with self._index_lock:
+            self._update_index(keep_path)
+            if self._size <= self._max_size:
+                return
+
+            for chunk_path in list(self._chunks):
+                if self._size <= self._min_size:
+                    break
+                if chunk_path == keep_path:
+                    continue
+                self._size -= self._chunks.pop(chunk_path)
+                self._remove_chunk(chunk_path)
+
+    def _touch(self, chunk_path):
+        # Access times are updated explicitly, because file systems
+        # are often mounted with noatime or relatime
+        os.utime(chunk_path, ns=(int(time.time() * 1e9),
+            os.stat(chunk_path).st_mtime_ns))
+        if self._max_size:
+            with self._index_lock:
+                if chunk_path in self._chunks:
+                    self._chunks.move_to_end(chunk_path)
+
+    def get_chunk_path(self, db_data, chunk_number):
+        chunk_path = db_data.get_compressed_chunk_path(chunk_number)
+        if osp.exists(chunk_path):
+            try:
+                self._touch(chunk_path)
+                return chunk_path
+            except FileNotFoundError:
+                pass # the chunk was just evicted
+
+        with self._lock_chunk(chunk_path):
+            if osp.exists(chunk_path):
+                return chunk_path
+            self._create_chunk(db_data, chunk_number, chunk_path)
+
+        if self._max_size:
+            self._evict(chunk_path)
+        return chunk_path
+
+_compressed_chunk_cache = None
+_compressed_chunk_cache_lock = Lock()
+
+def get_compressed_chunk_cache():
+    global _compressed_chunk_cache
+    with _compressed_chunk_cache_lock:
+        if _compressed_chunk_cache is None:
+            _compressed_chunk_cache = CompressedChunkCache(
+                settings.COMPRESSED_CHUNK_CACHE_SIZE)
+        return _compressed_chunk_cache
+
 class FrameProvider:
     class Quality(Enum):
         COMPRESSED = 0
@@ -51,19 +334,47 @@ class FrameProvider:
         PIL = 1
         NUMPY_ARRAY = 2
 
+    class Encoding(Enum):
+        PNG = 'png'
+        JPEG = 'jpeg'
+        WEBP = 'webp'
+        # BGR pixels after a header with the shape of the image,
+        # see RAW_HEADER_FORMAT
+        RAW = 'raw'
+
+    RAW_HEADER_FORMAT = '<III' # height, width, channels
+    ENCODING_MIME_TYPES = {
+        Encoding.PNG: 'image/png',
+        Encoding.JPEG: 'image/jpeg',
+        Encoding.WEBP: 'image/webp',
+        Encoding.RAW: 'application/octet-stream',
+    }
+
     class ChunkLoader:
-        def __init__(self, reader_class, path_getter):
-            self.chunk_id = None
-            self.chunk_reader = None
+        def __init__(self, reader_class, path_getter, cache_key):
             self.reader_class = reader_class
             self.get_chunk_path = path_getter
+            self.cache_key = cache_key
+            # The last chunk is kept here as well, because it can be
+            # too big for the cache or the cache can be disabled
+            self.chunk_id = None
+            self.cache_entry = None
+
+        def _create_reader(self, chunk_path):
+            # Chunks created by previous versions don't have the index
+            if self.reader_class is VideoReader and \
+                    osp.exists(get_video_chunk_index_path(chunk_path)):
+                return VideoChunkReader(chunk_path)
+            return RandomAccessIterator(self.reader_class([chunk_path]))
 
         def load(self, chunk_id):
             if self.chunk_id != chunk_id:
+                chunk_path = self.get_chunk_path(chunk_id)
+                self.cache_entry = get_chunk_reader_cache().get(
+                    self.cache_key + (chunk_id, ), chunk_path,
+                    lambda: self._create_reader(chunk_path))
                 self.chunk_id = chunk_id
-                self.chunk_reader = RandomAccessIterator(
-                    self.reader_class([self.get_chunk_path(chunk_id)]))
-            return self.chunk_reader
+            return self.cache_entry
 
     def __init__(self, db_data):
         self._db_data = db_data
@@ -73,12 +384,18 @@ class FrameProvider:
             DataChoice.IMAGESET: ZipReader,
             DataChoice.VIDEO: VideoReader,
         }
+        get_compressed_chunk_path = db_data.get_compressed_chunk_path
+        if db_data.storage_method == StorageMethodChoice.CACHE:
+            get_compressed_chunk_path = lambda chunk_number: \
+                get_compressed_chunk_cache().get_chunk_path(db_data, chunk_number)
         self._loaders[self.Quality.COMPRESSED] = self.ChunkLoader(
             reader_class[db_data.compressed_chunk_type],
-            db_data.get_compressed_chunk_path)
+            get_compressed_chunk_path,
+            (db_data.id, self.Quality.COMPRESSED))
         self._loaders[self.Quality.ORIGINAL] = self.ChunkLoader(
             reader_class[db_data.original_chunk_type],
-            db_data.get_original_chunk_path)
+            db_data.get_original_chunk_path,
+            (db_data.id, self.Quality.ORIGINAL))
 
     def __len__(self):
         return self._db_data.size
@@ -100,24 +417,43 @@ class FrameProvider:
 
         return chunk_number_
 
-    @staticmethod
-    def _av_frame_to_png_bytes(av_frame):
-        pil_img = av_frame.to_image()
+    @classmethod
+    def _encode_frame(cls, frame, reader_class, encoding):
         buf = BytesIO()
-        pil_img.save(buf, format='PNG')
+        if encoding == cls.Encoding.RAW:
+            if reader_class is VideoReader:
+                image = frame.to_ndarray(format='bgr24')
+            else:
+                image = np.asarray(Image.open(frame).convert('RGB'))
+                image = np.ascontiguousarray(image[:, :, ::-1]) # RGB to BGR
+            buf.write(struct.pack(cls.RAW_HEADER_FORMAT, *image.shape))
+            buf.write(image.data)
+        else:
+            if reader_class is VideoReader:
+                image = frame.to_image()
+            else:
+                image = Image.open(frame)
+
+            if encoding == cls.Encoding.PNG:
+                image.save(buf, format='PNG')
+            else:
+                if image.mode not in {'RGB', 'L'}:
+                    image = image.convert('RGB')
+                image.save(buf, format=encoding.name,
+                    quality=settings.FRAME_ENCODING_QUALITY)
         buf.seek(0)
         return buf
 
     def _convert_frame(self, frame, reader_class, out_type):
         if out_type == self.Type.BUFFER:
-            return self._av_frame_to_png_bytes(frame) if reader_class is VideoReader else frame
+            return frame
         elif out_type == self.Type.PIL:
             return frame.to_image() if reader_class is VideoReader else Image.open(frame)
         elif out_type == self.Type.NUMPY_ARRAY:
             if reader_class is VideoReader:
-                image = np.array(frame.to_image())
-            else:
-                image = np.array(Image.open(frame))
+                return frame.to_ndarray(format='bgr24')
+
+            image = np.array(Image.open(frame))
             if len(image.shape) == 3 and image.shape[2] in {3, 4}:
                 image[:, :, :3] = image[:, :, 2::-1] # RGB to BGR
             return image
@@ -132,17 +468,33 @@ class FrameProvider:
         return self._loaders[quality].get_chunk_path(chunk_number)
 
     def get_frame(self, frame_number, quality=Quality.ORIGINAL,
-            out_type=Type.BUFFER):
+            out_type=Type.BUFFER, encoding=None):
+        """
+        For the BUFFER output type, images are returned in the format of
+        the chunk, if the encoding is not specified. Video frames are
+        encoded losslessly in PNG by default.
+        """
+
         _, chunk_number, frame_offset = self._validate_frame_number(frame_number)
         loader = self._loaders[quality]
-        chunk_reader = loader.load(chunk_number)
-        frame, frame_name, _ = chunk_reader[frame_offset]
+        cache_entry = loader.load(chunk_number)
+        with cache_entry.lock:
+            frame, frame_name, _ = cache_entry.reader[frame_offset]
+
+        mime = mimetypes.guess_type(frame_name)[0]
+        if out_type != self.Type.BUFFER:
+            return (self._convert_frame(frame, loader.reader_class, out_type),
+                mime)
 
-        frame = self._convert_frame(frame, loader.reader_class, out_type)
-        if loader.reader_class is VideoReader:
-            return (frame, 'image/png')
-        return (frame, mimetypes.guess_type(frame_name))
+        if encoding is None and loader.reader_class is VideoReader:
+            encoding = self.Encoding.PNG
+        if encoding is None or self.ENCODING_MIME_TYPES[encoding] == mime:
+            return (frame, mime)
+        return (self._encode_frame(frame, loader.reader_class, encoding),
+            self.ENCODING_MIME_TYPES[encoding])
 
-    def get_frames(self, quality=Quality.ORIGINAL, out_type=Type.BUFFER):
+    def get_frames(self, quality=Quality.ORIGINAL, out_type=Type.BUFFER,
+            encoding=None):
         for idx in range(self._db_data.size):
-            yield self.get_frame(idx, quality=quality, out_type=out_type)
+            yield self.get_frame(idx, quality=quality, out_type=out_type,
+                encoding=encoding)
@@ -5,9 +5,12 @@
 import os
 import tempfile
 import shutil
+import tarfile
 import zipfile
 import io
+import json
 from abc import ABC, abstractmethod
+from bisect import bisect_right
 
 import av
 import av.datasets
@@ -28,6 +31,19 @@ def get_mime(name):
 
     return 'unknown'
 
+def probe_image_size(image):
+    """
+    Returns (width, height) of an image from a path or a file object.
+    Only the image header is read, pixels are not decoded.
+    """
+
+    position = image.tell() if isinstance(image, io.IOBase) else None
+    with Image.open(image) as img:
+        size = img.size
+    if position is not None:
+        image.seek(position)
+    return size
+
 def create_tmp_dir():
     return tempfile.mkdtemp(prefix='cvat-', suffix='.data')
 
@@ -106,8 +122,7 @@ class ImageListReader(IMediaReader):
         return self._get_preview(fp)
 
     def get_image_size(self):
-        img = Image.open(self._source_path[0])
-        return img.width, img.height
+        return probe_image_size(self.get_image(0))
 
 class DirectoryReader(ImageListReader):
     def __init__(self, source_path, step=1, start=0, stop=None):
@@ -143,6 +158,123 @@ class ArchiveReader(DirectoryReader):
         base_dir = os.path.dirname(self._archive_source)
         return os.path.join(base_dir, os.path.relpath(self._source_path[i], self._tmp_dir))
 
+class TarReader(ImageListReader):
+    """
+    Reads images from a tar archive without extraction. Members of
+    compressed archives are read in one pass in the order of storage.
+    Only members stored before preceding frames are kept in a temporary
+    directory until their frames are reached. If there are too many such
+    members, a compressed archive is extracted once instead.
+    """
+
+    # Maximum part of the image data of a compressed archive, which can be
+    # kept in the temporary directory during a pass
+    MAX_STORED_RATIO = 0.25
+
+    def __init__(self, source_path, step=1, start=0, stop=None):
+        self._tmp_dir = None
+        self._tar_file = None
+        self._extracted_paths = None
+        self._tar_source = source_path[0]
+        try:
+            self._tar_file = tarfile.open(self._tar_source, mode='r:')
+            self._is_compressed = False
+        except tarfile.ReadError:
+            self._tar_file = tarfile.open(self._tar_source, mode='r:*')
+            self._is_compressed = True
+
+        self._members = {}
+        for member in self._tar_file:
+            if member.isfile() and get_mime(member.name) == 'image':
+                self._members[os.path.normpath(member.name)] = member
+        super().__init__(list(self._members), step, start, stop)
+
+        if self._is_compressed:
+            frames = range(self._start, self._stop, self._step)
+            stored_size = sum(self._get_member(i).size
+                for i in self._get_stored_frames(frames))
+            total_size = sum(self._get_member(i).size for i in frames)
+            if total_size * self.MAX_STORED_RATIO < stored_size:
+                self._extract_all()
+
+    def __del__(self):
+        if self._tar_file is not None:
+            self._tar_file.close()
+        delete_tmp_dir(self._tmp_dir)
+
+    def _get_member(self, i):
+        return self._members[self._source_path[i]]
+
+    def _get_stored_frames(self, frames):
+        # Finds frames, which are stored before the preceding frames
+        stored_frames = set()
+        next_frame = iter(frames)
+        expected_frame = next(next_frame, None)
+        for i in sorted(frames, key=lambda i: self._get_member(i).offset):
+            if i != expected_frame:
+                stored_frames.add(i)
+                continue
+
+            expected_frame = next(next_frame, None)
+            while expected_frame in stored_frames:
+                expected_frame = next(next_frame, None)
+        return stored_frames
+
+    def _extract_all(self):
+        self._tmp_dir = create_tmp_dir()
+        self._extracted_paths = {}
+        for i in sorted(range(len(self._source_path)),
+                key=lambda i: self._get_member(i).offset):
+            path = os.path.join(self._tmp_dir, str(i))
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(self._extract(i), f)
+            self._extracted_paths[i] = path
+        self._tar_file.close()
+
+    def __iter__(self):
+        if not self._is_compressed or self._extracted_paths is not None:
+            yield from super().__iter__()
+            return
+
+        frames = range(self._start, self._stop, self._step)
+        members = sorted(frames, key=lambda i: self._get_member(i).offset)
+        next_frame = iter(frames)
+        expected_frame = next(next_frame, None)
+        stored_frames = {}
+        for i in members:
+            if i != expected_frame:
+                if self._tmp_dir is None:
+                    self._tmp_dir = create_tmp_dir()
+                stored_frames[i] = os.path.join(self._tmp_dir, str(i))
+                with open(stored_frames[i], 'wb') as f:
+                    shutil.copyfileobj(self._extract(i), f)
+                continue
+
+            yield (io.BytesIO(self._extract(i).read()), self.get_path(i), i)
+            expected_frame = next(next_frame, None)
+            while expected_frame in stored_frames:
+                path = stored_frames.pop(expected_frame)
+                with open(path, 'rb') as f:
+                    image = io.BytesIO(f.read())
+                os.remove(path)
+                yield (image, self.get_path(expected_frame), expected_frame)
+                expected_frame = next(next_frame, None)
+
+    def _extract(self, i):
+        return self._tar_file.extractfile(self._get_member(i))
+
+    def get_preview(self):
+        return self._get_preview(self.get_image(0))
+
+    def get_image(self, i):
+        if self._extracted_paths is not None:
+            with open(self._extracted_paths[i], 'rb') as f:
+                return io.BytesIO(f.read())
+        return io.BytesIO(self._extract(i).read())
+
+    def get_path(self, i):
+        return os.path.join(os.path.dirname(self._tar_source), self._source_path[i])
+
 class PdfReader(DirectoryReader):
     def __init__(self, source_path, step=1, start=0, stop=None):
         if not source_path:
@@ -184,10 +316,6 @@ class ZipReader(ImageListReader):
         io_image = io.BytesIO(self._zip_source.read(self._source_path[0]))
         return self._get_preview(io_image)
 
-    def get_image_size(self):
-        img = Image.open(io.BytesIO(self._zip_source.read(self._source_path[0])))
-        return img.width, img.height
-
     def get_image(self, i):
         return io.BytesIO(self._zip_source.read(self._source_path[i]))
 
@@ -246,6 +374,72 @@ class VideoReader(IMediaReader):
         image = (next(iter(self)))[0]
         return image.width, image.height
 
+def get_video_chunk_index_path(chunk_path):
+    return chunk_path + '.index.json'
+
+class VideoChunkReader:
+    """Provides random access to frames of a video chunk. It uses the
+    keyframe index of the chunk to seek to the nearest keyframe, so only
+    frames of one GOP have to be decoded to get the requested frame."""
+
+    def __init__(self, chunk_path):
+        self._chunk_path = chunk_path
+        with open(get_video_chunk_index_path(chunk_path)) as index_file:
+            index = json.load(index_file)
+        self._pts = index['pts']
+        self._keyframes = index['keyframes'] or [0]
+        self._frame_by_pts = { pts: idx for idx, pts in enumerate(self._pts) }
+
+        self._container = None
+        self._stream = None
+        self._decoder = None
+        self._pos = -1
+
+    def __len__(self):
+        return len(self._pts)
+
+    def _get_keyframe(self, idx):
+        return self._keyframes[bisect_right(self._keyframes, idx) - 1]
+
+    def _seek(self, keyframe):
+        if self._container is None:
+            self._container = av.open(self._chunk_path)
+            self._stream = self._container.streams.video[0]
+            self._stream.thread_type = 'AUTO'
+        self._container.seek(self._pts[keyframe], stream=self._stream)
+        self._decoder = self._container.decode(self._stream)
+        self._pos = -1
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < len(self._pts):
+            raise IndexError('frame index {} is out of range'.format(idx))
+
+        # Frames of the current GOP can be decoded sequentially,
+        # otherwise it is necessary to seek to the nearest keyframe
+        keyframe = self._get_keyframe(idx)
+        if self._decoder is None or idx <= self._pos or self._pos < keyframe:
+            self._seek(keyframe)
+
+        for frame in self._decoder:
+            self._pos = self._frame_by_pts.get(frame.pts, self._pos + 1)
+            if self._pos == idx:
+                return (frame, self._chunk_path, frame.pts)
+            elif idx < self._pos:
+                break
+
+        self._decoder = None
+        raise Exception('Cannot decode frame {} of {}'.format(idx,
+            self._chunk_path))
+
+    def close(self):
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+            self._decoder = None
+
+    def __del__(self):
+        self.close()
+
 class IChunkWriter(ABC):
     def __init__(self, quality):
         self._image_quality = quality
@@ -275,6 +469,7 @@ class IChunkWriter(ABC):
 
 class ZipChunkWriter(IChunkWriter):
     def save_as_chunk(self, images, chunk_path):
+        image_sizes = []
         with zipfile.ZipFile(chunk_path, 'x') as zip_chunk:
             for idx, (image, path, _) in enumerate(images):
                 arcname = '{:06d}{}'.format(idx, os.path.splitext(path)[1])
@@ -282,9 +477,9 @@ class ZipChunkWriter(IChunkWriter):
                     zip_chunk.writestr(arcname, image.getvalue())
                 else:
                     zip_chunk.write(filename=image, arcname=arcname)
-        # return empty list because ZipChunkWriter write files as is
-        # and does not decode it to know img size.
-        return []
+                # Files are written as is, so sizes are read from headers
+                image_sizes.append(probe_image_size(image))
+        return image_sizes
 
 class ZipCompressedChunkWriter(IChunkWriter):
     def save_as_chunk(self, images, chunk_path):
@@ -299,6 +494,10 @@ class ZipCompressedChunkWriter(IChunkWriter):
         return image_sizes
 
 class Mpeg4ChunkWriter(IChunkWriter):
+    # Limits the number of frames which must be decoded to get
+    # a random frame from the chunk
+    GOP_SIZE = 8
+
     def __init__(self, _):
         super().__init__(17)
         self._output_fps = 25
@@ -335,13 +534,32 @@ class Mpeg4ChunkWriter(IChunkWriter):
             options={
                 "crf": str(self._image_quality),
                 "preset": "ultrafast",
+                "g": str(self.GOP_SIZE),
             },
         )
 
         self._encode_images(images, output_container, output_v_stream)
         output_container.close()
+        self._save_index(chunk_path)
         return [(input_w, input_h)]
 
+    @staticmethod
+    def _save_index(chunk_path):
+        # Packets are only demuxed here, so it is much cheaper than decoding
+        container = av.open(chunk_path)
+        stream = container.streams.video[0]
+        packets = sorted((packet.pts, bool(packet.is_keyframe))
+            for packet in container.demux(stream) if packet.pts is not None)
+        container.close()
+
+        index = {
+            'pts': [pts for pts, _ in packets],
+            'keyframes': [idx for idx, (_, is_keyframe) in enumerate(packets)
+                if is_keyframe],
+        }
+        with open(get_video_chunk_index_path(chunk_path), 'w') as index_file:
+            json.dump(index, index_file)
+
     @staticmethod
     def _encode_images(images, container, stream):
         for frame, _, _ in images:
@@ -393,9 +611,18 @@ class Mpeg4CompressedChunkWriter(Mpeg4ChunkWriter):
 
         self._encode_images(images, output_container, output_v_stream)
         output_container.close()
+        self._save_index(chunk_path)
         return [(input_w, input_h)]
 
+def _is_tar(path):
+    mime = mimetypes.guess_type(path)
+    return mime[0] == 'application/x-tar' and \
+        mime[1] in [None, 'gzip', 'bzip2', 'xz']
+
 def _is_archive(path):
+    if _is_tar(path):
+        return True
+
     mime = mimetypes.guess_type(path)
     mime_type = mime[0]
     encoding = mime[1]
@@ -428,9 +655,14 @@ def _is_zip(path):
     supportedArchives = ['application/zip']
     return mime_type in supportedArchives or encoding in supportedArchives
 
+def _create_archive_reader(source_path, step=1, start=0, stop=None):
+    # Tar archives are read without extraction
+    reader_class = TarReader if _is_tar(source_path[0]) else ArchiveReader
+    return reader_class(source_path, step=step, start=start, stop=stop)
+
 # 'has_mime_type': function receives 1 argument - path to file.
 #                  Should return True if file has specified media type.
-# 'extractor': class that extracts images from specified media.
+# 'extractor': class (or function) that creates a reader of specified media.
 # 'mode': 'annotation' or 'interpolation' - mode of task that should be created.
 # 'unique': True or False - describes how the type can be combined with other.
 #           True - only one item of this type and no other is allowed
@@ -451,7 +683,7 @@ MEDIA_TYPES = {
     },
     'archive': {
         'has_mime_type': _is_archive,
-        'extractor': ArchiveReader,
+        'extractor': _create_archive_reader,
         'mode': 'annotation',
         'unique': True,
     },
@@ -472,5 +704,5 @@ MEDIA_TYPES = {
         'extractor': ZipReader,
         'mode': 'annotation',
         'unique': True,
-    }
+    },
 }
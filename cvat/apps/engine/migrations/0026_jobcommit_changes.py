@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2026-10-17 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engine', '0025_auto_20200324_1222'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobcommit',
+            name='changes',
+            field=models.TextField(null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.13 on 2026-10-17 08:10
+
+import cvat.apps.engine.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engine', '0026_jobcommit_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='data',
+            name='storage_method',
+            field=models.CharField(choices=[('file_system', 'FILE_SYSTEM'), ('cache', 'CACHE')], default=cvat.apps.engine.models.StorageMethodChoice('file_system'), max_length=15),
+        ),
+    ]
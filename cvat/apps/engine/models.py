@@ -43,6 +43,19 @@ class DataChoice(str, Enum):
     def __str__(self):
         return self.value
 
+class StorageMethodChoice(str, Enum):
+    # Compressed chunks are created with the task
+    FILE_SYSTEM = 'file_system'
+    # Compressed chunks are created on demand and kept in a disk cache
+    CACHE = 'cache'
+
+    @classmethod
+    def choices(cls):
+        return tuple((x.value, x.name) for x in cls)
+
+    def __str__(self):
+        return self.value
+
 class Data(models.Model):
     chunk_size = models.PositiveIntegerField(null=True)
     size = models.PositiveIntegerField(default=0)
@@ -54,6 +67,8 @@ class Data(models.Model):
         default=DataChoice.IMAGESET)
     original_chunk_type = models.CharField(max_length=32, choices=DataChoice.choices(),
         default=DataChoice.IMAGESET)
+    storage_method = models.CharField(max_length=15, choices=StorageMethodChoice.choices(),
+        default=StorageMethodChoice.FILE_SYSTEM)
 
     class Meta:
         default_permissions = ()
@@ -326,6 +341,8 @@ class Commit(models.Model):
 
 class JobCommit(Commit):
     job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name="commits")
+    # JSON with ids of created, updated and deleted annotations of the commit
+    changes = models.TextField(null=True)
 
 class FloatArrayField(models.TextField):
     separator = ","
@@ -0,0 +1,23 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import msgpack
+from rest_framework.renderers import BaseRenderer
+
+
+class MsgPackRenderer(BaseRenderer):
+    """
+    Renders data in the MessagePack format. It is more compact and much
+    faster to encode than JSON for big annotations.
+    """
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
@@ -171,7 +171,8 @@ class DataSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Data
         fields = ('chunk_size', 'size', 'image_quality', 'start_frame', 'stop_frame', 'frame_filter',
-            'compressed_chunk_type', 'original_chunk_type', 'client_files', 'server_files', 'remote_files', 'use_zip_chunks')
+            'compressed_chunk_type', 'original_chunk_type', 'client_files', 'server_files', 'remote_files', 'use_zip_chunks',
+            'storage_method')
 
     # pylint: disable=no-self-use
     def validate_frame_filter(self, value):
@@ -230,6 +231,7 @@ class TaskSerializer(WriteOnceMixin, serializers.ModelSerializer):
     data_chunk_size = serializers.ReadOnlyField(source='data.chunk_size')
     data_compressed_chunk_type = serializers.ReadOnlyField(source='data.compressed_chunk_type')
     data_original_chunk_type = serializers.ReadOnlyField(source='data.original_chunk_type')
+    data_storage_method = serializers.ReadOnlyField(source='data.storage_method')
     size = serializers.ReadOnlyField(source='data.size')
     image_quality = serializers.ReadOnlyField(source='data.image_quality')
     data = serializers.ReadOnlyField(source='data.id')
@@ -239,9 +241,10 @@ class TaskSerializer(WriteOnceMixin, serializers.ModelSerializer):
         fields = ('url', 'id', 'name', 'mode', 'owner', 'assignee',
             'bug_tracker', 'created_date', 'updated_date', 'overlap',
             'segment_size', 'z_order', 'status', 'labels', 'segments',
-            'project', 'data_chunk_size', 'data_compressed_chunk_type', 'data_original_chunk_type', 'size', 'image_quality', 'data')
+            'project', 'data_chunk_size', 'data_compressed_chunk_type', 'data_original_chunk_type', 'data_storage_method',
+            'size', 'image_quality', 'data')
         read_only_fields = ('mode', 'created_date', 'updated_date', 'status', 'data_chunk_size',
-            'data_compressed_chunk_type', 'data_original_chunk_type', 'size', 'image_quality', 'data')
+            'data_compressed_chunk_type', 'data_original_chunk_type', 'data_storage_method', 'size', 'image_quality', 'data')
         write_once_fields = ('overlap', 'segment_size')
         ordering = ['-id']
 
@@ -401,7 +404,9 @@ class AttributeValSerializer(serializers.Serializer):
     value = serializers.CharField(max_length=4096, allow_blank=True)
 
     def to_internal_value(self, data):
-        data['value'] = str(data['value'])
+        # Null values are saved as empty strings
+        if 'value' in data:
+            data['value'] = '' if data['value'] is None else str(data['value'])
         return super().to_internal_value(data)
 
 class AnnotationSerializer(serializers.Serializer):
@@ -446,6 +451,177 @@ class LabeledDataSerializer(serializers.Serializer):
     shapes = LabeledShapeSerializer(many=True)
     tracks = LabeledTrackSerializer(many=True)
 
+class LabeledDataValidator:
+    """
+    Validates annotations like LabeledDataSerializer and returns them in
+    the same form as its data, but checks values directly instead of
+    running a serializer for each field. Values must be strictly typed,
+    as they are in binary payloads, e.g. numbers are not parsed from strings.
+    Limits of values and error messages are taken from the serializer fields.
+    """
+
+    _DATA_SERIALIZER = LabeledDataSerializer()
+    _DATA_FIELDS = _DATA_SERIALIZER.fields
+    _TAG_FIELDS = _DATA_FIELDS['tags'].child.fields
+    _SHAPE_FIELDS = _DATA_FIELDS['shapes'].child.fields
+    _TRACK_FIELDS = _DATA_FIELDS['tracks'].child.fields
+    _TRACKED_SHAPE_FIELDS = _TRACK_FIELDS['shapes'].child.fields
+    _ATTRIBUTE_FIELDS = _TAG_FIELDS['attributes'].child.fields
+
+    def __init__(self):
+        self._path = []
+
+    def _error(self, message):
+        raise serializers.ValidationError({
+            ''.join(self._path).lstrip('.'): [message] })
+
+    def _fail(self, field, key, **kwargs):
+        self._path.append('.' + field.field_name)
+        self._error(field.error_messages[key].format(**kwargs))
+
+    def _get(self, obj, field):
+        if field.field_name in obj:
+            return obj[field.field_name]
+        elif field.default is not serializers.empty:
+            return field.default
+        self._fail(field, 'required')
+
+    def _get_int(self, obj, field):
+        value = self._get(obj, field)
+        if value is None:
+            if field.allow_null:
+                return value
+            self._fail(field, 'null')
+        if type(value) is not int:
+            self._fail(field, 'invalid')
+        if field.min_value is not None and value < field.min_value:
+            self._fail(field, 'min_value', min_value=field.min_value)
+        if field.max_value is not None and field.max_value < value:
+            self._fail(field, 'max_value', max_value=field.max_value)
+        return value
+
+    def _get_bool(self, obj, field):
+        value = self._get(obj, field)
+        if value is None:
+            self._fail(field, 'null')
+        if type(value) is not bool:
+            self._fail(field, 'invalid', input=value)
+        return value
+
+    def _get_choice(self, obj, field):
+        value = self._get(obj, field)
+        if value not in field.choices:
+            self._fail(field, 'invalid_choice', input=value)
+        return value
+
+    def _get_str(self, obj, field):
+        value = self._get(obj, field)
+        # Null is converted like in AttributeValSerializer
+        value = '' if value is None else str(value)
+        if field.trim_whitespace:
+            value = value.strip()
+        if not value and not field.allow_blank:
+            self._fail(field, 'blank')
+        if field.max_length is not None and field.max_length < len(value):
+            self._fail(field, 'max_length', max_length=field.max_length)
+        return value
+
+    def _get_list(self, obj, field):
+        value = self._get(obj, field)
+        if not isinstance(value, list):
+            self._fail(field, 'not_a_list', input_type=type(value).__name__)
+        if not value and not field.allow_empty:
+            self._fail(field, 'empty')
+        return value
+
+    def _validate_list(self, obj, field, validate_item):
+        items = self._get_list(obj, field)
+        self._path.append('.' + field.field_name)
+        validated_items = []
+        for idx, item in enumerate(items):
+            self._path.append('[{}]'.format(idx))
+            if not isinstance(item, dict):
+                self._error(field.child.error_messages['invalid'].format(
+                    datatype=type(item).__name__))
+            validated_items.append(validate_item(item))
+            self._path.pop()
+        self._path.pop()
+        return validated_items
+
+    def _validate_attribute(self, attr):
+        fields = self._ATTRIBUTE_FIELDS
+        return {
+            'spec_id': self._get_int(attr, fields['spec_id']),
+            'value': self._get_str(attr, fields['value']),
+        }
+
+    def _validate_annotation(self, obj, fields):
+        return {
+            'id': self._get_int(obj, fields['id']),
+            'frame': self._get_int(obj, fields['frame']),
+            'label_id': self._get_int(obj, fields['label_id']),
+            'group': self._get_int(obj, fields['group']),
+            'attributes': self._validate_list(obj, fields['attributes'],
+                self._validate_attribute),
+        }
+
+    def _validate_shape_fields(self, shape, fields, validated_shape):
+        points_field = fields['points']
+        points = self._get_list(shape, points_field)
+        for p in points:
+            if type(p) not in (int, float):
+                self._path.append('.' + points_field.field_name)
+                self._error(points_field.child.error_messages['invalid'])
+
+        validated_shape.update({
+            'type': self._get_choice(shape, fields['type']),
+            'occluded': self._get_bool(shape, fields['occluded']),
+            'z_order': self._get_int(shape, fields['z_order']),
+            'points': [float(p) for p in points],
+        })
+        return validated_shape
+
+    def _validate_tag(self, tag):
+        return self._validate_annotation(tag, self._TAG_FIELDS)
+
+    def _validate_labeled_shape(self, shape):
+        fields = self._SHAPE_FIELDS
+        return self._validate_shape_fields(shape, fields,
+            self._validate_annotation(shape, fields))
+
+    def _validate_tracked_shape(self, shape):
+        fields = self._TRACKED_SHAPE_FIELDS
+        return self._validate_shape_fields(shape, fields, {
+            'id': self._get_int(shape, fields['id']),
+            'frame': self._get_int(shape, fields['frame']),
+            'outside': self._get_bool(shape, fields['outside']),
+            'attributes': self._validate_list(shape, fields['attributes'],
+                self._validate_attribute),
+        })
+
+    def _validate_track(self, track):
+        fields = self._TRACK_FIELDS
+        validated_track = self._validate_annotation(track, fields)
+        validated_track['shapes'] = self._validate_list(track,
+            fields['shapes'], self._validate_tracked_shape)
+        return validated_track
+
+    def validate(self, data):
+        if not isinstance(data, dict):
+            self._error(self._DATA_SERIALIZER.error_messages['invalid'] \
+                .format(datatype=type(data).__name__))
+
+        fields = self._DATA_FIELDS
+        return {
+            'version': self._get_int(data, fields['version']),
+            'tags': self._validate_list(data, fields['tags'],
+                self._validate_tag),
+            'shapes': self._validate_list(data, fields['shapes'],
+                self._validate_labeled_shape),
+            'tracks': self._validate_list(data, fields['tracks'],
+                self._validate_track),
+        }
+
 class FileInfoSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=1024)
     type = serializers.ChoiceField(choices=["REG", "DIR"])
@@ -8,18 +8,27 @@ import os
 import sys
 import rq
 import shutil
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.client import HTTPException
 from traceback import print_exception
 from urllib import error as urlerror
 from urllib import parse as urlparse
 from urllib import request as urlrequest
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 from cvat.apps.engine.media_extractors import get_mime, MEDIA_TYPES, Mpeg4ChunkWriter, ZipChunkWriter, Mpeg4CompressedChunkWriter, ZipCompressedChunkWriter
-from cvat.apps.engine.models import DataChoice
+from cvat.apps.engine.models import DataChoice, StorageMethodChoice
 
 import django_rq
 from django.conf import settings
 from django.db import transaction
-from distutils.dir_util import copy_tree
 
 from . import models
 from .log import slogger
@@ -47,21 +56,82 @@ def rq_handler(job, exc_type, exc_value, traceback):
 
 ############################# Internal implementation for server API
 
+_SHARE_COPY_WORKERS = 4
+
+# ioctl request to share data blocks of files on btrfs and XFS
+_FICLONE = 0x40049409
+
+def _reflink_file(source_path, target_path):
+    if fcntl is None:
+        return False
+
+    try:
+        with open(source_path, 'rb') as src, open(target_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        return False
+
+def _link_file(source_path, target_path):
+    try:
+        os.link(source_path, target_path)
+        return True
+    except OSError:
+        # The files are on different filesystems or the filesystem
+        # doesn't support hard links
+        return _reflink_file(source_path, target_path)
+
+def _list_share_files(source_path, target_path):
+    if not os.path.isdir(source_path):
+        return [(source_path, target_path)]
+
+    files = []
+    for root, _, file_names in os.walk(source_path, followlinks=True):
+        target_dir = os.path.join(target_path,
+            os.path.relpath(root, source_path))
+        os.makedirs(target_dir, exist_ok=True)
+        files.extend((os.path.join(root, name), os.path.join(target_dir, name))
+            for name in file_names)
+    return files
+
 def _copy_data_from_share(server_files, upload_dir):
     job = rq.get_current_job()
     job.meta['status'] = 'Data are being copied from share..'
     job.save_meta()
 
+    mode = settings.SHARE_INGESTION_MODE
+    files = []
     for path in server_files:
         source_path = os.path.join(settings.SHARE_ROOT, os.path.normpath(path))
         target_path = os.path.join(upload_dir, path)
-        if os.path.isdir(source_path):
-            copy_tree(source_path, target_path)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if mode == 'symlink':
+            # Media files are read from the share by extractors
+            os.symlink(source_path, target_path)
         else:
-            target_dir = os.path.dirname(target_path)
-            if not os.path.exists(target_dir):
-                os.makedirs(target_dir)
-            shutil.copyfile(source_path, target_path)
+            files.extend(_list_share_files(source_path, target_path))
+
+    if mode == 'link':
+        files = [(source_path, target_path)
+            for source_path, target_path in files
+            if not _link_file(source_path, target_path)]
+
+    if not files:
+        return
+
+    status_template = 'Data are being copied from share.. {}%'
+    progress = 0
+    with ThreadPoolExecutor(max_workers=_SHARE_COPY_WORKERS) as executor:
+        results = [executor.submit(shutil.copyfile, *f) for f in files]
+        for copied, result in enumerate(results, start=1):
+            result.result()
+            current_progress = 100 * copied // len(files)
+            if current_progress != progress:
+                progress = current_progress
+                job.meta['status'] = status_template.format(progress)
+                job.save_meta()
 
 def _save_task_to_db(db_task):
     job = rq.get_current_job()
@@ -176,33 +246,161 @@ def _validate_data(counter):
 
     return counter, task_modes[0]
 
+_DOWNLOAD_TIMEOUT = 60 # seconds
+_DOWNLOAD_RETRY_DELAY = 1 # seconds, it is doubled after each retry
+
+class _DownloadProgress:
+    def __init__(self, job, names):
+        self._job = job
+        self._lock = threading.Lock()
+        self._progress = OrderedDict((name, 0) for name in names)
+
+    def update(self, name, downloaded, total):
+        progress = 100 * downloaded // total if total else 0
+        with self._lock:
+            if progress == self._progress[name]:
+                return
+            self._progress[name] = progress
+            total_progress = sum(self._progress.values()) // len(self._progress)
+            self._job.meta['status'] = \
+                'Remote files are being downloaded.. {}%'.format(total_progress)
+            self._job.meta['download_progress'] = dict(self._progress)
+            self._job.save_meta()
+
+def _download_file(url, path, update_progress):
+    downloaded = 0
+    for attempt in range(settings.REMOTE_FILES_DOWNLOAD_RETRIES + 1):
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        if downloaded:
+            headers['Range'] = 'bytes={}-'.format(downloaded)
+        req = urlrequest.Request(url, headers=headers)
+        try:
+            with urlrequest.urlopen(req, timeout=_DOWNLOAD_TIMEOUT) as fp:
+                if fp.getcode() != 206:
+                    # The server doesn't support ranges or the request
+                    # is the first one
+                    downloaded = 0
+                size = fp.info().get('Content-Length')
+                total = downloaded + int(size) if size is not None else None
+
+                with open(path, 'ab' if downloaded else 'wb') as tfp:
+                    while True:
+                        block = fp.read(settings.REMOTE_FILES_BLOCK_SIZE)
+                        if not block:
+                            break
+                        tfp.write(block)
+                        downloaded += len(block)
+                        update_progress(downloaded, total)
+
+            if total is None or total <= downloaded:
+                return
+            error = 'the connection is closed after {} of {} bytes'.format(
+                downloaded, total)
+        except urlerror.HTTPError as err:
+            if err.code < 500 and err.code not in [408, 429]:
+                raise Exception("Failed to download " + url + ". " +
+                    str(err.code) + ' - ' + str(err.reason))
+            error = '{} - {}'.format(err.code, err.reason)
+        except urlerror.URLError as err:
+            if not isinstance(err.reason, OSError):
+                raise Exception("Invalid URL: " + url + ". " + str(err.reason))
+            error = err.reason
+        except (OSError, HTTPException) as err:
+            # Timeouts and broken connections during reading
+            error = err
+
+        slogger.glob.warning("Failed to download {} (attempt {}): {}".format(
+            url, attempt + 1, error))
+        if attempt < settings.REMOTE_FILES_DOWNLOAD_RETRIES:
+            time.sleep(_DOWNLOAD_RETRY_DELAY * 2 ** attempt)
+
+    raise Exception("Failed to download " + url + ". " + str(error))
+
 def _download_data(urls, upload_dir):
     job = rq.get_current_job()
-    local_files = {}
+    local_files = OrderedDict()
     for url in urls:
         name = os.path.basename(urlrequest.url2pathname(urlparse.urlparse(url).path))
         if name in local_files:
             raise Exception("filename collision: {}".format(name))
+        local_files[name] = url
+
+    job.meta['status'] = 'Remote files are being downloaded..'
+    job.save_meta()
+
+    progress = _DownloadProgress(job, local_files)
+    def download(name, url):
         slogger.glob.info("Downloading: {}".format(url))
-        job.meta['status'] = '{} is being downloaded..'.format(url)
-        job.save_meta()
+        _download_file(url, os.path.join(upload_dir, name),
+            lambda downloaded, total: progress.update(name, downloaded, total))
 
-        req = urlrequest.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+    max_workers = min(settings.REMOTE_FILES_DOWNLOAD_WORKERS, len(urls)) or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = [executor.submit(download, name, url)
+            for name, url in local_files.items()]
         try:
-            with urlrequest.urlopen(req) as fp, open(os.path.join(upload_dir, name), 'wb') as tfp:
-                while True:
-                    block = fp.read(8192)
-                    if not block:
-                        break
-                    tfp.write(block)
-        except urlerror.HTTPError as err:
-            raise Exception("Failed to download " + url + ". " + str(err.code) + ' - ' + err.reason)
-        except urlerror.URLError as err:
-            raise Exception("Invalid URL: " + url + ". " + err.reason)
+            for result in results:
+                result.result()
+        except Exception:
+            for result in results:
+                result.cancel()
+            raise
 
-        local_files[name] = True
     return list(local_files.keys())
 
+def _save_chunk(chunk_data, original_chunk_writer, original_chunk_path,
+        compressed_chunk_writer, compressed_chunk_path):
+    # The writers are called one by one, because video writers modify
+    # the decoded frames (pts and time_base)
+    img_sizes = original_chunk_writer.save_as_chunk(chunk_data,
+        original_chunk_path)
+    if compressed_chunk_writer is not None:
+        img_sizes = compressed_chunk_writer.save_as_chunk(chunk_data,
+            compressed_chunk_path)
+    return img_sizes
+
+def _save_chunks(chunks, original_chunk_writer, compressed_chunk_writer,
+        get_original_chunk_path, get_compressed_chunk_path, max_workers=1):
+    """Writes original and compressed chunks and yields
+    (chunk_idx, chunk_data, img_sizes) tuples in the order of chunks.
+    If compressed_chunk_writer is None, only original chunks are written
+    and image sizes are returned by the original chunk writer."""
+    if max_workers <= 1:
+        for chunk_idx, chunk_data in chunks:
+            chunk_data = list(chunk_data)
+            img_sizes = _save_chunk(chunk_data,
+                original_chunk_writer, get_original_chunk_path(chunk_idx),
+                compressed_chunk_writer, get_compressed_chunk_path(chunk_idx))
+            yield chunk_idx, chunk_data, img_sizes
+        return
+
+    # Decoded video frames (av.VideoFrame) cannot be passed to another
+    # process. Fortunately, libav releases GIL during encoding.
+    if isinstance(original_chunk_writer, Mpeg4ChunkWriter):
+        executor_class = ThreadPoolExecutor
+    else:
+        executor_class = ProcessPoolExecutor
+
+    # Only a limited number of chunks is kept in memory at the same time
+    max_pending_chunks = 2 * max_workers
+    pending_chunks = deque()
+    with executor_class(max_workers=max_workers) as executor:
+        for chunk_idx, chunk_data in chunks:
+            chunk_data = list(chunk_data)
+            pending_chunks.append((chunk_idx, chunk_data,
+                executor.submit(_save_chunk, chunk_data,
+                    original_chunk_writer, get_original_chunk_path(chunk_idx),
+                    compressed_chunk_writer, get_compressed_chunk_path(chunk_idx))
+            ))
+
+            if len(pending_chunks) >= max_pending_chunks:
+                chunk_idx, chunk_data, result = pending_chunks.popleft()
+                yield chunk_idx, chunk_data, result.result()
+
+        while pending_chunks:
+            chunk_idx, chunk_data, result = pending_chunks.popleft()
+            yield chunk_idx, chunk_data, result.result()
+
 @transaction.atomic
 def _create_thread(tid, data):
     slogger.glob.info("create task #{}".format(tid))
@@ -278,14 +476,17 @@ def _create_thread(tid, data):
 
     counter = itertools.count()
     generator = itertools.groupby(extractor, lambda x: next(counter) // db_data.chunk_size)
-    for chunk_idx, chunk_data in generator:
-        chunk_data = list(chunk_data)
-        original_chunk_path = db_data.get_original_chunk_path(chunk_idx)
-        original_chunk_writer.save_as_chunk(chunk_data, original_chunk_path)
-
-        compressed_chunk_path = db_data.get_compressed_chunk_path(chunk_idx)
-        img_sizes = compressed_chunk_writer.save_as_chunk(chunk_data, compressed_chunk_path)
-
+    if db_data.storage_method == StorageMethodChoice.CACHE:
+        # Compressed chunks are created from original ones on demand
+        compressed_chunk_writer = None
+
+    chunks = _save_chunks(generator,
+        original_chunk_writer=original_chunk_writer,
+        compressed_chunk_writer=compressed_chunk_writer,
+        get_original_chunk_path=db_data.get_original_chunk_path,
+        get_compressed_chunk_path=db_data.get_compressed_chunk_path,
+        max_workers=settings.CHUNK_ENCODING_WORKERS)
+    for _, chunk_data, img_sizes in chunks:
         if db_task.mode == 'annotation':
             db_images.extend([
                 models.Image(
@@ -0,0 +1,83 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+# Benchmarks are not run by default. Use the following command to run them:
+# python manage.py test --pattern="_benchmark*.py" cvat/apps/engine/tests
+
+import json
+import time
+from io import BytesIO
+from unittest import TestCase
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from cvat.apps.engine.parsers import MsgPackParser
+from cvat.apps.engine.renderers import MsgPackRenderer
+from cvat.apps.engine.serializers import (LabeledDataSerializer,
+    LabeledDataValidator)
+
+
+def generate_tracks(track_count, shapes_per_track):
+    return {
+        "version": 0,
+        "tags": [],
+        "shapes": [],
+        "tracks": [{
+            "frame": 0,
+            "label_id": 1,
+            "group": None,
+            "attributes": [{"spec_id": 1, "value": "bmw"}],
+            "shapes": [{
+                "frame": frame,
+                "points": [1.0 + frame, 2.5, 100.0 + frame, 300.25],
+                "type": "rectangle",
+                "occluded": False,
+                "outside": False,
+                "z_order": 0,
+                "attributes": [{"spec_id": 2, "value": "true"}],
+            } for frame in range(shapes_per_track)],
+        } for _ in range(track_count)],
+    }
+
+class AnnotationTransportBenchmark(TestCase):
+    TRACK_COUNT = 2000
+    SHAPES_PER_TRACK = 100
+
+    @staticmethod
+    def _transfer_json(payload):
+        data = JSONParser().parse(BytesIO(payload))
+        serializer = LabeledDataSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.data
+        return data, JSONRenderer().render(data)
+
+    @staticmethod
+    def _transfer_msgpack(payload):
+        data = MsgPackParser().parse(BytesIO(payload))
+        data = LabeledDataValidator().validate(data)
+        return data, MsgPackRenderer().render(data)
+
+    def test_transfer(self):
+        data = generate_tracks(self.TRACK_COUNT, self.SHAPES_PER_TRACK)
+        json_payload = json.dumps(data).encode()
+        msgpack_payload = MsgPackRenderer().render(data)
+
+        start = time.perf_counter()
+        json_data, json_response = self._transfer_json(json_payload)
+        json_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        msgpack_data, msgpack_response = self._transfer_msgpack(
+            msgpack_payload)
+        msgpack_time = time.perf_counter() - start
+
+        print("\nParsing, validation and rendering of {} tracked shapes: "
+            "JSON {:.2f}s ({} KB), MessagePack {:.2f}s ({} KB, x{:.2f})".format(
+            self.TRACK_COUNT * self.SHAPES_PER_TRACK,
+            json_time, len(json_response) // 1024,
+            msgpack_time, len(msgpack_response) // 1024,
+            json_time / msgpack_time))
+
+        self.assertEqual(json.loads(json.dumps(json_data)), msgpack_data)
@@ -0,0 +1,83 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+# Benchmarks are not run by default. Use the following command to run them:
+# python manage.py test --pattern="_benchmark*.py" cvat/apps/engine/tests
+
+import itertools
+import os
+import os.path as osp
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+from PIL import Image
+
+from cvat.apps.engine.media_extractors import (ImageListReader,
+    ZipChunkWriter, ZipCompressedChunkWriter)
+from cvat.apps.engine.task import _save_chunks
+
+
+def generate_images(dst_dir, count, width=1920, height=1080):
+    paths = []
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)
+    for idx in range(count):
+        image = np.empty((height, width, 3), dtype=np.uint8)
+        image[:, :, 0] = gradient
+        image[:, :, 1] = np.roll(gradient, idx * 7)
+        image[:, :, 2] = np.random.randint(0, 255, (height, width),
+            dtype=np.uint8)
+        path = osp.join(dst_dir, '{:06d}.png'.format(idx))
+        Image.fromarray(image).save(path)
+        paths.append(path)
+    return paths
+
+class ChunkEncodingBenchmark(TestCase):
+    IMAGE_COUNT = 48
+    CHUNK_SIZE = 8
+
+    def _save_chunks(self, source_paths, output_dir, max_workers):
+        original_dir = osp.join(output_dir, 'original')
+        compressed_dir = osp.join(output_dir, 'compressed')
+        os.makedirs(original_dir)
+        os.makedirs(compressed_dir)
+
+        extractor = ImageListReader(source_paths)
+        counter = itertools.count()
+        chunks = itertools.groupby(extractor,
+            lambda x: next(counter) // self.CHUNK_SIZE)
+
+        start = time.perf_counter()
+        result = [(chunk_idx, [frame for _, _, frame in chunk_data], img_sizes)
+            for chunk_idx, chunk_data, img_sizes in _save_chunks(chunks,
+                original_chunk_writer=ZipChunkWriter(100),
+                compressed_chunk_writer=ZipCompressedChunkWriter(50),
+                get_original_chunk_path=lambda i: osp.join(original_dir,
+                    '{}.zip'.format(i)),
+                get_compressed_chunk_path=lambda i: osp.join(compressed_dir,
+                    '{}.zip'.format(i)),
+                max_workers=max_workers)
+        ]
+        return time.perf_counter() - start, result
+
+    def test_parallel_chunk_encoding(self):
+        max_workers = min(4, os.cpu_count() or 1)
+
+        with TemporaryDirectory() as test_dir:
+            raw_dir = osp.join(test_dir, 'raw')
+            os.makedirs(raw_dir)
+            source_paths = generate_images(raw_dir, self.IMAGE_COUNT)
+
+            serial_time, serial_result = self._save_chunks(source_paths,
+                osp.join(test_dir, 'serial'), max_workers=1)
+            parallel_time, parallel_result = self._save_chunks(source_paths,
+                osp.join(test_dir, 'parallel'), max_workers=max_workers)
+
+        print("\nChunk encoding of {} images: serial {:.2f}s, "
+            "{} workers {:.2f}s (x{:.2f})".format(self.IMAGE_COUNT,
+            serial_time, max_workers, parallel_time,
+            serial_time / parallel_time))
+
+        self.assertEqual(serial_result, parallel_result)
@@ -55,10 +55,12 @@ def _setUpModule():
     # _GitImportFix.restore()
 
 import io
+import json
 import os
 import os.path as osp
 import random
 import shutil
+import tarfile
 import tempfile
 import xml.etree.ElementTree as ET
 import zipfile
@@ -69,16 +71,21 @@ from io import BytesIO
 from unittest import mock
 
 import av
+import msgpack
 import numpy as np
 from django.conf import settings
 from django.contrib.auth.models import Group, User
 from PIL import Image
 from pycocotools import coco as coco_loader
-from rest_framework import status
+from rest_framework import serializers, status
 from rest_framework.test import APIClient, APITestCase
 
-from cvat.apps.engine.models import (AttributeType, Data, Job, Project,
-    Segment, StatusChoice, Task)
+from cvat.apps.engine.frame_provider import FrameProvider
+from cvat.apps.engine.models import (AttributeType, Data, Job, JobCommit,
+    LabeledShape, Project, Segment, StatusChoice, Task)
+from cvat.apps.engine.renderers import MsgPackRenderer
+from cvat.apps.engine.serializers import (LabeledDataSerializer,
+    LabeledDataValidator)
 
 _setUpModule()
 
@@ -1526,6 +1533,23 @@ def generate_zip_archive_file(filename, count):
     zip_buf.seek(0)
     return image_sizes, zip_buf
 
+def generate_tar_archive_file(filename, count):
+    image_sizes = []
+    tar_buf = BytesIO()
+    with tarfile.open(fileobj=tar_buf, mode='w:gz') as tar:
+        # Images are stored in the reverse order
+        for idx in reversed(range(count)):
+            image_name = "image_{:6d}.jpg".format(idx)
+            size, image_buf = generate_image_file(image_name)
+            image_sizes.insert(0, size)
+            info = tarfile.TarInfo(image_name)
+            info.size = len(image_buf.getvalue())
+            tar.addfile(info, image_buf)
+
+    tar_buf.name = filename
+    tar_buf.seek(0)
+    return image_sizes, tar_buf
+
 class TaskDataAPITestCase(APITestCase):
     _image_sizes = {}
 
@@ -1664,6 +1688,13 @@ class TaskDataAPITestCase(APITestCase):
         chunk = zipfile.ZipFile(chunk_buffer, mode='r')
         return [Image.open(BytesIO(chunk.read(f))) for f in sorted(chunk.namelist())]
 
+    @staticmethod
+    def _extract_tar_archive(archive_buffer):
+        archive_buffer.seek(0)
+        with tarfile.open(fileobj=archive_buffer, mode='r:*') as archive:
+            return [Image.open(BytesIO(archive.extractfile(m).read()))
+                for m in sorted(archive.getmembers(), key=lambda m: m.name)]
+
     @staticmethod
     def _extract_video_chunk(chunk_buffer):
         container = av.open(chunk_buffer)
@@ -1694,6 +1725,8 @@ class TaskDataAPITestCase(APITestCase):
             self.assertEqual(expected_compressed_type, task["data_compressed_chunk_type"])
             self.assertEqual(expected_original_type, task["data_original_chunk_type"])
             self.assertEqual(len(image_sizes), task["size"])
+            self.assertEqual(data.get("storage_method", "file_system"),
+                task["data_storage_method"])
 
         # check preview
         response = self._get_preview(task_id, user)
@@ -1732,6 +1765,20 @@ class TaskDataAPITestCase(APITestCase):
 
             self.assertEqual(len(images), min(task["data_chunk_size"], len(image_sizes)))
 
+            if task["data_original_chunk_type"] == self.ChunkType.VIDEO:
+                # Frames are encoded losslessly for internal consumers
+                frame_provider = FrameProvider(Task.objects.get(id=task_id).data)
+                self.assertEqual("image/png", frame_provider.get_frame(0)[1])
+
+                response = self._get_original_frame(task_id, user, 0)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual("image/png", response["Content-Type"])
+
+                with self.settings(FRAME_ENCODING="jpeg"):
+                    response = self._get_original_frame(task_id, user, 0)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual("image/jpeg", response["Content-Type"])
+
             if task["data_original_chunk_type"] == self.ChunkType.IMAGESET:
                 server_files = [img for key, img in data.items() if key.startswith("server_files")]
                 client_files = [img for key, img in data.items() if key.startswith("client_files")]
@@ -1745,6 +1792,8 @@ class TaskDataAPITestCase(APITestCase):
                 for f in source_files:
                     if zipfile.is_zipfile(f):
                         source_images.extend(self._extract_zip_chunk(f))
+                    elif getattr(f, "name", "").endswith(".tar.gz"):
+                        source_images.extend(self._extract_tar_archive(f))
                     else:
                         source_images.append(Image.open(f))
 
@@ -1909,6 +1958,59 @@ class TaskDataAPITestCase(APITestCase):
 
         self._test_api_v1_tasks_id_data_spec(user, task_spec, task_data, self.ChunkType.IMAGESET, self.ChunkType.IMAGESET, image_sizes)
 
+        task_spec = {
+            "name": "my tar archive task #8",
+            "overlap": 0,
+            "segment_size": 0,
+            "labels": [
+                {"name": "car"},
+                {"name": "person"},
+            ]
+        }
+        image_sizes, archive = generate_tar_archive_file("test_archive_3.tar.gz", 7)
+        task_data = {
+            "client_files[0]": archive,
+            "image_quality": 100,
+        }
+
+        self._test_api_v1_tasks_id_data_spec(user, task_spec, task_data, self.ChunkType.IMAGESET, self.ChunkType.IMAGESET, image_sizes)
+
+        task_spec = {
+            "name": "my cached video task #9",
+            "overlap": 0,
+            "segment_size": 0,
+            "labels": [
+                {"name": "car"},
+                {"name": "person"},
+            ]
+        }
+        task_data = {
+            "server_files[0]": "test_video_1.mp4",
+            "image_quality": 70,
+            "storage_method": "cache",
+        }
+        image_sizes = self._image_sizes[task_data["server_files[0]"]]
+
+        self._test_api_v1_tasks_id_data_spec(user, task_spec, task_data, self.ChunkType.VIDEO, self.ChunkType.VIDEO, image_sizes)
+
+        task_spec = {
+            "name": "my cached archive task #10",
+            "overlap": 0,
+            "segment_size": 0,
+            "labels": [
+                {"name": "car"},
+                {"name": "person"},
+            ]
+        }
+        task_data = {
+            "server_files[0]": "test_archive_1.zip",
+            "image_quality": 70,
+            "storage_method": "cache",
+        }
+        image_sizes = self._image_sizes[task_data["server_files[0]"]]
+
+        self._test_api_v1_tasks_id_data_spec(user, task_spec, task_data, self.ChunkType.IMAGESET, self.ChunkType.IMAGESET, image_sizes)
+
     def test_api_v1_tasks_id_data_admin(self):
         self._test_api_v1_tasks_id_data(self.admin)
 
@@ -2483,6 +2585,313 @@ class JobAnnotationAPITestCase(APITestCase):
     def test_api_v1_jobs_id_annotations_no_auth(self):
         self._run_api_v1_jobs_id_annotations(self.user, self.assignee, None)
 
+    @staticmethod
+    def _generate_labeled_data(task):
+        label = task["labels"][0]
+        return {
+            "version": 0,
+            "tags": [{
+                "frame": 1,
+                "label_id": label["id"],
+                "group": None,
+                "attributes": [],
+            }],
+            "shapes": [{
+                "frame": 0,
+                "label_id": label["id"],
+                "group": 1,
+                "attributes": [{
+                    "spec_id": label["attributes"][0]["id"],
+                    "value": label["attributes"][0]["values"][0],
+                }],
+                "points": [1.0, 2.1, 100, 300.222],
+                "type": "rectangle",
+                "occluded": False,
+            }],
+            "tracks": [{
+                "frame": 0,
+                "label_id": label["id"],
+                "group": None,
+                "attributes": [],
+                "shapes": [{
+                    "frame": 0,
+                    "points": [1.0, 2.1, 100, 300.222],
+                    "type": "polygon",
+                    "occluded": False,
+                    "outside": False,
+                    "z_order": 2,
+                    "attributes": [{
+                        "spec_id": label["attributes"][1]["id"],
+                        "value": "true",
+                    }],
+                }],
+            }],
+        }
+
+    def test_labeled_data_validator_matches_serializer(self):
+        task = {"labels": [{"id": 1, "attributes": [
+            {"id": 1, "values": ["bmw"]}, {"id": 2}]}]}
+        data = self._generate_labeled_data(task)
+        data["shapes"][0]["extra_field"] = 1
+        data["shapes"][0]["attributes"][0]["value"] = " bmw "
+
+        serializer = LabeledDataSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        self.assertEqual(json.loads(json.dumps(serializer.data)),
+            LabeledDataValidator().validate(data))
+
+        for path, value in [
+            (["shapes", 0, "points"], []),
+            (["shapes", 0, "type"], "circle"),
+            (["tags", 0, "frame"], -1),
+            (["tracks", 0, "shapes"], []),
+            (["tracks", 0, "shapes", 0, "outside"], None),
+            (["shapes", 0, "attributes", 0, "value"], "a" * 4097),
+        ]:
+            with self.subTest(path=path):
+                invalid_data = json.loads(json.dumps(data))
+                obj = invalid_data
+                for key in path[:-1]:
+                    obj = obj[key]
+                obj[path[-1]] = value
+
+                with self.assertRaises(serializers.ValidationError):
+                    LabeledDataValidator().validate(invalid_data)
+
+                serializer = LabeledDataSerializer(data=invalid_data)
+                self.assertFalse(serializer.is_valid())
+
+        # Null values of attributes are saved as empty strings
+        data["shapes"][0]["attributes"][0]["value"] = None
+        serializer = LabeledDataSerializer(data=json.loads(json.dumps(data)))
+        serializer.is_valid(raise_exception=True)
+        validated_data = LabeledDataValidator().validate(data)
+        self.assertEqual("",
+            validated_data["shapes"][0]["attributes"][0]["value"])
+        self.assertEqual(json.loads(json.dumps(serializer.data)),
+            validated_data)
+
+    def test_api_v1_jobs_id_annotations_msgpack(self):
+        task, jobs = self._create_task(self.user, self.assignee)
+        url = "/api/v1/jobs/{}/annotations".format(jobs[0]["id"])
+        data = self._generate_labeled_data(task)
+
+        response = self._put_api_v1_jobs_id_data(jobs[0]["id"],
+            self.assignee, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        json_data = response.data
+
+        with ForceLogin(self.assignee, self.client):
+            response = self.client.put(url, data=msgpack.packb(data),
+                content_type=MsgPackRenderer.media_type,
+                HTTP_ACCEPT=MsgPackRenderer.media_type)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response["Content-Type"],
+                MsgPackRenderer.media_type)
+            put_data = msgpack.unpackb(response.content, raw=False)
+
+            response = self.client.get(url,
+                HTTP_ACCEPT=MsgPackRenderer.media_type)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            get_data = msgpack.unpackb(response.content, raw=False)
+            json_get_data = self.client.get(url).data
+
+            invalid_data = json.loads(json.dumps(data))
+            del invalid_data["shapes"][0]["points"]
+            response = self.client.patch(url + "?action=create",
+                data=msgpack.packb(invalid_data),
+                content_type=MsgPackRenderer.media_type)
+            self.assertEqual(response.status_code,
+                status.HTTP_400_BAD_REQUEST)
+
+        compare_objects(self, json_data, put_data,
+            ignore_keys=["id", "version"])
+        compare_objects(self, json_get_data, get_data, ignore_keys=[])
+
+    def test_api_v1_jobs_id_annotations_frame_range(self):
+        task, jobs = self._create_task(self.user, self.assignee)
+        url = "/api/v1/jobs/{}/annotations".format(jobs[0]["id"])
+        label_id = task["labels"][1]["id"]
+
+        def shape(frame, outside=None):
+            shape = {"frame": frame, "label_id": label_id, "group": None,
+                "attributes": [], "points": [1.0, 2.0, 3.0, 4.0],
+                "type": "rectangle", "occluded": False}
+            if outside is not None:
+                shape["outside"] = outside
+            return shape
+
+        def track(*shapes):
+            return {"frame": shapes[0]["frame"], "label_id": label_id,
+                "group": None, "attributes": [], "shapes": list(shapes)}
+
+        data = {
+            "version": 0,
+            "tags": [{"frame": frame, "label_id": label_id, "group": None,
+                "attributes": []} for frame in [0, 2]],
+            "shapes": [shape(frame) for frame in [0, 1, 2]],
+            "tracks": [
+                track(shape(0, False)),
+                track(shape(0, False), shape(1, True)),
+                track(shape(2, False)),
+            ],
+        }
+        response = self._put_api_v1_jobs_id_data(jobs[0]["id"],
+            self.assignee, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with ForceLogin(self.assignee, self.client):
+            for query, tag_frames, shape_frames, track_shape_frames in [
+                ("", [0, 2], [0, 1, 2], [[0], [0, 1], [2]]),
+                ("?start_frame=2", [2], [2], [[0], [2]]),
+                ("?start_frame=1&stop_frame=1", [], [1], [[0], [0, 1]]),
+                ("?stop_frame=0", [0], [0], [[0], [0, 1]]),
+            ]:
+                with self.subTest(query=query):
+                    response = self.client.get(url + query)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+                    self.assertEqual(tag_frames,
+                        sorted(t["frame"] for t in response.data["tags"]))
+                    self.assertEqual(shape_frames,
+                        sorted(s["frame"] for s in response.data["shapes"]))
+                    self.assertEqual(track_shape_frames,
+                        sorted([s["frame"] for s in t["shapes"]]
+                            for t in response.data["tracks"]))
+
+            for query in ["?start_frame=a", "?stop_frame=-1",
+                    "?start_frame=2&stop_frame=1"]:
+                with self.subTest(query=query):
+                    response = self.client.get(url + query)
+                    self.assertEqual(response.status_code,
+                        status.HTTP_400_BAD_REQUEST)
+
+    def test_api_v1_jobs_id_annotations_update_keeps_ids(self):
+        task, jobs = self._create_task(self.user, self.assignee)
+        jid = jobs[0]["id"]
+        data = self._generate_labeled_data(task)
+        data["tags"] = []
+        data["tracks"] = []
+        data["shapes"] = [dict(data["shapes"][0], frame=frame)
+            for frame in range(3)]
+
+        response = self._put_api_v1_jobs_id_data(jid, self.assignee, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        shapes = response.data["shapes"]
+        shape_ids = sorted(shape["id"] for shape in shapes)
+
+        response = self._patch_api_v1_jobs_id_data(jid, self.assignee,
+            "update", {"version": 0, "tags": [], "tracks": [],
+                "shapes": [dict(shapes[0], occluded=True)]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([shapes[0]["id"]],
+            [shape["id"] for shape in response.data["shapes"]])
+        self.assertEqual(shape_ids, sorted(LabeledShape.objects \
+            .filter(job_id=jid).values_list("id", flat=True)))
+
+        # Ids of deleted objects are not given to new ones
+        last_shape = max(shapes, key=lambda shape: shape["id"])
+        response = self._patch_api_v1_jobs_id_data(jid, self.assignee,
+            "delete", {"version": 0, "tags": [], "tracks": [],
+                "shapes": [last_shape]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self._patch_api_v1_jobs_id_data(jid, self.assignee,
+            "create", {"version": 0, "tags": [], "tracks": [],
+                "shapes": [dict(last_shape, id=None)]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(last_shape["id"], response.data["shapes"][0]["id"])
+
+    def test_api_v1_jobs_id_annotations_since_version(self):
+        task, jobs = self._create_task(self.user, self.assignee)
+        jid = jobs[0]["id"]
+        url = "/api/v1/jobs/{}/annotations".format(jid)
+        data = self._generate_labeled_data(task)
+        data["shapes"].append(dict(data["shapes"][0], frame=2))
+
+        response = self._put_api_v1_jobs_id_data(jid, self.assignee, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tag = response.data["tags"][0]
+        updated_shape, kept_shape = response.data["shapes"]
+        version = response.data["version"]
+
+        new_data = self._generate_labeled_data(task)
+        new_data["tags"] = []
+        new_data["tracks"] = []
+        response = self._patch_api_v1_jobs_id_data(jid, self.assignee,
+            "create", new_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        created_shape = response.data["shapes"][0]
+
+        response = self._patch_api_v1_jobs_id_data(jid, self.assignee,
+            "update", {"version": 0, "tags": [], "tracks": [],
+                "shapes": [dict(updated_shape, occluded=True)]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self._patch_api_v1_jobs_id_data(jid, self.assignee,
+            "delete", {"version": 0, "tags": [tag], "shapes": [], "tracks": []})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        last_version = response.data["version"]
+
+        with ForceLogin(self.assignee, self.client):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            full_data = response.data
+
+            response = self.client.get(url + "?since_version={}".format(version))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            changes = response.data
+
+            response = self.client.get(
+                url + "?since_version={}".format(last_version))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            no_changes = response.data
+
+            response = self.client.get(url + "?since_version=0")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            all_changes = response.data
+
+            response = self.client.get(url + "?since_version=0&start_frame=0")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+            JobCommit.objects.filter(job_id=jid, version=version) \
+                .update(changes=None)
+            response = self.client.get(url + "?since_version=0")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            unknown_changes = response.data
+
+        self.assertEqual(last_version, changes["version"])
+        self.assertEqual([], changes["tags"])
+        self.assertEqual([], changes["tracks"])
+        self.assertEqual(sorted(s["id"] for s in full_data["shapes"]
+                if s["id"] != kept_shape["id"]),
+            sorted(s["id"] for s in changes["shapes"]))
+        self.assertTrue(any(s["id"] == created_shape["id"] and
+            not s["occluded"] for s in changes["shapes"]))
+        self.assertTrue(any(s["id"] != created_shape["id"] and
+            s["occluded"] for s in changes["shapes"]))
+        self.assertEqual([tag["id"]], changes["deleted"]["tags"])
+        self.assertEqual([], changes["deleted"]["tracks"])
+        self.assertEqual([], changes["deleted"]["shapes"])
+        self.assertEqual({"deleted": {"tags": [], "shapes": [], "tracks": []},
+            "created": {"tags": [], "shapes": [], "tracks": []},
+            "updated": {"tags": [], "shapes": [updated_shape["id"]], "tracks": []}},
+            json.loads(JobCommit.objects.get(job_id=jid,
+                version=last_version - 1).changes))
+
+        self.assertEqual({"version": last_version, "tags": [], "shapes": [],
+            "tracks": [], "deleted": {"tags": [], "shapes": [], "tracks": []}},
+            dict(no_changes))
+
+        for field in ["tags", "shapes", "tracks"]:
+            self.assertEqual(sorted(obj["id"] for obj in full_data[field]),
+                sorted(obj["id"] for obj in all_changes[field]))
+
+        self.assertEqual(None, unknown_changes["deleted"])
+        compare_objects(self, full_data, unknown_changes,
+            ignore_keys=["deleted"])
+
 class TaskAnnotationAPITestCase(JobAnnotationAPITestCase):
     def _put_api_v1_tasks_id_annotations(self, pk, user, data):
         with ForceLogin(user, self.client):
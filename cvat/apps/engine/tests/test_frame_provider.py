@@ -0,0 +1,181 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import os.path as osp
+import time
+import zipfile
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import TestCase, mock
+
+from django.test import TestCase as DjangoTestCase, override_settings
+from PIL import Image
+
+from cvat.apps.engine.frame_provider import (ChunkReaderCache,
+    CompressedChunkCache)
+from cvat.apps.engine.media_extractors import (ZipChunkWriter,
+    ZipCompressedChunkWriter)
+from cvat.apps.engine.models import Data, StorageMethodChoice
+
+
+class ChunkReaderCacheTest(TestCase):
+    def _create_chunk(self, test_dir, name, size):
+        path = osp.join(test_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'\0' * size)
+        return path
+
+    def test_can_reuse_readers(self):
+        with TemporaryDirectory() as test_dir:
+            path = self._create_chunk(test_dir, '0.zip', 10)
+            cache = ChunkReaderCache(max_size=100)
+
+            entry1 = cache.get((1, 0), path, object)
+            entry2 = cache.get((1, 0), path, object)
+
+            self.assertIs(entry1.reader, entry2.reader)
+            stats = cache.get_stats()
+            self.assertEqual(1, stats['hits'])
+            self.assertEqual(1, stats['misses'])
+
+    def test_can_evict_least_recently_used_readers(self):
+        with TemporaryDirectory() as test_dir:
+            paths = [self._create_chunk(test_dir, '{}.zip'.format(i), 40)
+                for i in range(3)]
+            cache = ChunkReaderCache(max_size=100)
+
+            first = cache.get((1, 0), paths[0], object)
+            cache.get((1, 1), paths[1], object)
+            cache.get((1, 0), paths[0], object)
+            cache.get((1, 2), paths[2], object)
+
+            self.assertIs(first.reader,
+                cache.get((1, 0), paths[0], object).reader)
+            stats = cache.get_stats()
+            self.assertEqual(1, stats['evictions'])
+            self.assertEqual(2, stats['entries'])
+            self.assertEqual(80, stats['size'])
+
+    def test_can_skip_too_big_chunks(self):
+        with TemporaryDirectory() as test_dir:
+            path = self._create_chunk(test_dir, '0.zip', 200)
+            cache = ChunkReaderCache(max_size=100)
+
+            entry1 = cache.get((1, 0), path, object)
+            entry2 = cache.get((1, 0), path, object)
+
+            self.assertIsNot(entry1.reader, entry2.reader)
+            self.assertEqual(0, cache.get_stats()['entries'])
+
+    def test_can_detect_recreated_chunks(self):
+        with TemporaryDirectory() as test_dir:
+            path = self._create_chunk(test_dir, '0.zip', 10)
+            cache = ChunkReaderCache(max_size=100)
+
+            entry1 = cache.get((1, 0), path, object)
+            stat = os.stat(path)
+            os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+            entry2 = cache.get((1, 0), path, object)
+
+            self.assertIsNot(entry1.reader, entry2.reader)
+            self.assertEqual(10, cache.get_stats()['size'])
+
+class CompressedChunkCacheTest(DjangoTestCase):
+    CHUNK_SIZE = 2
+
+    def setUp(self):
+        test_dir = TemporaryDirectory()
+        self.addCleanup(test_dir.cleanup)
+        settings_override = override_settings(MEDIA_DATA_ROOT=test_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.db_data = Data.objects.create(chunk_size=self.CHUNK_SIZE,
+            size=3 * self.CHUNK_SIZE, image_quality=50,
+            storage_method=StorageMethodChoice.CACHE)
+        os.makedirs(self.db_data.get_original_cache_dirname())
+        os.makedirs(self.db_data.get_compressed_cache_dirname())
+
+        # Chunks are equal, so compressed chunks have equal sizes
+        images = []
+        for i in range(self.CHUNK_SIZE):
+            image = BytesIO()
+            Image.new('RGB', (40, 20 + i)).save(image, 'PNG')
+            images.append((image, '{}.png'.format(i), i))
+        for chunk_number in range(3):
+            ZipChunkWriter(100).save_as_chunk(images,
+                self.db_data.get_original_chunk_path(chunk_number))
+
+    def test_can_create_chunk_once(self):
+        cache = CompressedChunkCache(max_size=0)
+        save_as_chunk = ZipCompressedChunkWriter.save_as_chunk
+        with mock.patch.object(ZipCompressedChunkWriter, 'save_as_chunk',
+                autospec=True, side_effect=save_as_chunk) as writer:
+            path1 = cache.get_chunk_path(self.db_data, 1)
+            path2 = cache.get_chunk_path(self.db_data, 1)
+
+        self.assertEqual(self.db_data.get_compressed_chunk_path(1), path1)
+        self.assertEqual(path1, path2)
+        self.assertEqual(1, writer.call_count)
+        with zipfile.ZipFile(path1) as chunk:
+            self.assertEqual(['000000.jpeg', '000001.jpeg'],
+                sorted(chunk.namelist()))
+            self.assertEqual((40, 21),
+                Image.open(BytesIO(chunk.read('000001.jpeg'))).size)
+        self.assertEqual([osp.basename(path1)], os.listdir(osp.dirname(path1)))
+
+    def test_can_create_chunk_once_for_concurrent_requests(self):
+        cache = CompressedChunkCache(max_size=0)
+        save_as_chunk = ZipCompressedChunkWriter.save_as_chunk
+        def slow_save_as_chunk(*args):
+            time.sleep(0.2)
+            return save_as_chunk(*args)
+
+        with mock.patch.object(ZipCompressedChunkWriter, 'save_as_chunk',
+                autospec=True, side_effect=slow_save_as_chunk) as writer:
+            threads = [Thread(target=cache.get_chunk_path,
+                args=(self.db_data, 0)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(1, writer.call_count)
+        self.assertTrue(osp.isfile(self.db_data.get_compressed_chunk_path(0)))
+
+    def test_can_evict_least_recently_used_chunks(self):
+        paths = [CompressedChunkCache(max_size=0).get_chunk_path(
+            self.db_data, chunk_number) for chunk_number in range(2)]
+        chunk_size = os.stat(paths[0]).st_size
+        os.utime(paths[1], (1000, os.stat(paths[1]).st_mtime))
+        os.utime(paths[0], (2000, os.stat(paths[0]).st_mtime))
+
+        cache = CompressedChunkCache(max_size=2 * chunk_size + chunk_size // 2)
+        cache.get_chunk_path(self.db_data, 0)
+        path = cache.get_chunk_path(self.db_data, 2)
+
+        self.assertTrue(osp.isfile(paths[0]))
+        self.assertFalse(osp.exists(paths[1]))
+        self.assertTrue(osp.isfile(path))
+
+    def test_can_evict_chunks_without_scanning_cache(self):
+        chunk_size = os.stat(CompressedChunkCache(max_size=0).get_chunk_path(
+            self.db_data, 0)).st_size
+        os.remove(self.db_data.get_compressed_chunk_path(0))
+
+        cache = CompressedChunkCache(max_size=2 * chunk_size + chunk_size // 2)
+        with mock.patch.object(cache, '_scan', wraps=cache._scan) as scan:
+            paths = [cache.get_chunk_path(self.db_data, chunk_number)
+                for chunk_number in range(2)]
+            cache.get_chunk_path(self.db_data, 0)
+            path = cache.get_chunk_path(self.db_data, 2)
+
+        self.assertEqual(1, scan.call_count)
+        self.assertTrue(osp.isfile(paths[0]))
+        self.assertFalse(osp.exists(paths[1]))
+        self.assertTrue(osp.isfile(path))
+        self.assertEqual(sorted([osp.basename(paths[0]), osp.basename(path)]),
+            sorted(os.listdir(osp.dirname(path))))
@@ -0,0 +1,144 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import io
+import os
+import os.path as osp
+import tarfile
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+
+from PIL import Image, ImageFile
+
+from cvat.apps.engine.media_extractors import (MEDIA_TYPES, TarReader,
+    ZipChunkWriter, ZipCompressedChunkWriter, get_mime, probe_image_size)
+
+
+class TarReaderTest(TestCase):
+    @staticmethod
+    def _generate_archive(path, names, mode):
+        images = {}
+        with tarfile.open(path, mode) as tar:
+            for i, name in enumerate(names):
+                image = io.BytesIO()
+                Image.new('RGB', (10 + i, 20)).save(image, 'PNG')
+                images[name] = image.getvalue()
+
+                info = tarfile.TarInfo(name)
+                info.size = len(images[name])
+                image.seek(0)
+                tar.addfile(info, image)
+
+            info = tarfile.TarInfo('data/readme.txt')
+            info.size = 1
+            tar.addfile(info, io.BytesIO(b'a'))
+        return images
+
+    def test_can_read_images_in_order(self):
+        # Members are stored out of the name order
+        names = ['data/{}.png'.format(i) for i in [3, 0, 5, 1, 2, 6, 4]]
+
+        for ext, mode in [('tar', 'w'), ('tar.gz', 'w:gz')]:
+            with self.subTest(format=ext), TemporaryDirectory() as test_dir:
+                path = osp.join(test_dir, 'images.' + ext)
+                images = self._generate_archive(path, names, mode)
+                expected_names = sorted(images)[1::2]
+
+                reader = MEDIA_TYPES['archive']['extractor']([path],
+                    step=2, start=1)
+                frames = [(image.getvalue(), image_path, frame)
+                    for image, image_path, frame in reader]
+
+                self.assertEqual('archive', get_mime(path))
+                self.assertIsInstance(reader, TarReader)
+                self.assertEqual([(images[name], osp.join(test_dir, name), i)
+                        for i, name in enumerate(sorted(images))
+                        if name in expected_names],
+                    frames)
+                self.assertEqual((10 + names.index('data/0.png'), 20),
+                    reader.get_image_size())
+
+    def test_can_read_compressed_archive_in_one_pass(self):
+        # Only one member is stored before the preceding frame
+        names = ['data/{:02d}.png'.format(i) for i in [1, 0] + list(range(2, 10))]
+
+        with TemporaryDirectory() as test_dir:
+            path = osp.join(test_dir, 'images.tar.gz')
+            images = self._generate_archive(path, names, 'w:gz')
+
+            reader = TarReader([path])
+            self.assertIsNone(reader._tmp_dir)
+            frames = [image.getvalue() for image, _, _ in reader]
+
+            self.assertEqual([images[name] for name in sorted(images)], frames)
+            self.assertEqual([], os.listdir(reader._tmp_dir))
+
+    def test_can_extract_compressed_archive_stored_out_of_order(self):
+        names = ['data/{:02d}.png'.format(i) for i in reversed(range(10))]
+
+        with TemporaryDirectory() as test_dir:
+            path = osp.join(test_dir, 'images.tar.gz')
+            images = self._generate_archive(path, names, 'w:gz')
+
+            reader = TarReader([path])
+            self.assertEqual(len(names), len(os.listdir(reader._tmp_dir)))
+            with mock.patch.object(reader, '_extract') as extract:
+                frames = [image.getvalue() for image, _, _ in reader]
+                frames_again = [image.getvalue() for image, _, _ in reader]
+
+            extract.assert_not_called()
+            self.assertEqual([images[name] for name in sorted(images)], frames)
+            self.assertEqual(frames, frames_again)
+
+    def test_can_delete_reader_of_invalid_archive(self):
+        with TemporaryDirectory() as test_dir:
+            path = osp.join(test_dir, 'images.tar')
+            with open(path, 'wb') as f:
+                f.write(b'not a tar archive')
+
+            reader = TarReader.__new__(TarReader)
+            with self.assertRaises(tarfile.ReadError):
+                reader.__init__([path])
+            reader.__del__()
+
+class ImageSizeTest(TestCase):
+    @staticmethod
+    def _generate_images(test_dir):
+        images = []
+        for i, (ext, mode) in enumerate([('jpeg', 'RGB'), ('png', 'RGBA'),
+                ('png', 'I'), ('bmp', 'L')]):
+            path = osp.join(test_dir, '{}.{}'.format(i, ext))
+            Image.new(mode, (30 + i, 10 + 2 * i)).save(path)
+            images.append(path)
+        return images
+
+    def test_can_probe_size_without_decoding(self):
+        with TemporaryDirectory() as test_dir:
+            paths = self._generate_images(test_dir)
+            buffers = []
+            for path in paths:
+                with open(path, 'rb') as f:
+                    buffers.append(io.BytesIO(f.read()))
+
+            with mock.patch.object(ImageFile.ImageFile, 'load',
+                    side_effect=AssertionError('image is decoded')):
+                sizes = [probe_image_size(path) for path in paths]
+                buffer_sizes = [probe_image_size(buf) for buf in buffers]
+
+            self.assertEqual([(30 + i, 10 + 2 * i) for i in range(len(paths))],
+                sizes)
+            self.assertEqual(sizes, buffer_sizes)
+            self.assertEqual([0] * len(buffers), [b.tell() for b in buffers])
+
+    def test_original_chunk_has_same_sizes_as_compressed(self):
+        with TemporaryDirectory() as test_dir:
+            paths = self._generate_images(test_dir)
+            images = [(path, path, i) for i, path in enumerate(paths)]
+
+            original_sizes = ZipChunkWriter(100).save_as_chunk(images,
+                osp.join(test_dir, 'original.zip'))
+            compressed_sizes = ZipCompressedChunkWriter(50).save_as_chunk(
+                images, osp.join(test_dir, 'compressed.zip'))
+
+            self.assertEqual(compressed_sizes, original_sizes)
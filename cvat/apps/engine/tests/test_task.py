@@ -0,0 +1,229 @@
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import os.path as osp
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+
+from django.test import override_settings
+
+from cvat.apps.engine import task
+from cvat.apps.engine.media_extractors import Mpeg4ChunkWriter
+
+
+class CopyDataFromShareTest(TestCase):
+    def _copy_data(self, test_dir, mode):
+        share_dir = osp.join(test_dir, 'share')
+        upload_dir = osp.join(test_dir, 'raw')
+        os.makedirs(osp.join(share_dir, 'images', 'nested'))
+        os.makedirs(upload_dir)
+        for path in ['1.jpg', osp.join('images', '2.jpg'),
+                osp.join('images', 'nested', '3.jpg')]:
+            with open(osp.join(share_dir, path), 'w') as f:
+                f.write(path)
+
+        with override_settings(SHARE_ROOT=share_dir,
+                SHARE_INGESTION_MODE=mode), \
+                mock.patch('rq.get_current_job'):
+            task._copy_data_from_share(['1.jpg', 'images'], upload_dir)
+
+        paths = []
+        for root, _, files in os.walk(upload_dir, followlinks=True):
+            for name in files:
+                path = osp.relpath(osp.join(root, name), upload_dir)
+                with open(osp.join(upload_dir, path)) as f:
+                    self.assertEqual(path, f.read())
+                paths.append(path)
+        self.assertEqual(['1.jpg', osp.join('images', '2.jpg'),
+            osp.join('images', 'nested', '3.jpg')], sorted(paths))
+
+        return share_dir, upload_dir
+
+    def test_can_link_files(self):
+        with TemporaryDirectory() as test_dir:
+            share_dir, upload_dir = self._copy_data(test_dir, 'link')
+
+            self.assertTrue(osp.samefile(osp.join(share_dir, 'images', '2.jpg'),
+                osp.join(upload_dir, 'images', '2.jpg')))
+
+    def test_can_copy_files_if_links_are_not_supported(self):
+        with TemporaryDirectory() as test_dir, \
+                mock.patch('os.link', side_effect=OSError), \
+                mock.patch.object(task, '_reflink_file', return_value=False):
+            share_dir, upload_dir = self._copy_data(test_dir, 'link')
+
+            self.assertFalse(osp.samefile(osp.join(share_dir, '1.jpg'),
+                osp.join(upload_dir, '1.jpg')))
+
+    def test_can_copy_files(self):
+        with TemporaryDirectory() as test_dir:
+            share_dir, upload_dir = self._copy_data(test_dir, 'copy')
+
+            self.assertFalse(osp.samefile(osp.join(share_dir, '1.jpg'),
+                osp.join(upload_dir, '1.jpg')))
+
+    def test_can_symlink_files(self):
+        with TemporaryDirectory() as test_dir:
+            _, upload_dir = self._copy_data(test_dir, 'symlink')
+
+            self.assertTrue(osp.islink(osp.join(upload_dir, 'images')))
+
+
+class _FrameCheckingWriter(Mpeg4ChunkWriter):
+    # Checks that frames of a chunk are not used by several writers
+    # at the same time, as real writers modify them
+
+    _lock = threading.Lock()
+    _used_frames = set()
+
+    def save_as_chunk(self, images, chunk_path):
+        with self._lock:
+            frame_ids = {id(frame) for frame, _, _ in images}
+            if frame_ids & self._used_frames:
+                raise AssertionError("Frames are used by several writers")
+            self._used_frames.update(frame_ids)
+        time.sleep(0.05)
+        with self._lock:
+            self._used_frames.difference_update(frame_ids)
+        return [(len(images), len(chunk_path))]
+
+class SaveChunksTest(TestCase):
+    def test_can_save_chunks_in_parallel(self):
+        chunks = [(chunk_idx, [(object(), str(idx), idx)
+                for idx in range(chunk_idx * 2, chunk_idx * 2 + 2)])
+            for chunk_idx in range(6)]
+
+        result = list(task._save_chunks(iter(chunks),
+            _FrameCheckingWriter(100), _FrameCheckingWriter(50),
+            lambda chunk_idx: 'original_{}'.format(chunk_idx),
+            lambda chunk_idx: 'compressed_chunk_{}'.format(chunk_idx),
+            max_workers=3))
+
+        self.assertEqual([(chunk_idx, chunk_data,
+                [(2, len('compressed_chunk_{}'.format(chunk_idx)))])
+            for chunk_idx, chunk_data in chunks], result)
+
+class _FileServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, files, broken_files=None, support_ranges=True):
+        self.files = files
+        # Responses for these files are interrupted after the given number of
+        # bytes in the first request
+        self.broken_files = dict(broken_files or {})
+        self.support_ranges = support_ranges
+        self.requests = []
+        super().__init__(('127.0.0.1', 0), _FileRequestHandler)
+
+    def get_url(self, name):
+        return 'http://127.0.0.1:{}/{}'.format(self.server_address[1], name)
+
+class _FileRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        name = self.path.lstrip('/')
+        range_header = self.headers.get('Range')
+        self.server.requests.append((name, range_header))
+
+        if name not in self.server.files:
+            self.send_error(404)
+            return
+
+        data = self.server.files[name]
+        start = 0
+        match = re.match(r'bytes=(\d+)-$', range_header or '')
+        if match and self.server.support_ranges:
+            start = int(match.group(1))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+
+        stop = len(data)
+        if name in self.server.broken_files:
+            stop = start + self.server.broken_files.pop(name)
+            self.close_connection = True
+        self.wfile.write(data[start:stop])
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+class DownloadDataTest(TestCase):
+    def setUp(self):
+        self.files = {
+            'image_{}.jpg'.format(i): os.urandom(1000 + i) for i in range(5)
+        }
+
+    def _run_server(self, **kwargs):
+        server = _FileServer(self.files, **kwargs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def _download(self, server, names, upload_dir):
+        with override_settings(REMOTE_FILES_BLOCK_SIZE=100,
+                REMOTE_FILES_DOWNLOAD_WORKERS=3), \
+                mock.patch.object(task, '_DOWNLOAD_RETRY_DELAY', 0), \
+                mock.patch('rq.get_current_job') as get_job:
+            job = get_job.return_value
+            job.meta = {}
+            return job, task._download_data(
+                [server.get_url(name) for name in names], upload_dir)
+
+    def _check_files(self, upload_dir):
+        for name, data in self.files.items():
+            with open(osp.join(upload_dir, name), 'rb') as f:
+                self.assertEqual(data, f.read())
+
+    def test_can_download_files(self):
+        server = self._run_server()
+
+        with TemporaryDirectory() as upload_dir:
+            job, names = self._download(server, sorted(self.files), upload_dir)
+
+            self.assertEqual(sorted(self.files), names)
+            self._check_files(upload_dir)
+            self.assertEqual({name: 100 for name in self.files},
+                job.meta['download_progress'])
+
+    def test_can_resume_broken_download(self):
+        server = self._run_server(broken_files={'image_1.jpg': 550})
+
+        with TemporaryDirectory() as upload_dir:
+            self._download(server, sorted(self.files), upload_dir)
+
+            self._check_files(upload_dir)
+            self.assertEqual([None, 'bytes=550-'], [r for name, r
+                in server.requests if name == 'image_1.jpg'])
+
+    def test_can_restart_broken_download_without_ranges(self):
+        server = self._run_server(broken_files={'image_1.jpg': 550},
+            support_ranges=False)
+
+        with TemporaryDirectory() as upload_dir:
+            self._download(server, sorted(self.files), upload_dir)
+
+            self._check_files(upload_dir)
+
+    def test_can_report_missing_file(self):
+        server = self._run_server()
+
+        with TemporaryDirectory() as upload_dir:
+            with self.assertRaisesRegex(Exception, '404'):
+                self._download(server, ['image_0.jpg', 'missing.jpg'],
+                    upload_dir)
+
+            self.assertEqual(1, len([r for r in server.requests
+                if r[0] == 'missing.jpg']))
@@ -13,7 +13,7 @@ import django_rq
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseNotFound
+from django.http import FileResponse, HttpResponseNotFound
 from django.shortcuts import render
 from django.utils import timezone
 from django.utils.decorators import method_decorator
@@ -29,6 +29,7 @@ from rest_framework.exceptions import APIException
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from sendfile import sendfile
 
 import cvat.apps.dataset_manager as dm
@@ -38,11 +39,14 @@ from cvat.apps.authentication.decorators import login_required
 from cvat.apps.dataset_manager.serializers import DatasetFormatsSerializer
 from cvat.apps.engine.frame_provider import FrameProvider
 from cvat.apps.engine.models import Job, Plugin, StatusChoice, Task
+from cvat.apps.engine.parsers import MsgPackParser
+from cvat.apps.engine.renderers import MsgPackRenderer
 from cvat.apps.engine.serializers import (
     AboutSerializer, AnnotationFileSerializer, BasicUserSerializer,
     DataMetaSerializer, DataSerializer, ExceptionSerializer,
     FileInfoSerializer, JobSerializer, LabeledDataSerializer,
-    LogEventSerializer, PluginSerializer, ProjectSerializer,
+    LabeledDataValidator, LogEventSerializer, PluginSerializer,
+    ProjectSerializer,
     RqStatusSerializer, TaskSerializer, UserSerializer)
 from cvat.settings.base import CSS_3RDPARTY, JS_3RDPARTY
 
@@ -399,6 +403,11 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
                 description="Specifies the quality level of the requested data, doesn't matter for 'preview' type"),
             openapi.Parameter('number', in_=openapi.IN_QUERY, required=True, type=openapi.TYPE_NUMBER,
                 description="A unique number value identifying chunk or frame, doesn't matter for 'preview' type"),
+            openapi.Parameter('encoding', in_=openapi.IN_QUERY, required=False, type=openapi.TYPE_STRING,
+                enum=['png', 'jpeg', 'webp', 'raw'],
+                description="Specifies the encoding of the requested frame, only for 'frame' type. "
+                    "'raw' frames are BGR pixels after a header with the height, width and "
+                    "number of channels (3 little-endian uint32 values)"),
             ]
     )
     @action(detail=True, methods=['POST', 'GET'])
@@ -422,9 +431,11 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
             data_type = request.query_params.get('type', None)
             data_id = request.query_params.get('number', None)
             data_quality = request.query_params.get('quality', 'compressed')
+            data_encoding = request.query_params.get('encoding', None)
 
             possible_data_type_values = ('chunk', 'frame', 'preview')
             possible_quality_values = ('compressed', 'original')
+            possible_encoding_values = [e.value for e in FrameProvider.Encoding]
 
             if not data_type or data_type not in possible_data_type_values:
                 return Response(data='data type not specified or has wrong value', status=status.HTTP_400_BAD_REQUEST)
@@ -433,6 +444,8 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
                     return Response(data='number not specified', status=status.HTTP_400_BAD_REQUEST)
                 elif data_quality not in possible_quality_values:
                     return Response(data='wrong quality value', status=status.HTTP_400_BAD_REQUEST)
+                elif data_encoding is not None and data_encoding not in possible_encoding_values:
+                    return Response(data='wrong encoding value', status=status.HTTP_400_BAD_REQUEST)
 
             try:
                 db_task = self.get_object()
@@ -452,9 +465,21 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
                     data_id = int(data_id)
                     data_quality = FrameProvider.Quality.COMPRESSED \
                         if data_quality == 'compressed' else FrameProvider.Quality.ORIGINAL
-                    buf, mime = frame_provider.get_frame(data_id, data_quality)
-
-                    return HttpResponse(buf.getvalue(), content_type=mime)
+                    if data_quality == FrameProvider.Quality.COMPRESSED:
+                        chunk_type = db_task.data.compressed_chunk_type
+                    else:
+                        chunk_type = db_task.data.original_chunk_type
+                    if data_encoding is not None:
+                        data_encoding = FrameProvider.Encoding(data_encoding)
+                    elif chunk_type == models.DataChoice.VIDEO:
+                        # Decoded video frames are sent to clients in
+                        # a smaller lossy format by default
+                        data_encoding = FrameProvider.Encoding(
+                            settings.FRAME_ENCODING)
+                    buf, mime = frame_provider.get_frame(data_id, data_quality,
+                        encoding=data_encoding)
+
+                    return FileResponse(buf, content_type=mime)
 
                 elif data_type == 'preview':
                     return sendfile(request, frame_provider.get_preview())
@@ -637,6 +662,12 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
             filename=request.query_params.get("filename", "").lower(),
         )
 
+# Annotations of jobs can be sent and received in the MessagePack format
+_ANNOTATION_RENDERERS = list(api_settings.DEFAULT_RENDERER_CLASSES) + \
+    [MsgPackRenderer]
+_ANNOTATION_PARSERS = list(api_settings.DEFAULT_PARSER_CLASSES) + \
+    [MsgPackParser]
+
 @method_decorator(name='retrieve', decorator=swagger_auto_schema(operation_summary='Method returns details of a job'))
 @method_decorator(name='update', decorator=swagger_auto_schema(operation_summary='Method updates a job by id'))
 @method_decorator(name='partial_update', decorator=swagger_auto_schema(
@@ -659,7 +690,50 @@ class JobViewSet(viewsets.GenericViewSet,
 
         return [perm() for perm in permissions]
 
-    @swagger_auto_schema(method='get', operation_summary='Method returns annotations for a specific job')
+    @staticmethod
+    def _validate_annotations(request):
+        media_type = (request.content_type or '').split(';')[0].strip()
+        if media_type == MsgPackParser.media_type:
+            # Binary payloads have typed values, so they are checked
+            # without a serializer per field, which is slow for big jobs
+            return LabeledDataValidator().validate(request.data)
+
+        serializer = LabeledDataSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.data
+
+    @staticmethod
+    def _get_number_param(request, param):
+        value = request.query_params.get(param, None)
+        if value is not None:
+            try:
+                value = int(value)
+            except ValueError:
+                value = -1
+            if value < 0:
+                raise serializers.ValidationError(
+                    "'{}' must be a non-negative integer".format(param))
+        return value
+
+    @classmethod
+    def _get_frame_range(cls, request):
+        start_frame = cls._get_number_param(request, 'start_frame')
+        stop_frame = cls._get_number_param(request, 'stop_frame')
+        if start_frame is not None and stop_frame is not None and \
+                stop_frame < start_frame:
+            raise serializers.ValidationError(
+                "'stop_frame' must not be less than 'start_frame'")
+        return start_frame, stop_frame
+
+    @swagger_auto_schema(method='get', manual_parameters=[
+        openapi.Parameter('start_frame', in_=openapi.IN_QUERY, type=openapi.TYPE_NUMBER, required=False,
+            description="The first frame of annotations to return"),
+        openapi.Parameter('stop_frame', in_=openapi.IN_QUERY, type=openapi.TYPE_NUMBER, required=False,
+            description="The last frame of annotations to return. Tracks are returned if they are visible in the range"),
+        openapi.Parameter('since_version', in_=openapi.IN_QUERY, type=openapi.TYPE_NUMBER, required=False,
+            description="Return only annotations changed after the version and ids of deleted annotations in 'deleted'. "
+                "If the changes are unknown, all annotations are returned and 'deleted' is null")],
+        operation_summary='Method returns annotations for a specific job')
     @swagger_auto_schema(method='put', operation_summary='Method performs an update of all annotations in a specific job')
     @swagger_auto_schema(method='patch', manual_parameters=[
         openapi.Parameter('action', in_=openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
@@ -667,11 +741,21 @@ class JobViewSet(viewsets.GenericViewSet,
             operation_summary='Method performs a partial update of annotations in a specific job')
     @swagger_auto_schema(method='delete', operation_summary='Method deletes all annotations for a specific job')
     @action(detail=True, methods=['GET', 'DELETE', 'PUT', 'PATCH'],
-        serializer_class=LabeledDataSerializer)
+        serializer_class=LabeledDataSerializer,
+        renderer_classes=_ANNOTATION_RENDERERS,
+        parser_classes=_ANNOTATION_PARSERS)
     def annotations(self, request, pk):
         self.get_object() # force to call check_object_permissions
         if request.method == 'GET':
-            data = dm.task.get_job_data(pk)
+            since_version = self._get_number_param(request, 'since_version')
+            start_frame, stop_frame = self._get_frame_range(request)
+            if since_version is not None:
+                if start_frame is not None or stop_frame is not None:
+                    raise serializers.ValidationError(
+                        "'since_version' can't be used with a frame range")
+                data = dm.task.get_job_changes(pk, since_version)
+            else:
+                data = dm.task.get_job_data(pk, start_frame, stop_frame)
             return Response(data)
         elif request.method == 'PUT':
             format_name = request.query_params.get("format", "")
@@ -684,13 +768,12 @@ class JobViewSet(viewsets.GenericViewSet,
                     format_name=format_name
                 )
             else:
-                serializer = LabeledDataSerializer(data=request.data)
-                if serializer.is_valid(raise_exception=True):
-                    try:
-                        data = dm.task.put_job_data(pk, serializer.data)
-                    except (AttributeError, IntegrityError) as e:
-                        return Response(data=str(e), status=status.HTTP_400_BAD_REQUEST)
-                    return Response(data)
+                data = self._validate_annotations(request)
+                try:
+                    data = dm.task.put_job_data(pk, data)
+                except (AttributeError, IntegrityError) as e:
+                    return Response(data=str(e), status=status.HTTP_400_BAD_REQUEST)
+                return Response(data)
         elif request.method == 'DELETE':
             dm.task.delete_job_data(pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -699,13 +782,12 @@ class JobViewSet(viewsets.GenericViewSet,
             if action not in dm.task.PatchAction.values():
                 raise serializers.ValidationError(
                     "Please specify a correct 'action' for the request")
-            serializer = LabeledDataSerializer(data=request.data)
-            if serializer.is_valid(raise_exception=True):
-                try:
-                    data = dm.task.patch_job_data(pk, serializer.data, action)
-                except (AttributeError, IntegrityError) as e:
-                    return Response(data=str(e), status=status.HTTP_400_BAD_REQUEST)
-                return Response(data)
+            data = self._validate_annotations(request)
+            try:
+                data = dm.task.patch_job_data(pk, data, action)
+            except (AttributeError, IntegrityError) as e:
+                return Response(data=str(e), status=status.HTTP_400_BAD_REQUEST)
+            return Response(data)
 
 @method_decorator(name='list', decorator=swagger_auto_schema(
     operation_summary='Method provides a paginated list of users registered on the server'))
@@ -405,6 +405,47 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS = None   # this django check disabled
 LOCAL_LOAD_MAX_FILES_COUNT = 500
 LOCAL_LOAD_MAX_FILES_SIZE = 512 * 1024 * 1024  # 512 MB
 
+# Number of parallel workers which encode chunks during task creation
+# (1 means that chunks are encoded one by one in the rq worker process)
+CHUNK_ENCODING_WORKERS = int(os.getenv('CHUNK_ENCODING_WORKERS',
+    min(4, os.cpu_count() or 1)))
+
+# How server files are put into the upload directory of a task:
+# 'copy' - files are copied,
+# 'link' - hard links or reflinks, files are copied if it is impossible
+#   (a hard linked file is shared, in-place changes affect both sides),
+# 'symlink' - symbolic links, files are read from the share directly
+SHARE_INGESTION_MODE = os.getenv('SHARE_INGESTION_MODE', 'copy')
+
+# Number of parallel downloads of remote files during task creation, the
+# size of blocks they are read by and the number of retries of a failed
+# download (a broken download is resumed with a range request)
+REMOTE_FILES_DOWNLOAD_WORKERS = int(os.getenv('REMOTE_FILES_DOWNLOAD_WORKERS', 4))
+REMOTE_FILES_BLOCK_SIZE = int(os.getenv('REMOTE_FILES_BLOCK_SIZE',
+    1024 * 1024)) # 1 MB
+REMOTE_FILES_DOWNLOAD_RETRIES = int(os.getenv('REMOTE_FILES_DOWNLOAD_RETRIES', 3))
+
+# Maximum total size of chunk files which readers are kept open by
+# FrameProvider in each server process (0 disables the cache)
+FRAME_PROVIDER_CACHE_SIZE = int(os.getenv('FRAME_PROVIDER_CACHE_SIZE',
+    128 * 1024 * 1024))  # 128 MB
+
+# Maximum total size of compressed chunks which are created on demand for
+# tasks with the 'cache' storage method (0 means no limit)
+COMPRESSED_CHUNK_CACHE_SIZE = int(os.getenv('COMPRESSED_CHUNK_CACHE_SIZE',
+    10 * 1024 * 1024 * 1024)) # 10 GB
+
+# Default encoding of decoded video frames returned by the data endpoint
+# (png, jpeg, webp or raw) and the quality of jpeg and webp images.
+# Frames are lossless by default, jpeg and webp are faster but lossy.
+FRAME_ENCODING = os.getenv('FRAME_ENCODING', 'png')
+FRAME_ENCODING_QUALITY = int(os.getenv('FRAME_ENCODING_QUALITY', 95))
+
+# Keep task annotations in NumPy columns during export. It reduces memory
+# usage on big tasks, but point coordinates are stored as float32.
+EXPORT_COLUMNAR_ANNOTATIONS = \
+    'yes' == os.environ.get('EXPORT_COLUMNAR_ANNOTATIONS', 'no')
+
 DATUMARO_PATH = os.path.join(BASE_DIR, 'datumaro')
 sys.path.append(DATUMARO_PATH)
 
@@ -49,6 +49,7 @@ class DiffVisualizer:
 
         self.label_confusion_matrix = Counter()
         self.bbox_confusion_matrix = Counter()
+        self.polygon_confusion_matrix = Counter()
 
     def save_dataset_diff(self, extractor_a, extractor_b):
         if self.save_dir:
@@ -79,6 +80,7 @@ class DiffVisualizer:
 
         self.label_confusion_matrix = Counter()
         self.bbox_confusion_matrix = Counter()
+        self.polygon_confusion_matrix = Counter()
 
         if self.output_format is Format.tensorboard:
             self.file_writer.reopen()
@@ -95,6 +97,11 @@ class DiffVisualizer:
             bbox_diff = self.comparator.compare_item_bboxes(item_a, item_b)
             self.update_bbox_confusion(bbox_diff)
 
+            polygon_diff = self.comparator.compare_item_polygons(
+                item_a, item_b)
+            self.update_shape_confusion(self.polygon_confusion_matrix,
+                polygon_diff)
+
             self.save_item_label_diff(item_a, item_b, label_diff)
             self.save_item_bbox_diff(item_a, item_b, bbox_diff)
 
@@ -104,6 +111,9 @@ class DiffVisualizer:
         if len(self.bbox_confusion_matrix) != 0:
             self.save_conf_matrix(self.bbox_confusion_matrix,
                 'bbox_confusion.png')
+        if len(self.polygon_confusion_matrix) != 0:
+            self.save_conf_matrix(self.polygon_confusion_matrix,
+                'polygon_confusion.png')
 
         if self.output_format is Format.tensorboard:
             self.file_writer.flush()
@@ -122,16 +132,19 @@ class DiffVisualizer:
         for b_label in b_unmatched:
             self.label_confusion_matrix[(self._UNMATCHED_LABEL, b_label)] += 1
 
+    def update_shape_confusion(self, confusion_matrix, shape_diff):
+        matches, mispred, a_unmatched, b_unmatched = shape_diff
+        for a_shape, b_shape in matches:
+            confusion_matrix[(a_shape.label, b_shape.label)] += 1
+        for a_shape, b_shape in mispred:
+            confusion_matrix[(a_shape.label, b_shape.label)] += 1
+        for a_shape in a_unmatched:
+            confusion_matrix[(a_shape.label, self._UNMATCHED_LABEL)] += 1
+        for b_shape in b_unmatched:
+            confusion_matrix[(self._UNMATCHED_LABEL, b_shape.label)] += 1
+
     def update_bbox_confusion(self, bbox_diff):
-        matches, mispred, a_unmatched, b_unmatched = bbox_diff
-        for a_bbox, b_bbox in matches:
-            self.bbox_confusion_matrix[(a_bbox.label, b_bbox.label)] += 1
-        for a_bbox, b_bbox in mispred:
-            self.bbox_confusion_matrix[(a_bbox.label, b_bbox.label)] += 1
-        for a_bbox in a_unmatched:
-            self.bbox_confusion_matrix[(a_bbox.label, self._UNMATCHED_LABEL)] += 1
-        for b_bbox in b_unmatched:
-            self.bbox_confusion_matrix[(self._UNMATCHED_LABEL, b_bbox.label)] += 1
+        self.update_shape_confusion(self.bbox_confusion_matrix, bbox_diff)
 
     @classmethod
     def draw_text_with_background(cls, frame, text, origin,
@@ -9,6 +9,7 @@ import numpy as np
 from math import ceil
 
 from datumaro.components.extractor import AnnotationType
+from datumaro.util.iou_tools import bbox_iou_matrix
 
 
 def flatmatvec(mat):
@@ -54,7 +55,8 @@ class RISE:
     @staticmethod
     def nms(boxes, iou_thresh=0.5):
         indices = np.argsort([b.attributes['score'] for b in boxes])
-        ious = np.array([[a.iou(b) for b in boxes] for a in boxes])
+        ious = bbox_iou_matrix([b.get_bbox() for b in boxes],
+            [b.get_bbox() for b in boxes])
 
         predictions = []
         while len(indices) != 0:
@@ -196,20 +198,17 @@ class RISE:
                     if 0 < self.nms_thresh:
                         result_bboxes = self.nms(result_bboxes, self.nms_thresh)
 
-                    for detection in result_bboxes:
-                        for pred_idx, pred in enumerate(predicted_bboxes):
-                            if pred.label != detection.label:
-                                continue
-
-                            iou = pred.iou(detection)
-                            assert 0 <= iou and iou <= 1
-                            if iou < iou_thresh:
-                                continue
-
-                            bbox_total_counts[pred_idx] += 1
-
-                            conf = detection.attributes['score']
-                            bbox_confs[pred_idx] += conf
+                    # Count detections matched with each predicted bbox
+                    ious = bbox_iou_matrix(
+                        [d.get_bbox() for d in result_bboxes],
+                        [p.get_bbox() for p in predicted_bboxes])
+                    matched = (iou_thresh <= ious) & np.equal.outer(
+                        [d.label for d in result_bboxes],
+                        [p.label for p in predicted_bboxes])
+                    bbox_total_counts += np.sum(matched, axis=0)
+                    bbox_confs += np.dot(
+                        [d.attributes['score'] for d in result_bboxes],
+                        matched)
 
                 np.multiply.outer(confs, mask, out=current_heatmaps)
                 heatmaps += current_heatmaps
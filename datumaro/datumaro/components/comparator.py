@@ -7,6 +7,7 @@ from itertools import zip_longest
 import numpy as np
 
 from datumaro.components.extractor import AnnotationType, LabelCategories
+from datumaro.util.iou_tools import bbox_iou_matrix, polygon_iou_matrix
 
 
 class Comparator:
@@ -53,40 +54,35 @@ class Comparator:
 
         return matches, a_unmatched, b_unmatched
 
-    def compare_item_bboxes(self, item_a, item_b):
-        iou_threshold = self.iou_threshold
+    def _get_shapes(self, item, ann_type):
         conf_threshold = self.conf_threshold
 
-        a_boxes = [ann for ann in item_a.annotations \
-            if ann.type is AnnotationType.bbox and \
-               conf_threshold < ann.attributes.get('score', 1)]
-        b_boxes = [ann for ann in item_b.annotations \
-            if ann.type is AnnotationType.bbox and \
+        shapes = [ann for ann in item.annotations \
+            if ann.type is ann_type and \
                conf_threshold < ann.attributes.get('score', 1)]
-        a_boxes.sort(key=lambda ann: 1 - ann.attributes.get('score', 1))
-        b_boxes.sort(key=lambda ann: 1 - ann.attributes.get('score', 1))
+        shapes.sort(key=lambda ann: 1 - ann.attributes.get('score', 1))
+        return shapes
 
-        # a_matches: indices of b_boxes matched to a bboxes
-        # b_matches: indices of a_boxes matched to b bboxes
-        a_matches = -np.ones(len(a_boxes), dtype=int)
-        b_matches = -np.ones(len(b_boxes), dtype=int)
+    def _match_shapes(self, a_shapes, b_shapes, iou_matrix):
+        iou_threshold = self.iou_threshold
 
-        iou_matrix = np.array([
-            [self.iou(a, b) for b in b_boxes] for a in a_boxes
-        ])
+        # a_matches: indices of b_shapes matched to a shapes
+        # b_matches: indices of a_shapes matched to b shapes
+        a_matches = -np.ones(len(a_shapes), dtype=int)
+        b_matches = -np.ones(len(b_shapes), dtype=int)
 
-        # matches: boxes we succeeded to match completely
-        # mispred: boxes we succeeded to match, having label mismatch
+        # matches: shapes we succeeded to match completely
+        # mispred: shapes we succeeded to match, having label mismatch
         matches = []
         mispred = []
 
-        for a_idx, a_bbox in enumerate(a_boxes):
-            if len(b_boxes) == 0:
+        for a_idx, a_shape in enumerate(a_shapes):
+            if len(b_shapes) == 0:
                 break
             matched_b = a_matches[a_idx]
             iou_max = max(iou_matrix[a_idx, matched_b], iou_threshold)
-            for b_idx, b_bbox in enumerate(b_boxes):
-                if 0 <= b_matches[b_idx]: # assign a_bbox with max conf
+            for b_idx, b_shape in enumerate(b_shapes):
+                if 0 <= b_matches[b_idx]: # assign a_shape with max conf
                     continue
                 iou = iou_matrix[a_idx, b_idx]
                 if iou < iou_max:
@@ -99,15 +95,29 @@ class Comparator:
             a_matches[a_idx] = matched_b
             b_matches[matched_b] = a_idx
 
-            b_bbox = b_boxes[matched_b]
+            b_shape = b_shapes[matched_b]
 
-            if a_bbox.label == b_bbox.label:
-                matches.append( (a_bbox, b_bbox) )
+            if a_shape.label == b_shape.label:
+                matches.append( (a_shape, b_shape) )
             else:
-                mispred.append( (a_bbox, b_bbox) )
+                mispred.append( (a_shape, b_shape) )
 
-        # *_umatched: boxes of (*) we failed to match
-        a_unmatched = [a_boxes[i] for i, m in enumerate(a_matches) if m < 0]
-        b_unmatched = [b_boxes[i] for i, m in enumerate(b_matches) if m < 0]
+        # *_umatched: shapes of (*) we failed to match
+        a_unmatched = [a_shapes[i] for i, m in enumerate(a_matches) if m < 0]
+        b_unmatched = [b_shapes[i] for i, m in enumerate(b_matches) if m < 0]
 
         return matches, mispred, a_unmatched, b_unmatched
+
+    def compare_item_bboxes(self, item_a, item_b):
+        a_boxes = self._get_shapes(item_a, AnnotationType.bbox)
+        b_boxes = self._get_shapes(item_b, AnnotationType.bbox)
+        iou_matrix = bbox_iou_matrix(
+            [a.get_bbox() for a in a_boxes], [b.get_bbox() for b in b_boxes])
+        return self._match_shapes(a_boxes, b_boxes, iou_matrix)
+
+    def compare_item_polygons(self, item_a, item_b):
+        a_polygons = self._get_shapes(item_a, AnnotationType.polygon)
+        b_polygons = self._get_shapes(item_b, AnnotationType.polygon)
+        iou_matrix = polygon_iou_matrix(
+            [a.points for a in a_polygons], [b.points for b in b_polygons])
+        return self._match_shapes(a_polygons, b_polygons, iou_matrix)
@@ -8,6 +8,7 @@ from enum import Enum
 import numpy as np
 
 from datumaro.util.image import Image
+from datumaro.util.iou_tools import bbox_iou
 
 AnnotationType = Enum('AnnotationType',
     [
@@ -327,21 +328,17 @@ class CompiledMask:
         return lambda: self.extract(instance_id)
 
 def compute_iou(bbox_a, bbox_b):
+    """
+    Kept for compatibility. Unlike bbox_iou, the intersection is divided
+    by max(1, union), so boxes with the union area below 1 get lower IoU.
+    """
+
     aX, aY, aW, aH = bbox_a
     bX, bY, bW, bH = bbox_b
-    in_right = min(aX + aW, bX + bW)
-    in_left = max(aX, bX)
-    in_top = max(aY, bY)
-    in_bottom = min(aY + aH, bY + bH)
-
-    in_w = max(0, in_right - in_left)
-    in_h = max(0, in_bottom - in_top)
+    in_w = max(0, min(aX + aW, bX + bW) - max(aX, bX))
+    in_h = max(0, min(aY + aH, bY + bH) - max(aY, bY))
     intersection = in_w * in_h
-
-    a_area = aW * aH
-    b_area = bW * bH
-    union = a_area + b_area - intersection
-
+    union = aW * aH + bW * bH - intersection
     return intersection / max(1.0, union)
 
 class _Shape(Annotation):
@@ -476,7 +473,7 @@ class Bbox(_Shape):
         ]
 
     def iou(self, other):
-        return compute_iou(self.get_bbox(), other.get_bbox())
+        return bbox_iou(self.get_bbox(), other.get_bbox())
 
 class PointsCategories(Categories):
     Category = namedtuple('Category', ['labels', 'joints'])
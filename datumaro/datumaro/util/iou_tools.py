@@ -0,0 +1,106 @@
+
+# Copyright (C) 2020 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+
+
+def bbox_iou(bbox_a, bbox_b):
+    """
+    Computes IoU of two boxes in [x, y, w, h] format
+    """
+
+    aX, aY, aW, aH = bbox_a
+    bX, bY, bW, bH = bbox_b
+    in_right = min(aX + aW, bX + bW)
+    in_left = max(aX, bX)
+    in_top = max(aY, bY)
+    in_bottom = min(aY + aH, bY + bH)
+
+    in_w = max(0, in_right - in_left)
+    in_h = max(0, in_bottom - in_top)
+    intersection = in_w * in_h
+
+    a_area = aW * aH
+    b_area = bW * bH
+    union = a_area + b_area - intersection
+
+    if union <= 0:
+        return 0
+    return intersection / union
+
+def _to_bbox_array(bboxes):
+    return np.asarray(bboxes, dtype=float).reshape(-1, 4)
+
+def _divide_areas(intersection, union):
+    iou = np.zeros(np.broadcast(intersection, union).shape)
+    np.divide(intersection, union, out=iou, where=0 < union)
+    return iou
+
+def bbox_iou_matrix(bboxes_a, bboxes_b):
+    """
+    Computes IoU for all pairs of boxes in [x, y, w, h] format.
+    Returns a matrix of shape (len(bboxes_a), len(bboxes_b)).
+    """
+
+    a = _to_bbox_array(bboxes_a)[:, np.newaxis]
+    b = _to_bbox_array(bboxes_b)[np.newaxis]
+
+    in_w = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - \
+        np.maximum(a[..., 0], b[..., 0])
+    in_h = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - \
+        np.maximum(a[..., 1], b[..., 1])
+    intersection = np.clip(in_w, 0, None) * np.clip(in_h, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - intersection
+
+    return _divide_areas(intersection, union)
+
+def bbox_iou_pairs(bboxes_a, bboxes_b):
+    """
+    Computes IoU for pairs of boxes with the same indices
+    in [x, y, w, h] format. Returns an array of len(bboxes_a) elements.
+    """
+
+    a = _to_bbox_array(bboxes_a)
+    b = _to_bbox_array(bboxes_b)
+    assert len(a) == len(b)
+
+    in_w = np.minimum(a[:, 0] + a[:, 2], b[:, 0] + b[:, 2]) - \
+        np.maximum(a[:, 0], b[:, 0])
+    in_h = np.minimum(a[:, 1] + a[:, 3], b[:, 1] + b[:, 3]) - \
+        np.maximum(a[:, 1], b[:, 1])
+    intersection = np.clip(in_w, 0, None) * np.clip(in_h, 0, None)
+    union = a[:, 2] * a[:, 3] + b[:, 2] * b[:, 3] - intersection
+
+    return _divide_areas(intersection, union)
+
+def polygon_iou_matrix(polygons_a, polygons_b):
+    """
+    Computes IoU for all pairs of polygons, which are given as flat lists
+    of point coordinates. Polygons are rasterized into RLE masks, so
+    the result is approximate for polygons of a few pixels.
+    Returns a matrix of shape (len(polygons_a), len(polygons_b)).
+    """
+
+    import pycocotools.mask as mask_utils
+
+    if not len(polygons_a) or not len(polygons_b):
+        return np.zeros((len(polygons_a), len(polygons_b)))
+
+    # Masks include all the polygons, points are moved to non-negative
+    # coordinates, because rasterization clips polygons by the mask size
+    polygons = [np.asarray(p, dtype=float) for p in polygons_a + polygons_b]
+    min_x = min(0, min(np.min(p[0::2]) for p in polygons))
+    min_y = min(0, min(np.min(p[1::2]) for p in polygons))
+    width = int(np.ceil(max(np.max(p[0::2]) for p in polygons) - min_x)) + 1
+    height = int(np.ceil(max(np.max(p[1::2]) for p in polygons) - min_y)) + 1
+    for p in polygons:
+        p[0::2] -= min_x
+        p[1::2] -= min_y
+
+    rles = mask_utils.frPyObjects([p.tolist() for p in polygons],
+        height, width)
+    return np.array(mask_utils.iou(rles[:len(polygons_a)],
+        rles[len(polygons_a):], [0] * len(polygons_b)), dtype=float) \
+        .reshape(len(polygons_a), len(polygons_b))
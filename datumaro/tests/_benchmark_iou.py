@@ -0,0 +1,52 @@
+# Benchmarks are not run by default. Use the following command to run them:
+# python -m unittest discover -s tests -p "_benchmark*.py"
+
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from datumaro.util.iou_tools import bbox_iou, bbox_iou_matrix, bbox_iou_pairs
+
+
+class IouBenchmark(TestCase):
+    @staticmethod
+    def _generate_bboxes(count, rng):
+        return np.hstack([rng.uniform(0, 1000, (count, 2)),
+            rng.uniform(5, 50, (count, 2))])
+
+    @staticmethod
+    def _measure(func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        return time.perf_counter() - start, result
+
+    def test_all_pairs(self):
+        rng = np.random.RandomState(0)
+        for count in [10, 100, 1000]:
+            a = self._generate_bboxes(count, rng)
+            b = self._generate_bboxes(count, rng)
+
+            loop_time, expected = self._measure(lambda: [
+                [bbox_iou(bbox_a, bbox_b) for bbox_b in b] for bbox_a in a])
+            matrix_time, actual = self._measure(bbox_iou_matrix, a, b)
+
+            print("\nIoU of all pairs of {} boxes: "
+                "loop {:.4f}s, matrix {:.4f}s (x{:.1f})".format(count,
+                loop_time, matrix_time, loop_time / matrix_time))
+            np.testing.assert_allclose(expected, actual)
+
+    def test_pairs(self):
+        rng = np.random.RandomState(0)
+        for count in [10, 100, 1000]:
+            a = self._generate_bboxes(count, rng)
+            b = a + rng.uniform(-10, 10, a.shape)
+
+            loop_time, expected = self._measure(lambda: [
+                bbox_iou(bbox_a, bbox_b) for bbox_a, bbox_b in zip(a, b)])
+            pairs_time, actual = self._measure(bbox_iou_pairs, a, b)
+
+            print("\nIoU of {} pairs of boxes: "
+                "loop {:.4f}s, vectorized {:.4f}s (x{:.1f})".format(count,
+                loop_time, pairs_time, loop_time / pairs_time))
+            np.testing.assert_allclose(expected, actual)
@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from datumaro.components.extractor import DatasetItem, Label, Bbox
+from datumaro.components.extractor import DatasetItem, Label, Bbox, Polygon
 from datumaro.components.comparator import Comparator
 
 
@@ -99,6 +99,31 @@ class DiffTest(TestCase):
             len(b_greater))
         self.assertEqual(0, len(matches))
 
+    def test_can_find_polygon_diff(self):
+        square = [0, 0, 10, 0, 10, 10, 0, 10]
+        item1 = DatasetItem(id=1, annotations=[
+            Polygon(square, label=0),
+            Polygon([p + 20 for p in square], label=1),
+            Polygon([p + 40 for p in square], label=0),
+        ])
+        item2 = DatasetItem(id=1, annotations=[
+            Polygon([p + 1 for p in square], label=0),
+            Polygon([p + 20 for p in square], label=0),
+            Polygon([p + 60 for p in square], label=0),
+        ])
+
+        comp = Comparator(iou_threshold=0.5)
+
+        matches, mispred, a_greater, b_greater = \
+            comp.compare_item_polygons(item1, item2)
+
+        self.assertEqual([(item1.annotations[0], item2.annotations[0])],
+            matches)
+        self.assertEqual([(item1.annotations[1], item2.annotations[1])],
+            mispred)
+        self.assertEqual([item1.annotations[2]], a_greater)
+        self.assertEqual([item2.annotations[2]], b_greater)
+
     def test_no_label_diff_with_same_item(self):
         detections = 3
         anns = [
@@ -0,0 +1,68 @@
+import numpy as np
+
+from unittest import TestCase
+
+from datumaro.components.extractor import compute_iou
+from datumaro.util.iou_tools import (bbox_iou, bbox_iou_matrix,
+    bbox_iou_pairs, polygon_iou_matrix)
+
+
+class IouTest(TestCase):
+    def test_bbox_iou(self):
+        self.assertAlmostEqual(1.0, bbox_iou([0, 0, 10, 10], [0, 0, 10, 10]))
+        self.assertAlmostEqual(1 / 7,
+            bbox_iou([0, 0, 10, 10], [5, 5, 10, 10]))
+        self.assertEqual(0, bbox_iou([0, 0, 10, 10], [20, 20, 5, 5]))
+        self.assertEqual(0, bbox_iou([0, 0, 0, 0], [0, 0, 0, 0]))
+
+    def test_bbox_iou_matrix_matches_scalar_version(self):
+        rng = np.random.RandomState(0)
+        a = np.hstack([rng.uniform(0, 50, (7, 2)), rng.uniform(0, 20, (7, 2))])
+        b = np.hstack([rng.uniform(0, 50, (5, 2)), rng.uniform(0, 20, (5, 2))])
+
+        matrix = bbox_iou_matrix(a, b)
+
+        self.assertEqual((7, 5), matrix.shape)
+        for i, bbox_a in enumerate(a):
+            for j, bbox_b in enumerate(b):
+                self.assertAlmostEqual(bbox_iou(bbox_a, bbox_b), matrix[i, j])
+
+    def test_bbox_iou_matrix_with_empty_input(self):
+        self.assertEqual((0, 2),
+            bbox_iou_matrix([], [[0, 0, 1, 1], [1, 1, 1, 1]]).shape)
+
+    def test_bbox_iou_pairs(self):
+        a = [[0, 0, 10, 10], [0, 0, 10, 10], [0, 0, 0, 0]]
+        b = [[0, 0, 10, 10], [5, 5, 10, 10], [0, 0, 0, 0]]
+
+        np.testing.assert_allclose([1, 1 / 7, 0], bbox_iou_pairs(a, b))
+
+    def test_bbox_iou_of_small_boxes(self):
+        a = [0, 0, 0.5, 0.5]
+        b = [0.25, 0, 0.5, 0.5]
+
+        self.assertAlmostEqual(1.0, bbox_iou(a, a))
+        self.assertAlmostEqual(1 / 3, bbox_iou(a, b))
+        self.assertAlmostEqual(1.0, bbox_iou_matrix([a], [a])[0, 0])
+
+        # compute_iou keeps the old division by max(1, union)
+        self.assertAlmostEqual(0.25, compute_iou(a, a))
+        self.assertAlmostEqual(0.125, compute_iou(a, b))
+        self.assertAlmostEqual(1 / 7,
+            compute_iou([0, 0, 10, 10], [5, 5, 10, 10]))
+
+    def test_polygon_iou_matrix(self):
+        square = [0, 0, 10, 0, 10, 10, 0, 10]
+        shifted = [p + 5 for p in square]
+        far = [p + 30 for p in square]
+        negative = [p - 5 for p in square]
+
+        matrix = polygon_iou_matrix([square, shifted], [square, far, negative])
+
+        self.assertEqual((2, 3), matrix.shape)
+        self.assertAlmostEqual(1.0, matrix[0, 0])
+        self.assertEqual(0, matrix[0, 1])
+        self.assertAlmostEqual(1 / 7, matrix[0, 2], delta=0.05)
+        self.assertAlmostEqual(1 / 7, matrix[1, 0], delta=0.05)
+        self.assertEqual(0, matrix[1, 1])
+        self.assertEqual((0, 1), polygon_iou_matrix([], [square]).shape)